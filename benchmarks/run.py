@@ -0,0 +1,376 @@
+""" Benchmarks of pyxnat against the local XNAT stand-in server.
+
+Usage
+-----
+    python benchmarks/run.py                   # compare to the baseline
+    python benchmarks/run.py --save            # record a new baseline
+    python benchmarks/run.py -k cache -k csv   # run some benchmarks only
+
+Each benchmark is run `--repeat` times and its best time is kept. Times
+are divided by the time of a pure python calibration loop, so that a
+baseline recorded on another machine remains roughly comparable. A
+benchmark slower than the baseline by more than `--tolerance` is a
+regression and makes the script exit with status 1, as does a
+benchmark missing from the baseline: record it with --save.
+"""
+from __future__ import with_statement
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import optparse
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from pyxnat import Interface
+from pyxnat.core.cache import HTCache
+from pyxnat.core.jsonutil import csv_to_json, csv_to_columns, JsonTable, \
+    ColumnTable
+from pyxnat.core.select import compute
+from pyxnat.tests.server import XnatStandIn
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+benchmarks = OrderedDict()
+
+
+def benchmark(func):
+    """ Registers a benchmark. The function does the setup and returns
+        the callable to time.
+    """
+    benchmarks[func.__name__[len('bench_'):]] = func
+    return func
+
+
+class _Workspace(object):
+    """ Temporary directories of a benchmark, removed by `close`.
+    """
+    def __init__(self):
+        self.dirs = []
+
+    def mkdtemp(self):
+        self.dirs.append(tempfile.mkdtemp(prefix='pyxnat_bench'))
+        return self.dirs[-1]
+
+    def interface(self, server, **attrs):
+        interface = Interface(server.url, 'admin', 'admin',
+                              cachedir=self.mkdtemp())
+
+        for key, value in attrs.items():
+            setattr(interface, key, value)
+
+        return interface
+
+    def close(self):
+        for path in self.dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _listing(rows):
+    lines = ['ID,project,label,date,xsiType,insert_date,age,URI']
+
+    for i in range(rows):
+        lines.append('XNAT_E%05d,P%s,S%s_E%s,2020-01-%02d,'
+                     'xnat:mrSessionData,2020-01-01 00:00:00,%s,'
+                     '/data/experiments/XNAT_E%05d' % (
+                         i, i % 10, i, i % 3, i % 28 + 1, 20 + i % 60, i))
+
+    return '\n'.join(lines) + '\n'
+
+
+@benchmark
+def bench_csv_to_json(workspace):
+    content = _listing(20000)
+
+    return lambda: csv_to_json(content)
+
+
+@benchmark
+def bench_jsontable(workspace):
+    table = JsonTable(csv_to_json(_listing(20000)))
+
+    def run():
+        table.where(project='P1')
+        table.where_not(project='P1')
+        table.select(['ID', 'label'])
+        table.get('ID')
+        table.dumps_csv()
+
+    return run
+
+
+@benchmark
+def bench_columntable(workspace):
+    table = ColumnTable.from_columns(*csv_to_columns(_listing(20000)))
+
+    def run():
+        table.where(project='P1')
+        table.where_not(project='P1')
+        table.select(['ID', 'label'])
+        table.get('ID')
+        table.dumps_csv()
+
+    return run
+
+
+@benchmark
+def bench_export(workspace):
+    table = ColumnTable.from_columns(*csv_to_columns(_listing(20000)))
+
+    return lambda: table.to_numpy(infer_types=True)
+
+
+@benchmark
+def bench_select_compile(workspace):
+    paths = ['/projects/*/subjects/*/experiments/*/scans/*/resources/*'
+             '/files/*',
+             '//experiments/*/assessors/*/out_resources/*/files',
+             '/projects/P0/subjects//files',
+             '/project/P0/subject/S0/experiment/E0/scans',
+             ]
+
+    def run():
+        for _ in range(50):
+            for path in paths:
+                compute(path)
+
+    return run
+
+
+@benchmark
+def bench_cobject_iteration(workspace):
+    server = XnatStandIn(projects=2, subjects=20, experiments=2, scans=3,
+                         files=0, latency=0.01).start()
+    workspace.close_server = server.stop
+
+    path = '/projects/*/subjects/*/experiments/*/scans/*'
+
+    return lambda: list(workspace.interface(server).select(path))
+
+
+@benchmark
+def bench_cobject_prefetch(workspace):
+    server = XnatStandIn(projects=2, subjects=20, experiments=2, scans=3,
+                         files=0, latency=0.01).start()
+    workspace.close_server = server.stop
+
+    path = '/projects/*/subjects/*/experiments/*/scans/*'
+
+    def run():
+        interface = workspace.interface(server)
+        interface.set_prefetch(8)
+
+        return list(interface.select(path))
+
+    return run
+
+
+@benchmark
+def bench_htcache(workspace):
+    interface = Interface('http://localhost', 'admin', 'admin',
+                          cachedir=workspace.mkdtemp())
+    header = 'status: 200\r\ncontent-type: text/csv\r\n\r\n'
+    content = _listing(40)
+
+    def run():
+        cache = HTCache(workspace.mkdtemp(), interface)
+        uris = ['http://localhost/data/projects/P%s/subjects?format=csv'
+                % i for i in range(500)]
+
+        for uri in uris:
+            cache.set(uri, header + content)
+        for uri in uris:
+            cache.get(uri)
+        for uri in uris:
+            cache.delete(uri)
+
+    return run
+
+
+@benchmark
+def bench_download(workspace):
+    server = XnatStandIn(projects=1, subjects=1, experiments=1, scans=4,
+                         files=4, file_size=1024 ** 2).start()
+    workspace.close_server = server.stop
+
+    def run():
+        interface = workspace.interface(server)
+
+        for f in interface.select('/projects/*/subjects/*/experiments/*'
+                                  '/scans/*/resources/*/files/*'):
+            f.get()
+
+    return run
+
+
+@benchmark
+def bench_download_zip(workspace):
+    server = XnatStandIn(projects=1, subjects=1, experiments=1, scans=1,
+                         files=16, file_size=1024 ** 2).start()
+    workspace.close_server = server.stop
+
+    # times the download only, Resource.get then reorganises the archive
+    def run():
+        interface = workspace.interface(server)
+
+        for resource in interface.select('/projects/*/subjects/*'
+                                         '/experiments/*/scans/*/resources'):
+            interface._get_file(resource._uri + '/files?format=zip',
+                                os.path.join(workspace.mkdtemp(), 'r.zip'))
+
+    return run
+
+
+@benchmark
+def bench_upload(workspace):
+    server = XnatStandIn(projects=1, subjects=1, experiments=0).start()
+    workspace.close_server = server.stop
+
+    src = os.path.join(workspace.mkdtemp(), 'upload.dat')
+    with open(src, 'wb') as f:
+        f.write(os.urandom(16 * 1024 ** 2))
+
+    interface = workspace.interface(server)
+    resource = interface.select('/projects/P0/subjects/P0_S0/resources/up')
+    resource.create()
+
+    return lambda: resource.file('upload.dat').put(src)
+
+
+def calibrate():
+    """ Times a fixed pure python workload.
+    """
+    def run():
+        total = 0
+        for i in range(300000):
+            total += i % 7
+        '-'.join(str(i) for i in range(100000)).split('-')
+
+    return best(run, 5)
+
+
+def best(func, repeat):
+    times = []
+
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+
+    return min(times)
+
+
+def run(names, repeat):
+    results = OrderedDict()
+
+    for name in names:
+        workspace = _Workspace()
+
+        try:
+            results[name] = best(benchmarks[name](workspace), repeat)
+        finally:
+            getattr(workspace, 'close_server', lambda: None)()
+            workspace.close()
+
+        print('%-20s %8.4fs' % (name, results[name]))
+        sys.stdout.flush()
+
+    return results
+
+
+def compare(results, calibration, baseline, tolerance):
+    """ Prints the relative times to the baseline and returns the names of
+        the regressed benchmarks, and of those without a baseline.
+    """
+    regressions = []
+    scale = calibration / baseline['calibration']
+
+    print('\n%-20s %9s %9s %7s' % ('benchmark', 'baseline', 'current',
+                                   'ratio'))
+
+    for name, seconds in results.items():
+        if name not in baseline['benchmarks']:
+            print('%-20s %9s %8.4fs %7s NO BASELINE' % (name, '-', seconds,
+                                                       '-'))
+            regressions.append(name)
+            continue
+
+        expected = baseline['benchmarks'][name] * scale
+        ratio = seconds / expected
+        flag = ''
+
+        if ratio > 1 + tolerance:
+            flag = ' REGRESSION'
+            regressions.append(name)
+
+        print('%-20s %8.4fs %8.4fs %7.2f%s' % (name, expected, seconds,
+                                               ratio, flag))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-k', dest='keywords', action='append', default=[],
+                      help='only run the benchmarks whose name contains '
+                           'this keyword, can be repeated')
+    parser.add_option('-r', '--repeat', type='int', default=5,
+                      help='number of runs of each benchmark [%default]')
+    parser.add_option('-t', '--tolerance', type='float', default=0.5,
+                      help='allowed slowdown over the baseline [%default]')
+    parser.add_option('-b', '--baseline', default=BASELINE,
+                      help='baseline file [%default]')
+    parser.add_option('--save', action='store_true',
+                      help='record the results as the new baseline')
+    options, args = parser.parse_args(argv)
+
+    names = [name for name in benchmarks
+             if not options.keywords
+             or any(keyword in name for keyword in options.keywords)]
+
+    calibration = calibrate()
+    results = run(names, options.repeat)
+
+    if options.save:
+        baseline = {'calibration': calibration, 'benchmarks': {}}
+
+        if os.path.exists(options.baseline):
+            previous = json.load(open(options.baseline))
+            scale = calibration / previous['calibration']
+
+            for name, seconds in previous['benchmarks'].items():
+                baseline['benchmarks'][name] = seconds * scale
+
+        baseline['benchmarks'].update(results)
+
+        with open(options.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print('No baseline at %s, record one with --save'
+              % options.baseline)
+        return 0
+
+    regressions = compare(results, calibration,
+                          json.load(open(options.baseline)),
+                          options.tolerance)
+
+    if regressions:
+        print('\n%s regression(s) or missing baseline(s): %s'
+              % (len(regressions), ', '.join(regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
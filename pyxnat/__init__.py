@@ -11,18 +11,22 @@ Visit http://packages.python.org/pyxnat for more information.
 from .version import __version__
 
 from .core import Interface
+from .core import AsyncInterface
 from .core import SearchManager
 from .core import CacheManager
 from .core import Select
 from .core import Inspector
 from .core import Users
+from .core import asynchronous
 from .core import attributes
 from .core import cache
 from .core import help
 from .core import interfaces
 from .core import resources
 from .core import schema
+from .core import threadutil
 from .core import select
+from .core import stats
 from .core import users
 from .core import jsonutil
 from .core import uriutil
@@ -2,6 +2,7 @@ import os
 import sys
 
 from .interfaces import Interface
+from .asynchronous import AsyncInterface
 from .search import SearchManager
 from .cache import CacheManager
 from .select import Select
@@ -1,4 +1,4 @@
-from .jsonutil import JsonTable
+from .jsonutil import ColumnTable
 
 class ArrayData(object):
 
@@ -49,7 +49,7 @@ class ArrayData(object):
          for key, value in constraints.items()
          ]
 
-        return JsonTable(self._intf._get_json(uri)).where(**c)
+        return ColumnTable(self._intf._get_rows(uri)).where(**c)
 
     def experiments(self, project_id=None, subject_id=None, subject_label=None,
               experiment_id=None, experiment_label=None,
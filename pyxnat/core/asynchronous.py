@@ -0,0 +1,202 @@
+from .threadutil import WorkerPool, wait, as_completed
+from .resources import EObject, CObject
+from .attributes import EAttrs
+from .select import Select
+from . import schema
+
+
+# methods that only build other objects and never reach the server
+_navigation = set(['project', 'projects', 'experiment', 'experiments',
+                   'parent'])
+
+for _tree in [schema.resources_tree, schema.extra_resources_tree]:
+    for _children in _tree.values():
+        for _child in _children:
+            _navigation.update([_child, _child.rstrip('s')])
+
+
+class _AsyncObject(object):
+    """ Wraps a pyxnat object so that its calls to the server run in a
+        :class:`WorkerPool` and return a :class:`Future`.
+
+        Navigation methods, e.g. `subjects()`, still return wrapped
+        objects right away.
+    """
+    def __init__(self, obj, pool):
+        self._obj = obj
+        self._pool = pool
+
+    def _wrap(self, obj):
+        return wrap(obj, self._pool)
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        wrapped = self._wrap(attr)
+
+        if wrapped is not attr or not callable(attr):
+            return wrapped
+
+        if name in _navigation:
+            def navigate(*args, **kwargs):
+                return self._wrap(attr(*args, **kwargs))
+        else:
+            def navigate(*args, **kwargs):
+                return self._pool.submit(attr, *args, **kwargs)
+
+        navigate.__name__ = name
+        navigate.__doc__ = attr.__doc__
+
+        return navigate
+
+    def __repr__(self):
+        return '<Async %s' % repr(self._obj).lstrip('<')
+
+    def unwrap(self):
+        """ Returns the wrapped object.
+        """
+        return self._obj
+
+
+class AsyncSelect(_AsyncObject):
+    """ Asynchronous counterpart of :class:`Select`.
+    """
+    def __call__(self, datatype_or_path, columns=[]):
+        return self._wrap(self._obj(datatype_or_path, columns))
+
+
+class AsyncEObject(_AsyncObject):
+    """ Asynchronous counterpart of :class:`EObject`.
+
+        Examples
+        --------
+            >>> project = aintf.select.project('myproj')
+            >>> exists, labels = project.exists(), project.attrs.mget(
+                    ['xnat:projectData/name', 'xnat:projectData/ID'])
+            >>> exists.result(), labels.result()
+    """
+
+
+class AsyncCObject(_AsyncObject):
+    """ Asynchronous counterpart of :class:`CObject`.
+
+        Iterating over the collection sends its listing requests in the
+        calling thread and yields :class:`AsyncEObject`. `map` applies a
+        function to all the elements concurrently.
+    """
+    def __iter__(self):
+        for eobj in self._obj:
+            yield self._wrap(eobj)
+
+    def map(self, func, window=None):
+        """ Yields `func(element)` for every element of the collection,
+            in order, with up to `window` calls running at the same time.
+
+            `func` receives the plain :class:`EObject` and runs in a
+            worker thread, it must not wait on other futures of the same
+            interface.
+
+            Examples
+            --------
+                >>> labels = aintf.select.projects().subjects().map(
+                        lambda subject: subject.label())
+        """
+        return self._pool.imap(func, self._obj, window)
+
+
+class AsyncAttrs(_AsyncObject):
+    """ Asynchronous counterpart of :class:`EAttrs`.
+    """
+    def __call__(self):
+        return self._pool.submit(self._obj)
+
+
+def wrap(obj, pool):
+    """ Returns the asynchronous counterpart of a pyxnat object, or the
+        object itself if it has none.
+    """
+    if isinstance(obj, Select):
+        return AsyncSelect(obj, pool)
+    elif isinstance(obj, CObject):
+        return AsyncCObject(obj, pool)
+    elif isinstance(obj, EObject):
+        return AsyncEObject(obj, pool)
+    elif isinstance(obj, EAttrs):
+        return AsyncAttrs(obj, pool)
+
+    return obj
+
+
+class AsyncInterface(object):
+    """ Runs many requests to an XNAT server at the same time.
+
+        The requests of an :class:`Interface` block until the server
+        answers. An AsyncInterface sends them from a pool of worker
+        threads sharing the connections of the interface: methods that
+        reach the server return a :class:`threadutil.Future` instead of
+        their result.
+
+        Examples
+        --------
+            >>> interface = Interface('http://central.xnat.org', 'user', 'pwd')
+            >>> aintf = AsyncInterface(interface, workers=64)
+            >>> futures = [aintf.select.project(ID).exists()
+                           for ID in ['one', 'two', 'three']]
+            >>> aintf.wait(futures)
+            [True, False, True]
+
+            >>> for ID in aintf.select.projects().map(lambda p: p.id()):
+            >>>     print ID
+
+        Attributes
+        ----------
+        select:
+            :class:`AsyncSelect` to navigate the server resources.
+    """
+    def __init__(self, interface, workers=None):
+        """
+            Parameters
+            ----------
+            interface: :class:`Interface`
+                The interface whose requests are run concurrently.
+            workers: int | None
+                Number of requests running at the same time. Defaults to
+                the size of the interface connection pool.
+        """
+        self._intf = interface
+        self._pool = WorkerPool(workers or interface._poolsize)
+
+        self.select = AsyncSelect(interface.select, self._pool)
+
+    def submit(self, func, *args, **kwargs):
+        """ Runs `func(*args, **kwargs)` in a worker thread and returns
+            a :class:`threadutil.Future`.
+        """
+        return self._pool.submit(func, *args, **kwargs)
+
+    def map(self, func, iterable, window=None):
+        """ Yields `func(item)` for every item, in order, with up to
+            `window` calls running at the same time.
+        """
+        return self._pool.imap(func, iterable, window)
+
+    def wait(self, futures, timeout=None):
+        """ Returns the results of the futures, in the same order.
+        """
+        return wait(futures, timeout)
+
+    def as_completed(self, futures):
+        """ Yields the futures as they complete.
+        """
+        return as_completed(futures)
+
+    def close(self):
+        """ Stops the worker threads once the pending calls are done.
+            The underlying interface remains usable.
+        """
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,7 +1,8 @@
 import difflib
 import urllib
+import warnings
+from collections import OrderedDict
 
-from .jsonutil import JsonTable
 from .uriutil import uri_parent
 from .schema import datatype_attributes
 
@@ -75,12 +76,7 @@ class EAttrs(object):
                     standard representation for dates and times
                     established by the W3C.
         """
-        put_uri = self._eobj._uri + '?xsiType=%s&%s=%s' % (urllib.quote(self._get_datatype())
-                                                         , urllib.quote(path)
-                                                         , urllib.quote(value)
-                                              )
-
-        self._intf._exec(put_uri, 'PUT')
+        self._intf._exec(self._put_uri({path: value}), 'PUT')
 
     def mset(self, dict_attrs):
         """ Set multiple attributes at once.
@@ -96,17 +92,17 @@ class EAttrs(object):
                 The dict of key values to set. It follows the same
                 principles as the single `set()` method.
         """
+        self._intf._exec(self._put_uri(dict_attrs), 'PUT')
 
-        query_str = '?xsiType=%s' % (urllib.quote(self._get_datatype())) + '&'.join(['%s=%s' % (urllib.quote(path),
-                                               urllib.quote(val)
-                                               )
-                                    for path, val in dict_attrs.items()
-                                    ]
-                                   )
+    def _put_uri(self, dict_attrs):
+        """ Builds the URI setting the given attributes on the element.
+        """
+        query_str = '?xsiType=%s' % urllib.quote(self._get_datatype())
 
-        put_uri = self._eobj._uri + query_str
+        for path, val in dict_attrs.items():
+            query_str += '&%s=%s' % (urllib.quote(path), urllib.quote(val))
 
-        self._intf._exec(put_uri, 'PUT')
+        return self._eobj._uri + query_str
 
     def get(self, path):
         """ Get an attribute value.
@@ -127,8 +123,9 @@ class EAttrs(object):
         query_str = '?columns=ID,%s' % path
 
         get_uri = uri_parent(self._eobj._uri) + query_str
-        jdata = JsonTable(self._intf._get_json(get_uri)
-                          ).where(ID=self._get_id())
+        jdata = self._intf._get_table(get_uri)
+        jdata.index('ID')
+        jdata = jdata.where(ID=self._get_id())
 
         # unfortunately the return headers do not always have the
         # expected name
@@ -169,8 +166,9 @@ class EAttrs(object):
         query_str = '?columns=ID,%s' % ','.join(paths)
         get_uri = uri_parent(self._eobj._uri) + query_str
 
-        jdata = JsonTable(self._intf._get_json(get_uri)
-                          ).where(ID=self._get_id())
+        jdata = self._intf._get_table(get_uri)
+        jdata.index('ID')
+        jdata = jdata.where(ID=self._get_id())
 
         results = []
 
@@ -188,3 +186,130 @@ class EAttrs(object):
             results.append(jdata.get(header).replace('\s', ' '))
 
         return results
+
+
+class BulkAttrs(object):
+    """ Queues attribute writes on many elements and sends them
+        concurrently, one PUT per element.
+
+        Writes to the same element are merged, the last value set for a
+        path wins. The writes are sent when the `with` block exits, or
+        when `flush` is called, and the outcome for every element is
+        available in `results`.
+
+        Examples
+        --------
+            >>> with interface.bulk_attrs(max_inflight=8) as bulk:
+            >>>     for experiment in experiments:
+            >>>         bulk.set(experiment, 'xnat:mrSessionData/note', 'ok')
+            >>> bulk.errors()
+            {}
+    """
+    def __init__(self, interface, max_inflight=None):
+        """
+            Parameters
+            ----------
+            interface: :class:`Interface`
+                Main interface reference.
+            max_inflight: int | None
+                Maximum number of PUT requests running at the same time.
+                Defaults to the size of the interface connection pool,
+                which also bounds it: a larger value is lowered to the
+                pool size with a warning.
+        """
+        poolsize = interface._poolsize
+
+        if max_inflight is not None and max_inflight > poolsize:
+            warnings.warn('max_inflight=%s is above the connection pool '
+                          'size, at most %s requests run at the same time'
+                          % (max_inflight, poolsize), RuntimeWarning,
+                          stacklevel=2)
+            max_inflight = poolsize
+
+        self._intf = interface
+        self._max_inflight = max_inflight
+        self._pending = OrderedDict()
+
+        self.results = OrderedDict()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def set(self, eobj, path, value):
+        """ Queues the write of an attribute.
+
+            Parameters
+            ----------
+            eobj: :class:`EObject` | string
+                The element, or its URI.
+            path: string
+                The xpath of the attribute relative to the element.
+            value: string
+                The attribute's value, see `EAttrs.set`.
+        """
+        self.mset(eobj, {path: value})
+
+    def mset(self, eobj, dict_attrs):
+        """ Queues the write of multiple attributes.
+
+            Parameters
+            ----------
+            eobj: :class:`EObject` | string
+                The element, or its URI.
+            dict_attrs: dict
+                The dict of key values to set, see `EAttrs.mset`.
+        """
+        if isinstance(eobj, basestring):
+            eobj = self._intf.select(eobj)
+
+        if eobj._uri not in self._pending:
+            self._pending[eobj._uri] = (eobj, OrderedDict())
+
+        self._pending[eobj._uri][1].update(dict_attrs)
+
+    def flush(self):
+        """ Sends the queued writes.
+
+            Returns
+            -------
+            The `results` of the writes sent by this call: a dict whose
+            keys are the element URIs and values None for a success or
+            the exception raised by the failed request.
+        """
+        pending, self._pending = self._pending, OrderedDict()
+
+        def put(item):
+            eobj, dict_attrs = item
+
+            try:
+                eobj.attrs.mset(dict_attrs)
+            except Exception as e:
+                return eobj._uri, e
+
+            return eobj._uri, None
+
+        window = self._max_inflight or self._intf._poolsize
+        results = OrderedDict(
+            self._intf._get_workers().imap(put, pending.values(), window))
+
+        self.results.update(results)
+
+        return results
+
+    def errors(self):
+        """ Returns the failed writes, as a dict of element URIs and
+            exceptions.
+        """
+        return OrderedDict((uri, error)
+                           for uri, error in self.results.items()
+                           if error is not None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # the writes are dropped if the block failed
+        if exc_type is None:
+            self.flush()
+        else:
+            self._pending.clear()
@@ -8,22 +8,256 @@ import hashlib
 import re
 import time
 import shutil
+import sqlite3
+import binascii
+import fnmatch
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 try:
-    from StringIO import StringIO
+    import fcntl
 except ImportError:
-    from io import StringIO
+    fcntl = None
+
+from .jsonutil import dump_columns, load_columns, columns_to_json
+from .schema import resources_tree
+from .threadutil import WorkerPool
+from .uriutil import uri_nextlast
 
 
 _platform = platform.system()
 
 DEBUG = False
 
+# name of the index database in the cache directory
+INDEX = 'index.sqlite'
+
+# directory of the lock files in the cache directory
+LOCKS = 'locks'
+
+# directory of the datatypes learnt by the Inspector
+STRUCT = 'struct'
+
+# the entries content is stored in <namespace>/ab/cd/<name>, each kind
+# of entry in its own namespace so that it can be listed on its own
+NAMESPACES = ['data', 'files', 'schemas', 'xml']
+
+# elements whose XML document is fetched by CacheManager.prefetch
+_xml_types = ['projects', 'subjects', 'experiments', 'assessors',
+              'reconstructions', 'scans']
+
+# lifespan in seconds in the memory cache of the responses that change
+# rarely, or all the time, by glob pattern of their path. The other
+# responses are kept for the expiration set by CacheManager.set_usage.
+TTL_POLICIES = [('*.xsd', 24 * 3600),
+                ('*/search/elements*', 3600),
+                ('*/data/projects', 300),
+                ('*/REST/projects', 300),
+                ('*/prearchive*', 0),
+                ]
+
+# suffix of the parsed form of a listing, next to its content
+COLUMNS = '.columns'
+
+# entries being transferred by the threads of this process, see
+# HTCache.lock: (cache directory, name) -> [lock, number of users]
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# directory of the downloaded files content, stored once per md5 digest
+# in blobs/ab/cd/<digest> and hard linked to the entries sharing it
+BLOBS = 'blobs'
+
+_schema = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    key TEXT,
+    headers TEXT NOT NULL,
+    location TEXT,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT
+);
+
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+
+CREATE TABLE IF NOT EXISTS usage (
+    custom INTEGER PRIMARY KEY,
+    bytes INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO usage VALUES (0, 0);
+INSERT OR IGNORE INTO usage VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+BEGIN
+    UPDATE usage SET bytes = bytes + NEW.size
+    WHERE custom = (NEW.location IS NOT NULL);
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+BEGIN
+    UPDATE usage SET bytes = bytes - OLD.size
+    WHERE custom = (OLD.location IS NOT NULL);
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_update
+AFTER UPDATE OF size, location ON entries
+BEGIN
+    UPDATE usage SET bytes = bytes - OLD.size
+    WHERE custom = (OLD.location IS NOT NULL);
+    UPDATE usage SET bytes = bytes + NEW.size
+    WHERE custom = (NEW.location IS NOT NULL);
+END;
+"""
+
+# changes of the index since its first version, applied in order to
+# older indexes. The user_version of an index is the number of changes
+# it went through.
+_upgrades = [
+    # namespaces
+    ['ALTER TABLE entries ADD COLUMN namespace TEXT',
+     'CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace)',
+     ],
+    # content-addressed file store, the size of the entries sharing a
+    # blob is counted once through the blob
+    ['ALTER TABLE entries ADD COLUMN digest TEXT',
+     'CREATE INDEX entries_digest ON entries (digest)',
+     'CREATE TABLE blobs (digest TEXT PRIMARY KEY, '
+     'size INTEGER NOT NULL, refs INTEGER NOT NULL)',
+     'DROP TRIGGER entries_insert',
+     'DROP TRIGGER entries_delete',
+     'DROP TRIGGER entries_update',
+     """CREATE TRIGGER entries_insert AFTER INSERT ON entries
+        WHEN NEW.digest IS NULL
+        BEGIN
+            UPDATE usage SET bytes = bytes + NEW.size
+            WHERE custom = (NEW.location IS NOT NULL);
+        END""",
+     """CREATE TRIGGER entries_delete AFTER DELETE ON entries
+        WHEN OLD.digest IS NULL
+        BEGIN
+            UPDATE usage SET bytes = bytes - OLD.size
+            WHERE custom = (OLD.location IS NOT NULL);
+        END""",
+     """CREATE TRIGGER entries_update
+        AFTER UPDATE OF size, location, digest ON entries
+        BEGIN
+            UPDATE usage SET bytes = bytes - OLD.size
+            WHERE custom = (OLD.location IS NOT NULL)
+            AND OLD.digest IS NULL;
+            UPDATE usage SET bytes = bytes + NEW.size
+            WHERE custom = (NEW.location IS NOT NULL)
+            AND NEW.digest IS NULL;
+        END""",
+     """CREATE TRIGGER blobs_insert AFTER INSERT ON blobs
+        BEGIN
+            UPDATE usage SET bytes = bytes + NEW.size WHERE custom = 0;
+        END""",
+     """CREATE TRIGGER blobs_delete AFTER DELETE ON blobs
+        BEGIN
+            UPDATE usage SET bytes = bytes - OLD.size WHERE custom = 0;
+        END""",
+     ],
+    # md5 digest of the content of the entries in the cache directory,
+    # which the parsed rows of a listing are checked against
+    ['ALTER TABLE entries ADD COLUMN checksum TEXT',
+     ],
+    ]
+
 
 def md5name(key):
     """ Generates a unique path to store server responses.
     """
     return hashlib.md5(key).hexdigest()
 
+def namespace(key):
+    """ Returns the namespace of an entry from its key: schemas, files
+        (downloads), xml (element documents) or data (listings and
+        everything else).
+    """
+    if key is None:
+        return 'data'
+
+    path, _, query = key.partition('?')
+
+    if path.endswith('.xsd'):
+        return 'schemas'
+    elif '/files/' in path or (path.endswith('/files')
+                               and 'format=zip' in query):
+        return 'files'
+    elif 'format=xml' in query:
+        return 'xml'
+
+    return 'data'
+
+def parse_headers(header):
+    """ Returns the headers of a response in the httplib2 cache format
+        as a dict with lower case keys.
+    """
+    headers = {}
+
+    for line in header.split('\r\n'):
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    return headers
+
+def temppath(path):
+    """ Returns a unique hidden path next to `path`, to write a file
+        before renaming it.
+    """
+    directory, name = os.path.split(path)
+
+    return os.path.join(directory, '.%s.%s.tmp' % (
+        name, binascii.hexlify(os.urandom(6))))
+
+def rename(src, dst):
+    """ Renames a file, replacing `dst` if it exists.
+    """
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # Windows does not rename over an existing file
+        if _platform != 'Windows' or not os.path.exists(dst):
+            raise
+
+        os.remove(dst)
+        os.rename(src, dst)
+
+def link(src, dst):
+    """ Gives the file `src` the additional path `dst`, or moves it on
+        platforms without hard links.
+    """
+    if not hasattr(os, 'link'):
+        return rename(src, dst)
+
+    remove(dst)
+    os.link(src, dst)
+
+def makedirs(path):
+    """ Creates a directory and its parents, if another process has not
+        done it first.
+    """
+    if path and not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+def remove(path):
+    """ Removes a file if it exists, another process may have removed
+        it first.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        if os.path.exists(path):
+            raise
+
 def bytes_to_human(size, unit):
     """ Returns a more human readable version of a size in bytes.
     """
@@ -36,13 +270,12 @@ def bytes_to_human(size, unit):
         return size
 
 def memstr_to_bytes(text):
-    """ Convert a memory text to its value in kilobytes.
+    """ Convert a memory text to its value in bytes.
     """
-    kilo = 1024**2
-    units = dict(K=1, M=kilo, G=kilo**2)
+    units = dict(K=1024, M=1024**2, G=1024**3, T=1024**4)
     try:
-        size = int(units[text[-1]]*float(text[:-1]))
-    except (KeyError, ValueError):
+        size = int(units[text[-1].upper()]*float(text[:-1]))
+    except (KeyError, ValueError, IndexError):
         raise ValueError(
                 "Invalid literal for size give: %s (type %s) should be "
                 "alike '10G', '500M', '50K'." % (text, type(text))
@@ -51,6 +284,17 @@ def memstr_to_bytes(text):
 
 
 class HTCache(object):
+    """ Disk cache of the server responses, used by httplib2 and by
+        the :class:`Interface` requests.
+
+        The content of each entry is a file named after its key, in
+        <cachedir>/<namespace>/ab/cd/ (see `namespace`), or at a location
+        chosen by the user. Everything
+        else, i.e. the key, the response headers, the content location
+        and size and the last access, is kept in an SQLite index in the
+        same directory so that the cache can be measured and searched
+        without listing it.
+    """
     def __init__(self, cachedir, interface, safe=md5name):
         """
             Parameters
@@ -67,113 +311,786 @@ class HTCache(object):
         self.cache = cachedir
         self.safe = safe
 
-        self._cachepath = None
+        # the path forced by preset() is per thread so that concurrent
+        # requests never write to each other's location, and so are the
+        # connections to the index
+        self._local = threading.local()
 
-        if not os.path.exists(cachedir):
-            os.makedirs(cachedir)
+        # maximum size in bytes of the cache directory, see
+        # CacheManager.set_limit
+        self.limit = None
 
-    def get(self, key):
-        retval = None
+        # thread side of the entry locks, see _lock()
+        self._locks = [threading.Lock() for _ in range(64)]
+
+        makedirs(cachedir)
+
+        self._indexpath = os.path.join(cachedir, INDEX)
+        created = not os.path.exists(self._indexpath)
+
+        db = self._db()
+        db.executescript(_schema)
+        self._upgrade()
 
-        _cachepath = os.path.join(self.cache, self.safe(key))
+        if created:
+            self._import_sidecars()
+
+        # the flat layout of older caches is converted in the background
+        if db.execute('SELECT 1 FROM entries WHERE namespace IS NULL '
+                      'LIMIT 1').fetchone() is not None \
+                or glob.glob('%s/*.struct' % self.cache):
+            thread = threading.Thread(target=self.migrate)
+            thread.daemon = True
+            thread.start()
+
+    def _get_cachepath(self):
+        return getattr(self._local, 'cachepath', None)
+
+    def _set_cachepath(self, path):
+        self._local.cachepath = path
+
+    _cachepath = property(_get_cachepath, _set_cachepath)
+
+    def _db(self):
+        """ Returns the connection of the current thread to the index.
+        """
+        db = getattr(self._local, 'db', None)
+
+        # a connection must not be used by a forked process
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self._indexpath, timeout=60,
+                                 isolation_level=None)
+            db.text_factory = str
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+
+        return db
+
+    def _upgrade(self):
+        """ Applies to the index the changes it does not have yet.
+        """
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            version = db.execute('PRAGMA user_version').fetchone()[0]
+            columns = [row[1] for row in
+                       db.execute('PRAGMA table_info(entries)')]
+
+            for statements in _upgrades[version:]:
+                for statement in statements:
+                    # indexes of the first releases with namespaces had the
+                    # column without a user_version
+                    words = statement.split()
+                    if words[:5] == ['ALTER', 'TABLE', 'entries', 'ADD',
+                                     'COLUMN'] and words[5] in columns:
+                        continue
+
+                    db.execute(statement)
+
+            db.execute('PRAGMA user_version = %s' % len(_upgrades))
+        except:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _import_sidecars(self):
+        """ Imports the entries of a cache directory written before the
+            index existed, whose headers and custom locations were kept
+            in .headers and .alt files next to the content. The content
+            is then moved by `migrate`.
+        """
+        db = self._db()
+
+        for _headerpath in glob.glob('%s/*.headers' % self.cache):
+            name = os.path.basename(_headerpath)[:-len('.headers')]
+            _cachepath = os.path.join(self.cache, name)
+            _fakepath = '%s.alt' % _cachepath
+            location = None
+
+            try:
+                f = file(_headerpath, "rb")
+                header = f.read()
+                f.close()
+
+                if os.path.exists(_fakepath):
+                    f = file(_fakepath, "rb")
+                    location = f.read()
+                    f.close()
+
+                size = os.path.getsize(location or _cachepath)
+                last_access = os.path.getmtime(_headerpath)
+            except (IOError, OSError):
+                continue
+
+            headers = parse_headers(header)
+
+            # the key is only known from the location the headers were
+            # stored with, if it matches the name of the files
+            key = headers.get('content-location')
+
+            if key is not None and self.safe(key) != name:
+                key = None
+
+            db.execute('INSERT OR IGNORE INTO entries (name, key, headers, '
+                       'location, size, last_access, etag, last_modified) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (name, key, header, location, size, last_access,
+                        headers.get('etag'), headers.get('last-modified')))
+
+            for path in [_headerpath, _fakepath]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _entry(self, key, columns):
+        return self._db().execute(
+            'SELECT %s FROM entries WHERE name = ?' % columns,
+            (self.safe(key), )).fetchone()
+
+    def _default(self, name, namespace):
+        """ Returns the path of an entry content in the cache directory.
+            Entries without namespace are from the flat layout of older
+            caches, waiting for `migrate`.
+        """
+        if namespace is None:
+            return os.path.join(self.cache, name)
+
+        return os.path.join(self.cache, namespace, name[:2], name[2:4],
+                            name)
+
+    def migrate(self):
+        """ Converts a cache directory from the flat layout of older
+            versions, where all the files were in the cache directory,
+            to the namespaced and sharded layout.
+
+            Entries are moved one by one under their lock and remain
+            readable meanwhile, so the cache can be used, by several
+            processes, during the migration. It runs in the background
+            when a cache in the old layout is opened.
+        """
+        db = self._db()
+        last = ''
+
+        # paged by name, so that entries left behind do not hold up the
+        # following ones
+        while True:
+            rows = db.execute('SELECT name, key FROM entries WHERE '
+                              'namespace IS NULL AND name > ? '
+                              'ORDER BY name LIMIT 1000',
+                              (last, )).fetchall()
+
+            if not rows:
+                break
+
+            last = rows[-1][0]
+
+            for name, key in rows:
+                with self._lock(name):
+                    row = db.execute('SELECT location, namespace FROM '
+                                     'entries WHERE name = ?',
+                                     (name, )).fetchone()
+
+                    if row is None or row[1] is not None:
+                        continue
+
+                    ns = namespace(key)
+                    flat = self._default(name, None)
+
+                    try:
+                        if row[0] is None and os.path.exists(flat):
+                            sharded = self._default(name, ns)
+                            makedirs(os.path.dirname(sharded))
+                            # readers of the flat path still find it
+                            link(flat, sharded)
+
+                        db.execute('UPDATE entries SET namespace = ? '
+                                   'WHERE name = ?', (ns, name))
+                        remove(flat)
+                    except (IOError, OSError):
+                        pass
+
+        for path in glob.glob('%s/*.struct' % self.cache):
+            makedirs(os.path.join(self.cache, STRUCT))
+            rename(path, os.path.join(self.cache, STRUCT,
+                                      os.path.basename(path)))
+
+    def get(self, key):
+        name = self.safe(key)
+        row = self._entry(key, 'headers, location, namespace')
 
         if DEBUG:
             print('cache get:', key,)
-            print('\n\t', _cachepath)
 
-        try:
-            f = file('%s.headers' % _cachepath, "rb")
-            retval = f.read()
-            f.close()
+        if row is None:
+            return None
+
+        header, location, ns = row
 
-            f = file(_cachepath, "rb")
-            retval += f.read()
+        try:
+            f = file(location or self._default(name, ns), "rb")
+            content = f.read()
             f.close()
         except IOError:
-            try:
-                f = file('%s.alt' % _cachepath, "rb")
-                _altpath = f.read()
-                f.close()
+            return None
 
-                f = file(_altpath, "rb")
-                retval += f.read()
-                f.close()
-            except:
-                return
+        self._db().execute(
+            'UPDATE entries SET last_access = ? WHERE name = ?',
+            (time.time(), name))
+
+        return header + content
+
+    def get_headers(self, key):
+        """ Returns the stored response headers of an entry as a dict with
+            lower case keys, or None if there is no such entry.
+        """
+        row = self._entry(key, 'headers')
+
+        if row is None or not os.path.exists(self.get_diskpath(key)):
+            return None
+
+        return parse_headers(row[0])
+
+    def validators(self, key):
+        """ Returns the headers of a conditional request revalidating an
+            entry, based on the ETag and Last-Modified headers it was
+            stored with.
+        """
+        row = self._entry(key, 'etag, last_modified')
+        conditions = {}
 
-        return retval
+        if row is None or not os.path.exists(self.get_diskpath(key)):
+            return conditions
+
+        if row[0] is not None:
+            conditions['if-none-match'] = row[0]
+
+        if row[1] is not None:
+            conditions['if-modified-since'] = row[1]
+
+        return conditions
+
+    def refresh(self, key, header):
+        """ Replaces the headers of an entry, e.g. after the server
+            answered a conditional request with 304 Not Modified. The
+            content is left untouched.
+        """
+        headers = parse_headers(header)
+
+        self._db().execute(
+            'UPDATE entries SET headers = ?, etag = ?, last_modified = ?, '
+            'last_access = ? WHERE name = ?',
+            (header, headers.get('etag'), headers.get('last-modified'),
+             time.time(), self.safe(key)))
+
+    def keys(self, pattern='*', namespace=None):
+        """ Returns the keys of the entries matching a glob pattern.
+
+            Parameters
+            ----------
+            pattern: string
+                Glob pattern of the keys.
+            namespace: string | None
+                Only look at the entries of a namespace, one of
+                NAMESPACES.
+        """
+        if namespace is None:
+            return [row[0] for row in self._db().execute(
+                'SELECT key FROM entries WHERE key GLOB ?', (pattern, ))]
+
+        return [row[0] for row in self._db().execute(
+            'SELECT key FROM entries WHERE namespace = ? AND key GLOB ?',
+            (namespace, pattern))]
 
     def set(self, key, value):
         """ Sets cache entry.
         """
+        split = value.find('\r\n\r\n') + 4
 
-        _fakepath = '%s.alt' % os.path.join(self.cache, self.safe(key))
-        _headerpath = '%s.headers' % os.path.join(self.cache, self.safe(key))
-        _cachepath = os.path.join(self.cache, self.safe(key))
+        self.store(key, value[:split], [value[split:]])
 
-        if self._cachepath is not None: # when using custom path
-            if _cachepath != self._cachepath and os.path.exists(_cachepath):
-                os.remove(_cachepath) # remove default file if exists
+    def store(self, key, header, chunks, location=None):
+        """ Sets a cache entry from an iterable of content chunks, which
+            are written to disk as they come.
 
-            if os.path.exists(_fakepath):
-                f = file(_fakepath, "rb")
-                _altpath = f.read()
-                f.close()
+            Parameters
+            ----------
+            key: string
+                The entry key.
+            header: string
+                The response headers, in the httplib2 cache format.
+            chunks: iterable
+                The response content.
+            location: string | None
+                Where to write the content. If None the location forced
+                by `preset` is used if any, else the default cache path.
 
-                if _altpath != self._cachepath and os.path.exists(_altpath):
-                    # remove old custom file if different location
-                    os.remove(_altpath)
+            Returns
+            -------
+            The path of the content file.
+        """
+        writer = self.writer(key, header, location)
 
-            _cachepath = self._cachepath
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+        except:
+            writer.abort()
+            raise
 
-            if DEBUG:
-                print('cache set custom:', key)
-                print('\n\t', _cachepath)
+        return writer.commit()
 
-            f = open(_fakepath, 'w')
-            f.write(_cachepath)
-            f.close()
+    def writer(self, key, header, location=None):
+        """ Starts setting a cache entry from content that is written to
+            it piece by piece, e.g. while it is parsed. See `store` for
+            the parameters.
 
-            self._cachepath = None
+            Returns
+            -------
+            An :class:`EntryWriter`. The entry is only set when its
+            `commit` method is called, `abort` discards the content.
+        """
+        name = self.safe(key)
+        ns = namespace(key)
+        _cachepath = self._default(name, ns)
 
-        else:                   # when using default cache path
-            if os.path.exists(_fakepath): # if alternate location exists
-                f = file(_fakepath, "rb")
-                _altpath = f.read()
-                f.close()
+        if location is None:
+            location = self._cachepath
+            self._cachepath = None
 
-                if _altpath != self._cachepath and os.path.exists(_altpath):
-                    os.remove(_altpath) # remove actual file
+        if location == _cachepath:
+            location = None
 
-                os.remove(_fakepath) # remove pointer file
+        if location is not None: # when using custom path
+            _cachepath = location
 
             if DEBUG:
-                print('cache set default:', key)
+                print('cache set custom:', key)
                 print('\n\t', _cachepath)
 
-        header = ''
-        value = StringIO(value)
+        elif DEBUG:
+            print('cache set default:', key)
+            print('\n\t', _cachepath)
+
+        # a custom location may be the default path of another entry
+        makedirs(os.path.dirname(_cachepath))
 
         # avoid checking disk status each time
         if time.gmtime(time.time())[5] % 10 == 0:
             disk_status = self._intf.cache.disk_ready(_cachepath)
 
             if not disk_status[0] and self._intf.cache._warn:
-                print('Warning: %s is %.2f%% full') % \
-                    (os.path.dirname(_cachepath), disk_status[1])
+                print('Warning: %s is %.2f%% full' % (
+                    os.path.dirname(_cachepath), disk_status[1]))
+
+        # downloaded files are stored once per content, see link_digest
+        md5 = None
+        if location is None:
+            md5 = hashlib.md5()
+
+        return EntryWriter(self, key, header, location, _cachepath, md5,
+                           share=ns == 'files' and hasattr(os, 'link'))
+
+    def _commit(self, key, header, location, size, digest, _temppath,
+                _cachepath, checksum=None):
+        """ Moves the content written at `_temppath` to `_cachepath` and
+            records the entry in the index.
+        """
+        name = self.safe(key)
+        ns = namespace(key)
+        headers = parse_headers(header)
+        values = (key, header, location, size, time.time(),
+                  headers.get('etag'), headers.get('last-modified'), ns,
+                  digest, checksum, name)
+
+        with self._lock(name):
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._entry(key, 'location, namespace, digest')
+
+                if digest is not None:
+                    self._share(digest, size, _temppath)
+
+                rename(_temppath, _cachepath)
+                # renaming a link to the same content leaves it in place
+                remove(_temppath)
+
+                if row is not None:
+                    # remove the previous custom file, or the previous
+                    # default file of an entry from an older layout
+                    for previous in [row[0], self._default(name, row[1])]:
+                        if previous not in [None, _cachepath]:
+                            remove(previous)
+
+                    # the rows parsed from the previous content, counted
+                    # in the size replaced
+                    remove(self._default(name, row[1]) + COLUMNS)
+
+                    if row[2] is not None:
+                        self._release(row[2])
+
+                if location is not None:
+                    # remove default file if exists
+                    remove(self._default(name, ns))
+
+                if not db.execute(
+                        'UPDATE entries SET key = ?, headers = ?, '
+                        'location = ?, size = ?, last_access = ?, etag = ?, '
+                        'last_modified = ?, namespace = ?, digest = ?, '
+                        'checksum = ? WHERE name = ?', values).rowcount:
+                    db.execute('INSERT INTO entries (key, headers, location, '
+                               'size, last_access, etag, last_modified, '
+                               'namespace, digest, checksum, name) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               values)
+            except:
+                db.execute('ROLLBACK')
+                remove(_temppath)
+                raise
+            db.execute('COMMIT')
+
+    def _blob(self, digest):
+        return os.path.join(self.cache, BLOBS, digest[:2], digest[2:4],
+                            digest)
+
+    def _share(self, digest, size, path):
+        """ Makes `path` a link to the stored content with this digest,
+            storing the content of `path` if there is none yet. Runs in a
+            transaction of the index.
+        """
+        db = self._db()
+        blob = self._blob(digest)
+
+        if os.path.exists(blob):
+            remove(path)
+            os.link(blob, path)
+        else:
+            makedirs(os.path.dirname(blob))
+            os.link(path, blob)
+
+        db.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, 0)',
+                   (digest, size))
+        db.execute('UPDATE blobs SET refs = refs + 1 WHERE digest = ?',
+                   (digest, ))
+
+    def _release(self, digest):
+        """ Drops a reference to the stored content with this digest, and
+            removes it if it was the last one. Runs in a transaction of the
+            index.
+
+            Returns
+            -------
+            True if the content was removed.
+        """
+        db = self._db()
+        db.execute('UPDATE blobs SET refs = refs - 1 WHERE digest = ?',
+                   (digest, ))
+        row = db.execute('SELECT refs FROM blobs WHERE digest = ?',
+                         (digest, )).fetchone()
 
-        while len(header) < 4 or header[-4:] != '\r\n\r\n':
-            header += value.read(1)
+        if row is None or row[0] > 0:
+            return False
+
+        db.execute('DELETE FROM blobs WHERE digest = ?', (digest, ))
+        remove(self._blob(digest))
+
+        return True
+
+    def link_digest(self, key, digest, location=None):
+        """ Sets a cache entry from downloaded content already stored for
+            another key, e.g. the same file reached through a project and
+            an experiment URI, without downloading it again.
+
+            Parameters
+            ----------
+            key: string
+                The entry key.
+            digest: string
+                The md5 hex digest of the content, as listed by XNAT.
+            location: string | None
+                Where to copy the content. If None it is linked to the
+                default cache path.
+
+            Returns
+            -------
+            The path of the content file, or None if there is no content
+            with this digest in the cache.
+        """
+        name = self.safe(key)
+        _cachepath = self._default(name, namespace(key))
+        blob = self._blob(digest)
+
+        if location == _cachepath:
+            location = None
+
+        row = self._db().execute(
+            'SELECT headers, blobs.size FROM entries JOIN blobs '
+            'USING (digest) WHERE digest = ? LIMIT 1',
+            (digest, )).fetchone()
+
+        if row is None or (location is None and not hasattr(os, 'link')):
+            return None
+
+        if location is not None:
+            _cachepath = location
+
+        makedirs(os.path.dirname(_cachepath))
+        _temppath = temppath(_cachepath)
+
+        try:
+            checksum = digest
+
+            if location is not None:
+                # files at custom locations belong to the user
+                shutil.copyfile(blob, _temppath)
+                digest = None
+
+            self._commit(key, row[0], location, row[1], digest, _temppath,
+                         _cachepath, checksum)
+        except (IOError, OSError):
+            remove(_temppath)
+            return None
+
+        if self.limit is not None and self.usage() > self.limit:
+            self.evict(keep=name)
+
+        return _cachepath
+
+    def get_rows(self, key, content=None):
+        """ Returns the rows of a listing entry from the parsed form
+            stored by `set_rows`, or None if there is none or the content
+            changed since.
+
+            If `content` is given, e.g. a response just received, the
+            rows are only returned if they were parsed from it.
+        """
+        row = self._entry(key, 'location, namespace, checksum')
+
+        if row is None or row[0] is not None or \
+                not self._holds(row[2], content):
+            return None
+
+        try:
+            headers, columns, version = load_columns(
+                self._default(self.safe(key), row[1]) + COLUMNS)
+        except (IOError, OSError, ValueError):
+            return None
 
-        content = value.read()
+        if version != list(self.version(key) or []):
+            return None
 
-        f = file(_headerpath, "wb")
-        f.write(header)
-        f.close()
+        return columns_to_json(headers, columns)
 
-        f = file(_cachepath, "wb")
-        f.write(content)
-        f.close()
+    def set_rows(self, key, rows, content=None):
+        """ Stores the rows of a listing entry, as parsed from its content,
+            in a columnar form that `get_rows` loads without parsing. See
+            `jsonutil.dump_columns`.
+
+            Entries at custom locations and rows without the same columns
+            are not stored, nor the rows of a `content` that is not the
+            content of the entry, see `get_rows`. The rows are counted in
+            the size of the entry.
+        """
+        name = self.safe(key)
+        row = self._entry(key, 'location, namespace, checksum')
+        version = self.version(key)
+        headers = sorted(rows[0].keys()) if rows else []
+
+        if row is None or row[0] is not None or version is None or \
+                any(len(entry) != len(headers) for entry in rows) or \
+                not self._holds(row[2], content):
+            return
+
+        _columnspath = self._default(name, row[1]) + COLUMNS
+        _temppath = temppath(_columnspath)
+
+        try:
+            dump_columns(headers, rows, _temppath, list(version))
+            size = os.path.getsize(_temppath)
+
+            with self._lock(name):
+                db = self._db()
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    # the entry may have been stored again meanwhile
+                    if self.version(key) != version:
+                        db.execute('ROLLBACK')
+                        remove(_temppath)
+                        return
+
+                    previous = 0
+                    if os.path.exists(_columnspath):
+                        previous = os.path.getsize(_columnspath)
+
+                    rename(_temppath, _columnspath)
+                    db.execute('UPDATE entries SET size = size + ? '
+                               'WHERE name = ?', (size - previous, name))
+                except:
+                    db.execute('ROLLBACK')
+                    raise
+                db.execute('COMMIT')
+        except:
+            remove(_temppath)
+            raise
+
+        if self.limit is not None and self.usage() > self.limit:
+            self.evict(keep=name)
+
+    def lock(self, key):
+        """ Holds an exclusive lock on an entry, shared by the threads of
+            the process using the cache directory, e.g. for the time of
+            its download. A thread may take the lock of an entry it
+            already holds.
+
+            Only the threads waiting for the same entry are blocked. The
+            entries are written to the cache atomically, under a short
+            lock shared with the other processes, see `_lock`.
+
+            Examples
+            --------
+            >>> with cache.lock(uri):
+            >>>     if cache.get(uri) is None:
+            >>>         cache.set(uri, download(uri))
+        """
+        return self._key_lock(self.safe(key))
+
+    @contextmanager
+    def _key_lock(self, name):
+        key = (os.path.abspath(self.cache), name)
+
+        with _inflight_lock:
+            entry = _inflight.setdefault(key, [threading.RLock(), 0])
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with _inflight_lock:
+                entry[1] -= 1
+
+                if not entry[1]:
+                    del _inflight[key]
+
+    @contextmanager
+    def _lock(self, name):
+        """ Holds the lock of an entry while it is changed on disk, shared
+            by all the threads and processes using the cache directory.
+            Entries share 4096 lock files, it must only be held briefly.
+            On platforms without fcntl only the threads of a process are
+            excluded.
+        """
+        stripe = hashlib.md5(name).hexdigest()[:3]
+        held = self._local.__dict__.setdefault('locks', set())
+
+        if stripe in held:
+            yield
+            return
+
+        with self._locks[int(stripe, 16) % len(self._locks)]:
+            f = None
+
+            if fcntl is not None:
+                lockdir = os.path.join(self.cache, LOCKS)
+                makedirs(lockdir)
+
+                f = open(os.path.join(lockdir, stripe), 'a')
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+            held.add(stripe)
+
+            try:
+                yield
+            finally:
+                held.discard(stripe)
+
+                if f is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                    f.close()
+
+    def _holds(self, checksum, content):
+        """ Whether `content` is the content of an entry, from the md5
+            digest recorded in the index, always True if it is None.
+        """
+        if content is None:
+            return True
+
+        return checksum is not None and \
+            hashlib.md5(content).hexdigest() == checksum
+
+    def version(self, key):
+        """ Returns an identifier of the content of an entry that changes
+            every time it is stored, or None if there is no content.
+        """
+        try:
+            st = os.stat(self.get_diskpath(key))
+        except OSError:
+            return None
+
+        return st.st_ino, st.st_mtime, st.st_size
+
+    def usage(self, custom=False):
+        """ Returns the size in bytes of the entries content in the cache
+            directory, with the rows stored by `set_rows`, or at custom
+            locations.
+        """
+        return self._db().execute('SELECT bytes FROM usage WHERE custom = ?',
+                                  (int(custom), )).fetchone()[0]
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries until the cache
+            directory is back under 90% of `limit`.
+
+            Entries downloaded to a custom location are never evicted:
+            their files belong to the user and are not counted in the
+            cache size.
+
+            Parameters
+            ----------
+            keep: string | None
+                Name of an entry on disk that must not be evicted e.g.
+                the one being stored.
+        """
+        if self.limit is None:
+            return
+
+        db = self._db()
+        usage = self.usage()
+        target = self.limit * 0.9
+
+        if usage <= self.limit:
+            return
+
+        while usage > target:
+            rows = db.execute(
+                'SELECT name, size, namespace, digest FROM entries WHERE '
+                'location IS NULL AND name != ? ORDER BY last_access '
+                'LIMIT 1000', (keep or '', )).fetchall()
+
+            if not rows:
+                break
+
+            for name, size, ns, digest in rows:
+                if usage <= target:
+                    break
+
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    db.execute('DELETE FROM entries WHERE name = ?',
+                               (name, ))
+                    remove(self._default(name, ns))
+                    remove(self._default(name, ns) + COLUMNS)
+
+                    # shared content is freed with its last entry
+                    if digest is not None and not self._release(digest):
+                        size = 0
+                except:
+                    db.execute('ROLLBACK')
+                    raise
+                db.execute('COMMIT')
+
+                usage -= size
 
     def preset(self, path):
         """ Sets and forces a path for the next entry to be set.
@@ -193,39 +1110,266 @@ class HTCache(object):
         if DEBUG:
             print('cache del:', key)
 
-        _cachepath = os.path.join(self.cache, self.safe(key))
-        _fakepath = '%s.alt' % _cachepath
-        _headerpath = '%s.headers' % _cachepath
+        name = self.safe(key)
 
-        if os.path.exists(_fakepath):
-            f = file(_fakepath, "rb")
-            _altpath = f.read()
-            f.close()
+        with self._lock(name):
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._entry(key, 'location, namespace, digest')
 
-            os.remove(_fakepath)
-            if os.path.exists(_altpath):
-                os.remove(_altpath)
+                db.execute('DELETE FROM entries WHERE name = ?', (name, ))
 
-        if os.path.exists(_cachepath):
-            os.remove(_cachepath)
+                if row is not None:
+                    if row[0] is not None:
+                        remove(row[0])
 
-        if os.path.exists(_headerpath):
-            os.remove(_headerpath)
+                    remove(self._default(name, row[1]))
+                    remove(self._default(name, row[1]) + COLUMNS)
+
+                    if row[2] is not None:
+                        self._release(row[2])
+
+                remove(self._default(name, namespace(key)))
+            except:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+
+    def clear(self):
+        """ Deletes all the entries, including the files at custom
+            locations.
+        """
+        db = self._db()
+
+        for location, in db.execute('SELECT location FROM entries WHERE '
+                                    'location IS NOT NULL').fetchall():
+            remove(location)
+
+        db.execute('DELETE FROM entries')
+        db.execute('DELETE FROM blobs')
+
+        for name in os.listdir(self.cache):
+            if name.startswith(INDEX) or name == LOCKS:
+                continue
+
+            path = os.path.join(self.cache, name)
+
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
 
     def get_diskpath(self, key, force_default=False):
         """ Gets the disk path where the entry is stored (default path
             or not)
         """
-        _cachepath = os.path.join(self.cache, self.safe(key))
-        _fakepath = '%s.alt' % _cachepath
+        name = self.safe(key)
+        row = self._entry(key, 'location, namespace')
 
-        if os.path.exists(_fakepath) and not force_default:
-            f = file(_fakepath, "rb")
-            _altpath = f.read()
-            f.close()
-            return _altpath
-        else:
-            return _cachepath
+        if row is None:
+            return self._default(name, namespace(key))
+
+        if row[0] is not None and not force_default:
+            return row[0]
+
+        return self._default(name, row[1])
+
+
+class EntryWriter(object):
+    """ Writes the content of a cache entry, see `HTCache.writer`.
+
+        The content is written next to its location and renamed once
+        complete, readers see either the previous or the new file.
+    """
+    def __init__(self, cache, key, header, location, _cachepath, md5=None,
+                 share=False):
+        self._cache = cache
+        self._key = key
+        self._header = header
+        self._location = location
+        self._cachepath = _cachepath
+        self._temppath = temppath(_cachepath)
+        self._md5 = md5
+        self._share = share and md5 is not None
+
+        self._file = os.fdopen(os.open(self._temppath,
+                                       os.O_WRONLY | os.O_CREAT |
+                                       os.O_EXCL | getattr(os, 'O_BINARY', 0),
+                                       0o666), 'wb')
+
+    def write(self, chunk):
+        self._file.write(chunk)
+
+        if self._md5 is not None:
+            self._md5.update(chunk)
+
+    def commit(self):
+        """ Sets the entry to the content written.
+
+            Returns
+            -------
+            The path of the content file.
+        """
+        try:
+            size = self._file.tell()
+            self._file.close()
+        except:
+            self.abort()
+            raise
+
+        checksum = self._md5 and self._md5.hexdigest()
+
+        cache = self._cache
+        cache._commit(self._key, self._header, self._location, size,
+                      self._share and checksum or None, self._temppath,
+                      self._cachepath, checksum)
+
+        if cache.limit is not None and cache.usage() > cache.limit:
+            cache.evict(keep=cache.safe(self._key))
+
+        return self._cachepath
+
+    def abort(self):
+        """ Discards the content written, the entry is left unchanged.
+        """
+        self._file.close()
+        remove(self._temppath)
+
+
+class MemCache(object):
+    """ In-process cache of the recent responses, e.g. listings already
+        parsed into rows, bounded by the total size of its values and
+        dropping the least recently used first.
+
+        A value expires `ttl` seconds after it was set, or after the
+        lifespan of the policy matching its path, see `set_policy`. The
+        response is then requested again from the disk cache or the
+        server. A value is also removed when a resource it depends on is
+        modified, see `invalidate`. It is safe to use from several
+        threads.
+    """
+    def __init__(self, maxsize=32 * 1024 ** 2, ttl=1.0):
+        """
+            Parameters
+            ----------
+            maxsize: int
+                Maximum total size in bytes of the values.
+            ttl: float
+                Lifespan of the values in seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.size = 0
+
+        self._policies = []
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """ Returns a value, or `default` if there is none or it expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None:
+                return default
+
+            if time.time() - entry[2] >= (self.ttl if entry[4] is None
+                                          else entry[4]):
+                self.size -= entry[1]
+                return default
+
+            # most recently used last
+            self._entries[key] = entry
+
+            return entry[0]
+
+    def set(self, key, value, size=None, paths=()):
+        """ Sets a value.
+
+            Parameters
+            ----------
+            key: hashable
+                The value key.
+            value: object
+                The value, callers must not modify it afterwards.
+            size: int | None
+                Size of the value in bytes, its length if None, e.g.
+                the size of the response a listing was parsed from.
+            paths: list
+                Paths of the resources the value depends on, see
+                `uriutil.uri_path`. The first one selects the policy of
+                the value.
+        """
+        if size is None:
+            size = len(value)
+
+        ttl = None
+        for pattern, lifespan in self._policies:
+            if paths and pattern.match(paths[0]):
+                ttl = lifespan
+                break
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is not None:
+                self.size -= entry[1]
+
+            if size > self.maxsize:
+                return
+
+            self._entries[key] = (value, size, time.time(), tuple(paths),
+                                  ttl)
+            self.size += size
+
+            while self.size > self.maxsize:
+                self.size -= self._entries.popitem(last=False)[1][1]
+
+    def delete(self, key):
+        """ Removes a value, if any.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is not None:
+                self.size -= entry[1]
+
+    def set_policy(self, pattern, ttl):
+        """ Sets the lifespan of the values whose path matches a regular
+            expression, instead of `ttl`. The last policy set takes
+            precedence, None as `ttl` removes it. Values already set keep
+            their lifespan.
+        """
+        with self._lock:
+            self._policies = [policy for policy in self._policies
+                              if policy[0].pattern != pattern]
+
+            if ttl is not None:
+                self._policies.insert(0, (re.compile(pattern), ttl))
+
+    def invalidate(self, pattern):
+        """ Removes the values depending on a resource whose path matches
+            a regular expression, e.g. from `uriutil.uri_scope`.
+        """
+        match = re.compile(pattern).match
+
+        with self._lock:
+            for key, entry in self._entries.items():
+                if any(match(path) for path in entry[3]):
+                    del self._entries[key]
+                    self.size -= entry[1]
+
+    def clear(self):
+        """ Removes all the values.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
 
 
 class CacheManager(object):
@@ -235,6 +1379,7 @@ class CacheManager(object):
             - evaluate the size a the cache
             - check if there is space left on the disk
             - clear the cache
+            - limit the size of the cache
             - define cache usage parameters
     """
     def __init__(self, interface):
@@ -249,22 +1394,16 @@ class CacheManager(object):
         self._cache = interface._http.cache
         self._warn = True
 
+        for pattern, ttl in TTL_POLICIES:
+            self.set_ttl(pattern, ttl)
+
     def enable_warnings(self, toggle=True):
         self._warn = toggle
 
     def clear(self):
         """ Clears all files tracked by pyxnat.
         """
-        for _fakepath in glob.iglob('%s/*.alt' % self._cache.cache):
-            f = file(_fakepath, "rb")
-            _altpath = f.read()
-            f.close()
-
-            if os.path.exists(_altpath):
-                os.remove(_altpath)
-
-        shutil.rmtree(self._cache.cache)
-        os.makedirs(self._cache.cache)
+        self._cache.clear()
 
     def size(self, unit='bytes'):
         """ Returns the amount of space taken by the cache.
@@ -279,18 +1418,7 @@ class CacheManager(object):
             -------
             size: float
         """
-        size = 0
-
-        for cachefile in glob.iglob('%s/*' % self._cache.cache):
-            size += os.path.getsize(cachefile)
-
-            if cachefile.endswith('.alt'):
-                f = file(cachefile, "rb")
-                _altpath = f.read()
-                f.close()
-
-                if os.path.exists(_altpath):
-                    size += os.path.getsize(_altpath)
+        size = self._cache.usage() + self._cache.usage(custom=True)
 
         return bytes_to_human(size, unit)
 
@@ -364,6 +1492,33 @@ class CacheManager(object):
 
         return disk_ratio < ready_ratio, disk_ratio
 
+    def set_limit(self, size):
+        """ Sets the maximum size of the cache. When it is exceeded, the
+            least recently used entries are removed.
+
+            Files downloaded to a custom location with `File.get(dest)`
+            are not counted and never removed.
+
+            .. note::
+                A path returned by `File.get()` in the cache directory
+                may be removed when later downloads need the space.
+
+            Parameters
+            ----------
+            size: string | int | None
+                Maximum size e.g. '50G', '500M', or a number of bytes.
+                None removes the limit.
+
+            Examples
+            --------
+            >>> interface.cache.set_limit('50G')
+        """
+        if isinstance(size, basestring):
+            size = memstr_to_bytes(size)
+
+        self._cache.limit = size
+        self._cache.evict()
+
     def set_usage(self, mode=None, expiration=1.0):
         """ Customize cache usage.
 
@@ -380,7 +1535,8 @@ class CacheManager(object):
                 expiration mechanism. If two queries on the same
                 resource are issued under the specified value, the
                 cache will be used and the server will not be
-                requested.
+                requested. See `set_ttl` for the resources with their
+                own expiration.
         """
         if mode == 'online':
             self._intf._mode = 'online'
@@ -390,3 +1546,118 @@ class CacheManager(object):
             self._intf._memtimeout = expiration
         else:
             self._intf._memtimeout = expiration
+
+    def set_ttl(self, pattern, ttl):
+        """ Sets how long the responses of some resources are reused
+            without asking the server, in online mode. The others are
+            reused for the expiration given to `set_usage`.
+
+            Schemas and search metadata are reused for hours and the
+            list of projects for minutes by default, the prearchive is
+            always requested, see `TTL_POLICIES`.
+
+            Parameters
+            ----------
+            pattern: string
+                A glob pattern of the resources path, without server and
+                query string, e.g. '*/data/projects' or '*.xsd'. Or a
+                level of `schema.resources_tree` e.g. 'experiments' for
+                all the listings and elements of that level.
+            ttl: float | None
+                Lifespan in seconds, None reverts to the expiration of
+                `set_usage`.
+
+            Examples
+            --------
+            >>> interface.cache.set_ttl('experiments', 3600)
+            >>> interface.cache.set_ttl('*/data/projects/P1/*', 0)
+        """
+        if pattern in resources_tree:
+            pattern = '.*/%s(/[^/]+)?$' % re.escape(pattern)
+        else:
+            pattern = fnmatch.translate(pattern)
+
+        self._intf._memcache.set_policy(pattern, ttl)
+
+    def prefetch(self, scope, depth=None, include_files=False,
+                 include_xml=False, workers=8):
+        """ Fetches into the cache the listings of the collections below
+            some elements, following `schema.resources_tree`, so that
+            they can then be read in offline mode, e.g. on compute nodes
+            without access to the server.
+
+            The requests of each level of the hierarchy are sent
+            concurrently.
+
+            Parameters
+            ----------
+            scope: string | EObject | list
+                The elements to start from: a project ID, a path such as
+                /projects/P1/subjects/S1, an element, or a list or a
+                collection of those.
+            depth: int | None
+                Number of levels of collections listed below the scope,
+                e.g. 1 for the subjects of a project, 2 for their
+                experiments too. None lists them all.
+            include_files: boolean
+                Also download the files of the listed resources.
+            include_xml: boolean
+                Also fetch the XML document of the elements.
+            workers: int
+                Maximum number of concurrent requests.
+
+            Returns
+            -------
+            A dict with the number of listings, XML documents and files
+            fetched.
+
+            Examples
+            --------
+            >>> interface.cache.prefetch('P1', include_files=True)
+            >>> interface.cache.set_usage('offline')
+        """
+        if isinstance(scope, basestring) or hasattr(scope, 'children'):
+            scope = [scope]
+
+        elements = [self._intf.select.project(item)
+                    if isinstance(item, basestring) and '/' not in item
+                    else self._intf.select(item)
+                    if isinstance(item, basestring) else item
+                    for item in scope]
+
+        counts = {'listings': 0, 'xml': 0, 'files': 0}
+        pool = WorkerPool(workers)
+        level = 0
+
+        try:
+            while elements:
+                if include_xml:
+                    documents = [eobj for eobj in elements
+                                 if uri_nextlast(eobj._uri) in _xml_types]
+                    pool.map(lambda eobj: self._intf._exec(
+                        eobj._uri + '?format=xml', 'GET'), documents)
+                    counts['xml'] += len(documents)
+
+                if include_files:
+                    files = [eobj for eobj in elements
+                             if uri_nextlast(eobj._uri) == 'files']
+                    pool.map(lambda eobj: eobj.get(), files)
+                    counts['files'] += len(files)
+
+                if depth is not None and level >= depth:
+                    break
+
+                collections = [getattr(eobj, collection)()
+                               for eobj in elements
+                               for collection in resources_tree.get(
+                                   uri_nextlast(eobj._uri), [])]
+                children = pool.map(lambda cobj: cobj.get('obj'),
+                                    collections)
+                counts['listings'] += len(collections)
+
+                elements = [eobj for eobjs in children for eobj in eobjs]
+                level += 1
+        finally:
+            pool.shutdown()
+
+        return counts
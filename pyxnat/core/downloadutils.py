@@ -129,9 +129,9 @@ def download (dest_dir, instance=None,type="ALL",name=None, extract=False, safe=
             raise EnvironmentError("Unable to download to " + zip_location + " because this file already exists.")
 
     # Download from the server
-    instance._intf._http.cache.preset(zip_location)
-    instance._intf._exec(uriutil.join_uri(
-            instance._cbase,','.join(types.values())) + '/files?format=zip')
+    instance._intf._get_file(uriutil.join_uri(
+            instance._cbase,','.join(types.values())) + '/files?format=zip',
+                             zip_location)
 
     # Extract the archive
     fzip = zipfile.ZipFile(zip_location,'r')
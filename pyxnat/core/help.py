@@ -10,6 +10,7 @@ except:
 import json
 
 from . import schema
+from .cache import STRUCT
 from .jsonutil import get_column
 from .search import Search
 from .uriutil import check_entry
@@ -334,7 +335,8 @@ class Inspector(object):
     def _resource_struct(self, name):
         kbase = {}
 
-        for kfile in glob.iglob('%s/*.struct' % self._intf._cachedir):
+        for kfile in glob.iglob('%s/%s/*.struct' % (self._intf._cachedir,
+                                                   STRUCT)):
             kdata = json.load(open(kfile, 'rb'))
             if kdata == {}:
                 continue
@@ -1,21 +1,722 @@
+from __future__ import with_statement
+
+import os
+import re
+import socket
+import threading
+import zlib
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+try:
+    from urlparse import urljoin, urlparse
+except ImportError:
+    from urllib.parse import urljoin, urlparse
+
+from email.message import Message
+
+import httplib2
+
+
+# size of the blocks read from or written to the network
+CHUNK_SIZE = 64 * 1024
+
+_redirect_codes = [301, 302, 303, 307, 308]
+
+# headers holding the credentials of the user, only sent to the host
+# they are meant for
+_credential_headers = ['authorization', 'cookie']
 
 _boundary = '----------ThIs_Is_tHe_bouNdaRY_$'
 _crlf = '\r\n'
 
 
+def multipart_parts(content_type, path, name):
+    """ Returns the strings to put before and after the content of a file
+        in a multipart/form-data message.
+    """
+    preamble = _crlf.join(['--' + _boundary,
+                           'Content-Disposition: form-data; '
+                           'name="%s"; filename="%s"' % (path, name),
+                           'Content-Type: %s' % content_type,
+                           '',
+                           ''
+                           ])
+
+    epilogue = _crlf.join(['', '--' + _boundary + '--', ''])
+
+    return preamble, epilogue
+
+
 def file_message(content, content_type, path, name):
-    body = []
-    body.append('--' + _boundary)
-    body.append('Content-Disposition: form-data; '
-                'name="%s"; filename="%s"' % (path, name)
-                )
-    body.append('Content-Type: %s' % content_type)
-    body.append('')
+    preamble, epilogue = multipart_parts(content_type, path, name)
 
-    body.append(content)
-    body.append('--' + _boundary + '--')
-    body.append('')
-    body = _crlf.join(body)
+    body = preamble + content + epilogue
     content_type = 'multipart/form-data; boundary=%s' % _boundary
 
     return body, content_type
+
+
+class MultipartFile(object):
+    """ Streamed equivalent of `file_message`.
+
+        The multipart/form-data message is produced on demand while it is
+        sent, so that uploading a file takes a constant amount of memory
+        whatever its size. The file is read in large blocks, or handed to
+        os.sendfile when the platform and the connection allow it.
+    """
+    def __init__(self, content_type, path, name, src=None, content=None,
+                 progress=None, chunk_size=CHUNK_SIZE):
+        """
+            Parameters
+            ----------
+            content_type: string
+                Content type of the file.
+            path: string
+                Name of the form field.
+            name: string
+                Name of the file.
+            src: string | None
+                Path of the file to upload.
+            content: string | None
+                Content to upload when `src` is None.
+            progress: callable | None
+                Called as progress(sent, total) every time a block of the
+                message is sent.
+            chunk_size: int
+                Size of the blocks read from the file.
+        """
+        self._preamble, self._epilogue = multipart_parts(content_type,
+                                                         path, name)
+
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+
+        self._src = src
+        self._content = content
+        self._progress = progress
+        self._chunk_size = chunk_size
+        self._sent = 0
+
+        if src is not None:
+            self._size = os.path.getsize(src)
+        else:
+            self._size = len(content)
+
+        self.content_type = 'multipart/form-data; boundary=%s' % _boundary
+
+    def __len__(self):
+        return len(self._preamble) + self._size + len(self._epilogue)
+
+    def rewind(self):
+        """ Prepares the message to be sent again.
+        """
+        self._sent = 0
+
+    def _sent_bytes(self, count):
+        self._sent += count
+
+        if self._progress is not None:
+            self._progress(self._sent, len(self))
+
+    def segments(self):
+        """ Yields the message as strings or as (file, offset, count)
+            tuples for the file content.
+        """
+        yield self._preamble
+
+        if self._src is not None:
+            fp = open(self._src, 'rb')
+            try:
+                yield (fp, 0, self._size)
+            finally:
+                fp.close()
+        else:
+            yield self._content
+
+        yield self._epilogue
+
+    def __iter__(self):
+        """ Yields the message in blocks of at most `chunk_size` bytes.
+        """
+        for segment in self.segments():
+            if isinstance(segment, tuple):
+                fp, offset, count = segment
+                fp.seek(offset)
+
+                while count > 0:
+                    chunk = fp.read(min(self._chunk_size, count))
+                    if not chunk:
+                        break
+
+                    count -= len(chunk)
+                    yield chunk
+            else:
+                for start in range(0, len(segment), self._chunk_size):
+                    yield segment[start:start + self._chunk_size]
+
+    def send(self, conn):
+        """ Writes the message on an open httplib connection.
+        """
+        sendfile = getattr(os, 'sendfile', None)
+        sock = conn.sock
+
+        # sendfile needs a plain socket, not an SSL wrapped one
+        if sendfile is None or type(sock) is not socket.socket:
+            for chunk in self:
+                conn.send(chunk)
+                self._sent_bytes(len(chunk))
+            return
+
+        for segment in self.segments():
+            if isinstance(segment, tuple):
+                fp, offset, count = segment
+
+                while count > 0:
+                    sent = sendfile(sock.fileno(), fp.fileno(), offset,
+                                    min(self._chunk_size, count))
+                    if sent == 0:
+                        raise IOError('%s: unexpected end of file'
+                                      % self._src)
+
+                    offset += sent
+                    count -= sent
+                    self._sent_bytes(sent)
+            elif segment:
+                conn.send(segment)
+                self._sent_bytes(len(segment))
+
+
+def host_key(uri):
+    """ Returns the scheme:authority key identifying the host of an URI,
+        the same way httplib2 keys its connections.
+    """
+    scheme, authority = httplib2.urlnorm(uri)[:2]
+    return '%s:%s' % (scheme, authority)
+
+
+def origin(uri):
+    """ Returns the (scheme, host, port) of an URI, with the default port
+        of the scheme if it has none.
+    """
+    parts = urlparse(uri)
+    scheme = parts.scheme.lower()
+
+    return scheme, (parts.hostname or '').lower(), \
+        parts.port or {'http': 80, 'https': 443}.get(scheme)
+
+
+def redirect_headers(uri, location, headers):
+    """ Returns the headers of a request of `uri` to send again to the
+        `location` it is redirected to. The credentials are removed when
+        the location is on another host, e.g. a storage server for the
+        files.
+
+        Raises
+        ------
+        httplib2.HttpLib2Error if the redirection is from https to http.
+    """
+    source, target = origin(uri), origin(location)
+
+    if source[0] == 'https' and target[0] != 'https':
+        raise httplib2.HttpLib2Error(
+            'Redirection of %s to insecure %s refused' % (uri, location))
+
+    if source == target:
+        return headers
+
+    return dict((key, value) for key, value in headers.items()
+                if key not in _credential_headers)
+
+
+class HostPool(object):
+    """ Bounded set of HTTP clients for a single host.
+    """
+    def __init__(self, factory, maxsize):
+        """
+            Parameters
+            ----------
+            factory: callable
+                Returns a new, configured, httplib2.Http object.
+            maxsize: int
+                Maximum number of clients simultaneously checked out.
+        """
+        self._factory = factory
+        self._free = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+        self.maxsize = maxsize
+
+    def acquire(self, block=True):
+        """ Checks out a client. Waits for a free slot if `block` is True,
+            otherwise the bound is not enforced.
+        """
+        if block:
+            self._slots.acquire()
+
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+
+        try:
+            return self._factory()
+        except:
+            if block:
+                self._slots.release()
+            raise
+
+    def release(self, client, block=True):
+        """ Checks a client back in.
+        """
+        with self._lock:
+            if len(self._free) < self.maxsize:
+                self._free.append(client)
+                client = None
+
+        if client is not None:
+            close_client(client)
+
+        if block:
+            self._slots.release()
+
+    def clear(self):
+        with self._lock:
+            free, self._free = self._free, []
+
+        for client in free:
+            close_client(client)
+
+
+def close_client(client):
+    """ Closes the connections held by an httplib2.Http object.
+    """
+    for conn in list(client.connections.values()):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    client.connections.clear()
+
+
+def get_connection(client, uri):
+    """ Returns the connection of an httplib2.Http object for the host
+        of `uri`, creating it with the client settings if needed.
+    """
+    scheme, authority = httplib2.urlnorm(uri)[:2]
+    conn_key = '%s:%s' % (scheme, authority)
+
+    conn = client.connections.get(conn_key)
+
+    if conn is None:
+        if hasattr(client, '_get_proxy_info'):
+            proxy_info = client._get_proxy_info(scheme, authority)
+        else:
+            proxy_info = client.proxy_info
+
+        connection_type = httplib2.SCHEME_TO_CONNECTION[scheme]
+
+        if scheme == 'https':
+            conn = connection_type(
+                authority, timeout=client.timeout, proxy_info=proxy_info,
+                ca_certs=client.ca_certs,
+                disable_ssl_certificate_validation=\
+                    client.disable_ssl_certificate_validation
+                )
+        else:
+            conn = connection_type(authority, timeout=client.timeout,
+                                   proxy_info=proxy_info)
+
+        client.connections[conn_key] = conn
+
+    return conn
+
+
+def cache_headers(response, uri=None):
+    """ Formats response headers the way httplib2 stores them in its
+        cache, i.e. a status line and the headers terminated by an empty
+        line.
+    """
+    info = Message()
+
+    for key, value in response.items():
+        if key not in ['status', 'content-encoding', 'transfer-encoding']:
+            info[key] = value
+
+    if uri is not None and 'content-location' not in info:
+        info['content-location'] = uri
+
+    status = response.status if response.status != 304 else 200
+    header_str = re.sub('\r(?!\n)|(?<!\r)\n', '\r\n', info.as_string())
+
+    return 'status: %d\r\n%s' % (status, header_str)
+
+
+class _Inflate(object):
+    """ Incremental decoder for the deflate content-encoding, which some
+        servers send with a zlib header and others without.
+    """
+    def __init__(self):
+        self._decoder = None
+
+    @property
+    def unconsumed_tail(self):
+        if self._decoder is None:
+            return ''
+
+        return self._decoder.unconsumed_tail
+
+    def decompress(self, data, max_length=0):
+        if self._decoder is None:
+            head = bytearray(data[:2])
+            wrapped = len(head) == 2 and head[0] & 0x0f == 8 \
+                and (head[0] * 256 + head[1]) % 31 == 0
+
+            self._decoder = zlib.decompressobj(
+                zlib.MAX_WBITS if wrapped else -zlib.MAX_WBITS)
+
+        return self._decoder.decompress(data, max_length)
+
+    def flush(self):
+        if self._decoder is None:
+            return ''
+
+        return self._decoder.flush()
+
+
+def decompressor(encoding):
+    """ Returns an incremental decoder for a content-encoding, or None if
+        the body is not encoded or the encoding is unknown.
+    """
+    encoding = (encoding or '').strip().lower()
+
+    if encoding in ['gzip', 'x-gzip']:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == 'deflate':
+        return _Inflate()
+
+    return None
+
+
+class StreamResponse(object):
+    """ Response whose body is read from the network on demand.
+
+        The pooled client is held until the body is consumed or the
+        response is closed.
+
+        A gzip or deflate encoded body is decoded as it is read. Its
+        headers then look like those of an httplib2 response, i.e. the
+        content-encoding is renamed -content-encoding and the
+        content-length is dropped. `wire_bytes` and `decoded_bytes` count
+        the bytes received from the network and the bytes returned.
+    """
+    def __init__(self, pool, ticket, conn, response, uri):
+        self._pool = pool
+        self._ticket = ticket
+        self._conn = conn
+        self._response = response
+
+        self.uri = uri
+        self.headers = httplib2.Response(response)
+        self.status = response.status
+        self.reason = response.reason
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+        self._decoder = decompressor(self.headers.get('content-encoding'))
+
+        if self._decoder is not None:
+            self.headers['-content-encoding'] = \
+                self.headers.pop('content-encoding')
+            self.headers.pop('content-length', None)
+
+    def _read(self, amt):
+        if self._ticket is None:
+            return ''
+
+        data = self._response.read() if amt is None \
+            else self._response.read(amt)
+        self.wire_bytes += len(data)
+
+        # httplib returns a body cut short by the server as if complete
+        if not data and self._response.length:
+            self.close()
+            raise httplib.IncompleteRead('', self._response.length)
+
+        return data
+
+    def _decode(self, amt):
+        while True:
+            data = self._decoder.unconsumed_tail or self._read(amt)
+
+            if not data:
+                return self._decoder.flush()
+
+            data = self._decoder.decompress(data, amt or 0)
+
+            # the first bytes of a stream may only hold its header
+            if data:
+                return data
+
+    def read(self, amt=None):
+        """ Reads at most `amt` bytes of the body, or all of it.
+        """
+        if self._decoder is None:
+            data = self._read(amt)
+        else:
+            try:
+                data = self._decode(amt)
+            except zlib.error:
+                self.close()
+                encoding = self.headers.get('-content-encoding')
+                raise httplib2.FailedToDecompressContent(
+                    'Content purported to be compressed with %s but '
+                    'failed to decompress.' % encoding, self.headers, '')
+
+        self.decoded_bytes += len(data)
+
+        if amt is None or not data:
+            self.close()
+
+        return data
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        """ Yields the body in chunks of at most `chunk_size` bytes.
+        """
+        try:
+            while True:
+                chunk = self.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        """ Gives the connection back to the pool. A connection whose
+            response was not entirely read cannot be reused.
+        """
+        if self._ticket is None:
+            return
+
+        if not self._response.isclosed():
+            self._response.close()
+            self._conn.close()
+
+        ticket, self._ticket = self._ticket, None
+        self._pool.release(ticket)
+        self._pool.count(self.wire_bytes, self.decoded_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def send_request(conn, method, request_uri, body, headers):
+    """ Sends a request on an httplib connection. Bodies that are not
+        strings must provide a `send(conn)` method and a length, e.g.
+        :class:`MultipartFile`.
+    """
+    if body is None or isinstance(body, str):
+        conn.request(method, request_uri, body, headers)
+        return
+
+    conn.putrequest(method, request_uri,
+                    skip_host='host' in headers,
+                    skip_accept_encoding='accept-encoding' in headers)
+
+    if 'content-length' not in headers:
+        conn.putheader('content-length', str(len(body)))
+
+    for key, value in headers.items():
+        conn.putheader(key, value)
+
+    conn.endheaders()
+    body.send(conn)
+
+
+def set_timeout(client, timeout):
+    """ Sets the timeout of an httplib2.Http object, including on its
+        already opened connections.
+    """
+    client.timeout = timeout
+
+    for conn in client.connections.values():
+        conn.timeout = timeout
+        if getattr(conn, 'sock', None) is not None:
+            conn.sock.settimeout(timeout)
+
+
+class ConnectionPool(object):
+    """ Thread-safe replacement for a single httplib2.Http object.
+
+        httplib2.Http objects hold their connections and part of the
+        request state as attributes, so they cannot be shared between
+        threads. The pool hands out one client per request and per thread
+        and keeps at most `maxsize` of them busy for a given host, others
+        wait for a client to be released. A thread that already holds a
+        client for a host, e.g. while it consumes a response, is never
+        blocked by the bound to avoid deadlocks on nested requests.
+
+        The pool exposes the same `request` method and `cache` attribute
+        as the httplib2.Http object it replaces. `wire_bytes` and
+        `decoded_bytes` add up the bytes of the bodies received through
+        `urlopen`, before and after they are decompressed.
+    """
+    def __init__(self, cache, factory, maxsize=16):
+        """
+            Parameters
+            ----------
+            cache:
+                :class:`HTCache` shared by all the clients.
+            factory: callable
+                Returns a new httplib2.Http object using `cache`.
+            maxsize: int
+                Maximum number of concurrent requests per host.
+        """
+        self.cache = cache
+        self.maxsize = maxsize
+
+        self._factory = factory
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def count(self, wire_bytes, decoded_bytes):
+        """ Adds the size of a response body to the byte counters.
+        """
+        with self._lock:
+            self.wire_bytes += wire_bytes
+            self.decoded_bytes += decoded_bytes
+
+    def _host_pool(self, key):
+        with self._lock:
+            if key not in self._hosts:
+                self._hosts[key] = HostPool(self._factory, self.maxsize)
+
+            return self._hosts[key]
+
+    def _held(self):
+        if not hasattr(self._local, 'held'):
+            self._local.held = {}
+
+        return self._local.held
+
+    def acquire(self, uri):
+        """ Checks out a client for the host of `uri`.
+
+            Returns
+            -------
+            A (host_key, client, blocking, held) tuple to give back to
+            `release`, `held` being the counts of the acquiring thread.
+        """
+        key = host_key(uri)
+        held = self._held()
+
+        with self._lock:
+            block = held.get(key, 0) == 0
+
+        client = self._host_pool(key).acquire(block)
+
+        with self._lock:
+            held[key] = held.get(key, 0) + 1
+
+        return key, client, block, held
+
+    def release(self, ticket):
+        """ Gives back a client obtained with `acquire`, possibly from
+            another thread, e.g. when a streamed response is closed by
+            the consumer of a generator.
+        """
+        key, client, block, held = ticket
+
+        with self._lock:
+            held[key] -= 1
+
+        self._host_pool(key).release(client, block)
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                timeout=None, **kwargs):
+        """ Same as httplib2.Http.request, with an optional timeout for
+            this request only.
+        """
+        ticket = self.acquire(uri)
+        client = ticket[1]
+
+        try:
+            set_timeout(client, timeout)
+            return client.request(uri, method, body, headers, **kwargs)
+        finally:
+            set_timeout(client, None)
+            self.release(ticket)
+
+    def urlopen(self, uri, method='GET', body=None, headers=None,
+                timeout=None, redirections=5):
+        """ Sends a request and returns as soon as the response headers
+            are received.
+
+            Unlike `request`, the body is neither read nor cached: it is
+            left to the caller to consume it from the returned
+            :class:`StreamResponse`, in constant memory. Redirections are
+            followed for GET and HEAD requests.
+        """
+        headers = dict((key.lower(), value)
+                       for key, value in (headers or {}).items())
+
+        ticket = self.acquire(uri)
+        client = ticket[1]
+        request_uri = httplib2.urlnorm(uri)[2]
+
+        try:
+            set_timeout(client, timeout)
+
+            for attempt in range(2):
+                conn = get_connection(client, uri)
+                try:
+                    send_request(conn, method, request_uri, body, headers)
+                    response = conn.getresponse()
+                    break
+                except (socket.error, httplib.HTTPException):
+                    # the server may have closed an idle connection
+                    conn.close()
+                    if attempt or not (body is None
+                                       or isinstance(body, str)
+                                       or hasattr(body, 'rewind')):
+                        raise
+
+                    if hasattr(body, 'rewind'):
+                        body.rewind()
+        except:
+            self.release(ticket)
+            raise
+
+        stream = StreamResponse(self, ticket, conn, response, uri)
+
+        if response.status in _redirect_codes and redirections > 0 \
+                and method in ['GET', 'HEAD'] \
+                and 'location' in stream.headers:
+
+            stream.read()
+            location = urljoin(uri, stream.headers['location'])
+
+            return self.urlopen(location, method, body,
+                                redirect_headers(uri, location, headers),
+                                timeout, redirections - 1)
+
+        return stream
+
+    def clear(self):
+        """ Closes all the idle connections.
+        """
+        with self._lock:
+            hosts = list(self._hosts.values())
+
+        for host_pool in hosts:
+            host_pool.clear()
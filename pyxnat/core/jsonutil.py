@@ -1,5 +1,15 @@
+from __future__ import absolute_import
+
+import re
+import gc
+import sys
 import csv
 import copy
+import mmap
+import struct
+from array import array
+from itertools import izip, compress
+from collections import OrderedDict
 from fnmatch import fnmatch
 try:
     from StringIO import StringIO
@@ -8,23 +18,139 @@ except ImportError:
 
 import json
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # jdata is a list of dicts
 
-def join_tables(join_column, jdata, *jtables):
-    indexes = []
+def join_tables(join_column, jdata, *jtables, **kwargs):
+    """ Joins tables on the values of one or more common columns, with
+        a hash join whose cost grows linearly with the size of the tables
+        and of the result. The tables are joined from left to right and
+        are not modified.
 
-    for jtable in [jdata]+list(jtables):
-        if isinstance(jtable, dict):
-            jtable = [jtable]
-        index = {}
-        [index.setdefault(entry[join_column], entry) for entry in jtable]
-        indexes.append(index)
+        Parameters
+        ----------
+        join_column: string | list
+            The column, or the columns, that the rows of the tables must
+            have in common. They must be in every table.
+        jdata: list
+            The first table, as a list of dicts.
+        jtables: *args
+            The other tables.
+        how: inner | left | outer
+            Keyword argument, inner by default. Whether only the rows
+            found in every table are returned, or all the rows of the
+            first table, or all the rows of every table. The values of
+            the columns of a table in which a row is not found are None.
+            Rows with a None value in the join columns match no row.
+        suffixes: list
+            Keyword argument, one suffix per table. It is added to the
+            name of the other columns of the table that are in several
+            tables. By default they are not renamed and take the value
+            of the last table in which the row is found.
+
+        Returns
+        -------
+        The list of dicts of the joined rows.
+    """
+    how = kwargs.pop('how', 'inner')
+    suffixes = kwargs.pop('suffixes', None)
+
+    if kwargs:
+        raise TypeError('unexpected keyword arguments: %s'
+                        % ', '.join(kwargs))
+
+    if how not in ['inner', 'left', 'outer']:
+        raise ValueError('how must be inner, left or outer, not %s' % how)
+
+    keys = [join_column] if isinstance(join_column, basestring) \
+        else list(join_column)
+    tables = [[jtable] if isinstance(jtable, dict) else jtable
+              for jtable in [jdata] + list(jtables)]
+
+    if suffixes is not None and len(suffixes) != len(tables):
+        raise ValueError('%s suffixes for %s tables'
+                         % (len(suffixes), len(tables)))
+
+    # the other columns of each table, and their names in the result
+    columns = [[col for col in get_headers(jtable) if col not in keys]
+               for jtable in tables]
+    counts = {}
+    for col in [col for cols in columns for col in cols]:
+        counts[col] = counts.get(col, 0) + 1
+
+    names = [[(col, col + suffix if counts[col] > 1 else col)
+              for col in cols]
+             for cols, suffix in zip(columns, suffixes or [''] * len(tables))]
+
+    def key(entry):
+        return tuple([entry.get(col) for col in keys])
+
+    def matchable(value):
+        return None not in value
+
+    def renamer(names):
+        # the rows of a table without renamed columns are only read
+        if all(col == name for col, name in names):
+            return lambda entry: entry
+
+        return lambda entry: dict([(name, entry.get(col))
+                                   for col, name in names])
 
     merged_jdata = []
-    for join_id in indexes[0].keys():
-        for index in indexes[1:]:
-            indexes[0][join_id].update(index[join_id])
-            merged_jdata.append(indexes[0][join_id])
+    renamed = renamer(names[0])
+    for entry in tables[0]:
+        merged = dict(renamed(entry))
+        merged.update(izip(keys, key(entry)))
+        merged_jdata.append(merged)
+
+    empty = dict((name, None) for col, name in names[0])
+
+    for jtable, table_names in zip(tables[1:], names[1:]):
+        renamed = renamer(table_names)
+        index = {}
+        for entry in jtable:
+            value = key(entry)
+
+            if matchable(value):
+                index.setdefault(value, []).append(renamed(entry))
+
+        # the columns already in the result keep their value
+        missing = dict((name, None) for col, name in table_names
+                       if name not in empty)
+        found = set()
+        joined = []
+
+        for entry in merged_jdata:
+            value = key(entry)
+            matches = index.get(value) if matchable(value) else None
+
+            if matches is not None:
+                found.add(value)
+
+                for match in matches:
+                    merged = dict(entry)
+                    merged.update(match)
+                    joined.append(merged)
+
+            elif how != 'inner':
+                merged = dict(entry)
+                merged.update(missing)
+                joined.append(merged)
+
+        if how == 'outer':
+            for entry in jtable:
+                if key(entry) not in found:
+                    merged = dict(empty)
+                    merged.update(renamed(entry))
+                    merged.update(izip(keys, key(entry)))
+                    joined.append(merged)
+
+        merged_jdata = joined
+        empty.update(missing)
 
     return merged_jdata
 
@@ -105,6 +231,317 @@ def csv_to_json(csv_str):
 
     return [dict(zip(headers, entry)) for entry in csv_reader]
 
+def iter_lines(chunks):
+    """ Yields the lines, with their line break, of a text received in
+        chunks of any size.
+    """
+    tail = ''
+
+    for chunk in chunks:
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+
+        for line in lines:
+            yield line + '\n'
+
+    if tail:
+        yield tail
+
+def iter_csv_to_json(chunks):
+    """ Same as csv_to_json for a csv document received in chunks, e.g.
+        from a response body. Every row is yielded as soon as its chunk
+        is received.
+    """
+    csv_reader = csv.reader(iter_lines(chunks), delimiter=',', quotechar='"')
+
+    try:
+        headers = csv_reader.next()
+    except StopIteration:
+        return
+
+    for entry in csv_reader:
+        yield dict(zip(headers, entry))
+
+def csv_to_columns(csv_str):
+    """ Parses a csv document into columns, without building a dict
+        for every row.
+
+        Returns
+        -------
+        The headers and the columns as tuples of strings in the same
+        order. When a header is repeated its last column is kept, as
+        csv_to_json does. Blank lines are skipped, and the rows shorter
+        than the headers are completed with empty strings.
+    """
+    csv_reader = csv.reader(StringIO(csv_str), delimiter=',', quotechar='"')
+    headers = csv_reader.next()
+    width = len(headers)
+
+    # the rows and columns only hold strings, the collector would scan
+    # them again and again while they are allocated
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rows = list(csv_reader)
+
+        # zip stops at the shortest row
+        if any(len(row) != width for row in rows):
+            rows = [row[:width] + [''] * (width - len(row))
+                    for row in rows if row]
+
+        columns = zip(*rows) or [()] * width
+    finally:
+        if enabled:
+            gc.enable()
+
+    last = dict((header, i) for i, header in enumerate(headers))
+    keep = [i for i, header in enumerate(headers) if last[header] == i]
+
+    return [headers[i] for i in keep], [columns[i] for i in keep]
+
+
+# columnar form of a table, see dump_columns
+_COLUMNS_MAGIC = 'PYXCOL01'
+
+_int_re = re.compile(r'^(0|-?[1-9][0-9]{0,9})$')
+
+def _encode_strings(values):
+    offsets = array('I', [0])
+
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+
+    return [offsets, ''.join(values)]
+
+def _encode_column(values):
+    """ Returns the kind of a column of strings and its encoded blocks:
+        `i` 32 bits integers, `f` floats, `c` codes in a table of the
+        distinct strings, else `s` strings.
+    """
+    if values and all(_int_re.match(value) for value in values):
+        ints = [int(value) for value in values]
+
+        if -2 ** 31 <= min(ints) and max(ints) < 2 ** 31:
+            return 'i', [array('i', ints)]
+
+    try:
+        floats = [float(value) for value in values]
+    except ValueError:
+        floats = None
+
+    # only the floats written back the same way
+    if values and floats is not None and \
+            all(repr(f) == value for f, value in izip(floats, values)):
+        return 'f', [array('d', floats)]
+
+    table = sorted(set(values))
+
+    if len(table) <= len(values) // 4:
+        codes = dict((value, i) for i, value in enumerate(table))
+
+        return 'c', [array('I', [codes[value] for value in values])] + \
+            _encode_strings(table)
+
+    return 's', _encode_strings(values)
+
+def _decode_strings(offsets, blob):
+    return [blob[start:end] for start, end in izip(offsets, offsets[1:])]
+
+def dump_columns(headers, rows, dest, meta=None):
+    """ Writes a table of strings, e.g. a listing parsed by csv_to_json, in
+        a compact columnar binary form that `load_columns` reads without
+        parsing.
+
+        Columns of integers and floats are stored as arrays, columns with
+        few distinct values as codes in a table of these values.
+
+        Parameters
+        ----------
+        headers: list
+            The columns, every row must have them all.
+        rows: list
+            The rows as dicts of strings.
+        dest: string
+            The file path.
+        meta: object
+            JSON serializable data stored along with the table.
+    """
+    blocks = []
+    columns = []
+    offset = 0
+
+    for header in headers:
+        kind, encoded = _encode_column([row[header] for row in rows])
+        spans = []
+
+        for block in encoded:
+            if isinstance(block, array):
+                if sys.byteorder == 'big':
+                    block.byteswap()
+                block = block.tostring()
+
+            spans.append((offset, len(block)))
+            blocks.append(block)
+
+            # arrays are aligned on 8 bytes
+            padding = -len(block) % 8
+            blocks.append('\0' * padding)
+            offset += len(block) + padding
+
+        columns.append((header, kind, spans))
+
+    header = json.dumps({'rows': len(rows), 'columns': columns,
+                         'meta': meta})
+    header += ' ' * (-(len(header) + 12) % 8)
+
+    f = open(dest, 'wb')
+    try:
+        f.write(_COLUMNS_MAGIC + struct.pack('<I', len(header)) + header)
+        for block in blocks:
+            f.write(block)
+    finally:
+        f.close()
+
+def load_columns(src):
+    """ Reads a table written by `dump_columns`, through a memory map of
+        the file.
+
+        Returns
+        -------
+        The headers, the columns as lists of strings or arrays of numbers
+        in the same order, and the meta data.
+    """
+    f = open(src, 'rb')
+    try:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+    try:
+        if buf[:8] != _COLUMNS_MAGIC:
+            raise ValueError('%s is not a columns file' % src)
+
+        size = struct.unpack('<I', buf[8:12])[0]
+        header = json.loads(buf[12:12 + size])
+        start = 12 + size
+
+        def block(span, typecode=None):
+            data = buf[start + span[0]:start + span[0] + span[1]]
+
+            if typecode is None:
+                return data
+
+            values = array(typecode)
+            values.fromstring(data)
+
+            if sys.byteorder == 'big':
+                values.byteswap()
+
+            return values
+
+        headers = []
+        columns = []
+
+        for name, kind, spans in header['columns']:
+            if kind == 'i':
+                column = block(spans[0], 'i')
+            elif kind == 'f':
+                column = block(spans[0], 'd')
+            elif kind == 'c':
+                table = _decode_strings(block(spans[1], 'I'), block(spans[2]))
+                column = [table[code] for code in block(spans[0], 'I')]
+            else:
+                column = _decode_strings(block(spans[0], 'I'),
+                                         block(spans[1]))
+
+            headers.append(name)
+            columns.append(column)
+    finally:
+        buf.close()
+
+    return headers, columns, header['meta']
+
+def columns_to_json(headers, columns):
+    """ Returns the rows, as csv_to_json does, of the columns read by
+        `load_columns`.
+    """
+    columns = [[repr(value) for value in column] if isinstance(column, array)
+               and column.typecode == 'd' else
+               [str(value) for value in column] if isinstance(column, array)
+               else column
+               for column in columns]
+
+    return [dict(izip(headers, values)) for values in izip(*columns)]
+
+# values of the columns whose type is inferred, see infer_column, the
+# integers are exactly represented by floats
+_types = [
+    (re.compile(r'^(0|-?[1-9][0-9]{0,14})$'), 'int64'),
+    (re.compile(r'^-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][-+]?[0-9]+)?$'),
+     'float64'),
+    (re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}$'), 'datetime64[D]'),
+    (re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}[ T]'
+                r'[0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?$'),
+     'datetime64[ms]'),
+    ]
+
+def infer_column(column):
+    """ Converts a column of strings to a numpy array of numbers or
+        dates if all its values are written as such, e.g. 42, -1.5e3,
+        2020-01-31 or 2020-01-31 12:00:00. Numbers with leading zeros
+        are not converted, they are usually identifiers.
+
+        Missing values, empty strings or None, become NaN or NaT. An
+        integer column with missing values is converted to floats.
+
+        Returns
+        -------
+        A numpy array, of objects if the type of the column is not
+        inferred.
+    """
+    values = _column(column) if numpy is None or \
+        not isinstance(column, numpy.ndarray) else column
+    first = next((value for value in values if value not in ['', None]),
+                 None)
+
+    if not isinstance(first, basestring):
+        return values
+
+    # most columns of text are told apart by their first value
+    types = [(regexp, dtype) for regexp, dtype in _types
+             if regexp.match(first)]
+
+    if not types:
+        return values
+
+    missing = (values == '') | numpy.equal(values, None)
+    present = values[~missing]
+    distinct = set(present.tolist())
+
+    if not all(isinstance(value, basestring) for value in distinct):
+        return values
+
+    for regexp, dtype in types:
+        if not all(regexp.match(value) for value in distinct):
+            continue
+
+        if dtype == 'int64' and missing.any():
+            dtype = 'float64'
+
+        if dtype.startswith('datetime64'):
+            typed = numpy.empty(len(values), dtype=dtype)
+            typed[missing] = numpy.datetime64('NaT')
+            typed[~missing] = present.astype(dtype)
+        else:
+            # numpy parses floats much faster than integers
+            typed = numpy.empty(len(values), dtype='float64')
+            typed[missing] = numpy.nan
+            typed[~missing] = present.astype('float64')
+            typed = typed.astype(dtype, copy=False)
+
+        return typed
+
+    return values
 
 class JsonTable(object):
     """ Wrapper around a list of dictionnaries to provide utility functions.
@@ -112,6 +549,7 @@ class JsonTable(object):
     def __init__(self, jdata, order_by=[]):
         self.data = jdata
         self.order_by = order_by
+        self._indexes = {}
 
     def __repr__(self):
         # if len(self.data) == 0:
@@ -161,19 +599,24 @@ class JsonTable(object):
     def __getslice__(self, i, j):
         return self.__class__(self.data[i:j], self.order_by)
 
-    def join(self, join_column, *jtables):
-        """ Join jsontables with a common column.
+    def join(self, join_column, *jtables, **kwargs):
+        """ Join jsontables with one or more common columns.
 
             Parameters
             ----------
-            join_column: string
-                The name or header of the join column.
+            join_column: string | list
+                The name or header of the join column, or a list of
+                them.
             jtables: *args
                 Other  jtables.
+            how: inner | left | outer
+                Keyword argument, see `join_tables`.
+            suffixes: list
+                Keyword argument, see `join_tables`.
         """
         return self.__class__(
             join_tables(join_column, self.data, 
-                        *[jtable.data for jtable in jtables]),
+                        *[jtable.data for jtable in jtables], **kwargs),
             self.order_by
             )
 
@@ -207,6 +650,56 @@ class JsonTable(object):
             return res[0]
         return res
 
+    def index(self, col):
+        """ Builds a hash index of a column, which `where` then uses to
+            find the entries with a given value of the column without
+            scanning the table. The index is built once and kept with
+            the table.
+
+            .. note::
+                The index is not updated if `data` is modified.
+
+            Parameters
+            ----------
+            col: string
+                The column name.
+
+            Returns
+            -------
+            A dict of the values of the column to the positions of the
+            entries that have them.
+        """
+        if col not in self._indexes:
+            index = {}
+
+            for i, entry in enumerate(self.data):
+                if col in entry:
+                    index.setdefault(entry[col], []).append(i)
+
+            self._indexes[col] = index
+
+        return self._indexes[col]
+
+    def _at(self, positions):
+        """ Returns the entries at some positions.
+        """
+        return self.__class__([self.data[i] for i in positions],
+                              self.order_by)
+
+    def _lookup(self, kwargs):
+        """ Returns the entries matching one of the `where` kwargs
+            through the index of its column, and the other kwargs. Or None
+            if none of their columns is indexed.
+        """
+        for key, value in kwargs.items():
+            if key in self._indexes:
+                others = dict(kwargs)
+                del others[key]
+
+                return self._at(self._indexes[key].get(value, [])), others
+
+        return None
+
     def where(self, *args, **kwargs):
         """ Filters the object.
         
@@ -215,12 +708,19 @@ class JsonTable(object):
             args:
                 Value must be matched in the key or the value of an entry.
             kwargs:
-                Value for a specific key must be matched in an entry.
+                Value for a specific key must be matched in an entry. An
+                index of the key, see `index`, is used if there is one.
 
             Returns
             -------
             A :class:`JsonTable` containing the matches.
         """
+        lookup = self._lookup(kwargs)
+
+        if lookup is not None:
+            table, kwargs = lookup
+            return table.where(*args, **kwargs)
+
         return self.__class__(get_where(self.data, *args, **kwargs), 
                               self.order_by
                               )
@@ -324,3 +824,395 @@ class JsonTable(object):
         
         return table
 
+    def _ordered_headers(self):
+        """ Returns the headers in the order of `as_list`.
+        """
+        headers = self.headers()
+
+        return [header for header in self.order_by if header in headers] \
+            + [header for header in headers if header not in self.order_by]
+
+    def _arrays(self, infer_types=False):
+        """ Returns the headers, in the order of `as_list`, and their
+            columns as numpy arrays, see `infer_column`.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required to export a table')
+
+        headers = self._ordered_headers()
+        columns = [_column([entry.get(header) for entry in self.data])
+                   for header in headers]
+
+        if infer_types:
+            columns = [infer_column(column) for column in columns]
+
+        return headers, columns
+
+    def to_numpy(self, infer_types=False):
+        """ Exports the table to a numpy structured array, with a field
+            per column.
+
+            Parameters
+            ----------
+            infer_types: boolean
+                If True the columns of numbers and dates are converted,
+                see `infer_column`. Otherwise all the fields are arrays
+                of objects.
+        """
+        headers, columns = self._arrays(infer_types)
+
+        records = numpy.empty(len(self), dtype=[
+            (str(header), column.dtype)
+            for header, column in izip(headers, columns)])
+
+        for header, column in izip(headers, columns):
+            records[str(header)] = column
+
+        return records
+
+    def to_pandas(self, infer_types=False):
+        """ Exports the table to a pandas DataFrame.
+
+            Parameters
+            ----------
+            infer_types: boolean
+                See `to_numpy`.
+        """
+        # imported on demand, it takes longer than the rest of pyxnat
+        import pandas
+
+        headers, columns = self._arrays(infer_types)
+
+        return pandas.DataFrame(OrderedDict(izip(headers, columns)),
+                                index=pandas.RangeIndex(len(self)),
+                                columns=headers)
+
+    def to_arrow(self, infer_types=False):
+        """ Exports the table to a pyarrow Table. Strings are stored as
+            utf-8 and missing values as nulls.
+
+            Parameters
+            ----------
+            infer_types: boolean
+                See `to_numpy`.
+        """
+        import pyarrow
+
+        headers, columns = self._arrays(infer_types)
+
+        return pyarrow.Table.from_arrays(
+            [pyarrow.array(column, from_pandas=True,
+                           type=pyarrow.string()
+                           if column.dtype == object else None)
+             for column in columns],
+            names=[unicode(header) for header in headers])
+
+
+
+# operations on the columns of a ColumnTable, numpy arrays of objects when
+# numpy is available else lists, and on the boolean masks they give
+
+def _column(values):
+    if numpy is None:
+        return list(values)
+
+    column = numpy.empty(len(values), dtype=object)
+    column[:] = values
+
+    return column
+
+def _tolist(column):
+    return column.tolist() if numpy is not None else list(column)
+
+def _fill(length, value):
+    if numpy is None:
+        return [value] * length
+
+    return numpy.ones(length, dtype=bool) if value else \
+        numpy.zeros(length, dtype=bool)
+
+def _equals(column, value):
+    if numpy is None:
+        return [item == value for item in column]
+
+    return column == value
+
+def _and(mask, other):
+    return mask & other if numpy is not None else \
+        [a and b for a, b in izip(mask, other)]
+
+def _or(mask, other):
+    return mask | other if numpy is not None else \
+        [a or b for a, b in izip(mask, other)]
+
+def _not(mask):
+    return ~mask if numpy is not None else [not a for a in mask]
+
+def _count(mask):
+    return int(numpy.count_nonzero(mask)) if numpy is not None else \
+        sum(mask)
+
+def _take(column, key):
+    """ Returns the items of a column at a slice or where a mask is True.
+    """
+    if isinstance(key, slice) or numpy is not None:
+        return column[key]
+
+    return list(compress(column, key))
+
+class ColumnTable(JsonTable):
+    """ A JsonTable stored as one column of values per header, numpy
+        arrays when numpy is available, instead of a list of dicts.
+
+        Filters, projections and column extractions work on whole columns
+        rather than on every row, which matters for the large results of
+        searches. The rows of `data` are only built when they are asked
+        for and are a copy: modifying them does not change the table.
+
+        All the rows are expected to have the same headers, as in the
+        listings and search results returned by XNAT.
+    """
+    def __init__(self, jdata, order_by=[]):
+        if isinstance(jdata, dict):
+            jdata = [jdata]
+
+        headers = get_headers(jdata)
+
+        self._init(headers,
+                   [_column([entry.get(header) for entry in jdata])
+                    for header in headers],
+                   len(jdata), order_by)
+
+    def _init(self, headers, columns, length, order_by):
+        self._headers = headers
+        self._columns = dict(izip(headers, columns))
+        self._length = length
+        self._rows = None
+        self._indexes = {}
+        self.order_by = order_by
+
+    @classmethod
+    def from_columns(cls, headers, columns, order_by=[]):
+        """ Creates a table from its columns, e.g. from csv_to_columns.
+
+            Parameters
+            ----------
+            headers: list
+                The headers of the table.
+            columns: list
+                The sequences of values of every header, in the same
+                order and of the same length.
+            order_by: list
+                As for JsonTable.
+        """
+        table = cls.__new__(cls)
+        table._init(list(headers), [_column(column) for column in columns],
+                    len(columns[0]) if columns else 0, order_by)
+
+        return table
+
+    def _subset(self, headers, key=None):
+        """ Returns a table of some headers, restricted to the rows at a
+            slice or where a mask is True.
+        """
+        table = self.__class__.__new__(self.__class__)
+        columns = [self._columns[header] for header in headers]
+
+        if key is None:
+            length = self._length
+        elif isinstance(key, slice):
+            columns = [_take(column, key) for column in columns]
+            length = len(xrange(*key.indices(self._length)))
+        else:
+            columns = [_take(column, key) for column in columns]
+            length = _count(key)
+
+        table._init(headers, columns, length, self.order_by)
+
+        return table
+
+    @property
+    def data(self):
+        if self._rows is None:
+            self._rows = [
+                dict(izip(self._headers, values)) for values in
+                izip(*[_tolist(self._columns[header])
+                       for header in self._headers])
+                ] if self._headers else [{} for _ in xrange(self._length)]
+
+        return self._rows
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, name):
+        if isinstance(name, int):
+            if not -self._length <= name < self._length:
+                raise IndexError('table index out of range')
+
+            return self._subset(self._headers,
+                                slice(name % self._length,
+                                      name % self._length + 1))
+
+        return JsonTable.__getitem__(self, name)
+
+    def __getslice__(self, i, j):
+        return self._subset(self._headers, slice(i, j))
+
+    def headers(self):
+        """ Returns the headers of the object.
+        """
+        return list(self._headers)
+
+    def has_header(self, name):
+        return name in self._columns
+
+    def get(self, col, val_pattern='*', always_list=False):
+        """ Gets a single column value.
+
+            See JsonTable.get.
+        """
+        if col not in self._columns:
+            res = []
+        elif val_pattern == '*':
+            res = _tolist(self._columns[col])
+        else:
+            column = self._columns[col]
+            matches = set(value for value in set(column)
+                          if fnmatch(value, val_pattern))
+            res = [value for value in column if value in matches]
+
+        if always_list:
+            return res
+        if self._length == 1:
+            return res[0]
+        return res
+
+    def _matches(self, args, kwargs):
+        """ Returns the masks of the rows matching all the args and all
+            the kwargs, as get_where would test them.
+        """
+        args_mask = _fill(self._length, True)
+        kwargs_mask = _fill(self._length, True)
+
+        for arg in args:
+            if arg in self._columns:
+                continue
+
+            mask = _fill(self._length, False)
+            for header in self._headers:
+                mask = _or(mask, _equals(self._columns[header], arg))
+
+            args_mask = _and(args_mask, mask)
+
+        for key, value in kwargs.items():
+            if key not in self._columns:
+                if self._length:
+                    raise KeyError(key)
+                continue
+
+            kwargs_mask = _and(kwargs_mask,
+                               _equals(self._columns[key], value))
+
+        return args_mask, kwargs_mask
+
+    def index(self, col):
+        """ Builds a hash index of a column.
+
+            See JsonTable.index.
+        """
+        if col not in self._indexes:
+            index = {}
+
+            if col in self._columns:
+                for i, value in enumerate(_tolist(self._columns[col])):
+                    index.setdefault(value, []).append(i)
+
+            self._indexes[col] = index
+
+        return self._indexes[col]
+
+    def _at(self, positions):
+        columns = [self._columns[header] for header in self._headers]
+
+        if numpy is None:
+            columns = [[column[i] for i in positions] for column in columns]
+        else:
+            columns = [column[positions] for column in columns]
+
+        table = self.__class__.__new__(self.__class__)
+        table._init(self._headers, columns, len(positions), self.order_by)
+
+        return table
+
+    def where(self, *args, **kwargs):
+        """ Filters the object.
+
+            See JsonTable.where.
+        """
+        lookup = self._lookup(kwargs)
+
+        if lookup is not None:
+            table, kwargs = lookup
+            return table.where(*args, **kwargs)
+
+        args_mask, kwargs_mask = self._matches(args, kwargs)
+
+        return self._subset(self._headers, _and(args_mask, kwargs_mask))
+
+    def where_not(self, *args, **kwargs):
+        """ Filters the object. Conditions must not be matched.
+
+            See JsonTable.where_not.
+        """
+        args_mask, kwargs_mask = self._matches(args, kwargs)
+
+        return self._subset(self._headers,
+                            _and(_not(args_mask), _not(kwargs_mask)))
+
+    def select(self, columns):
+        """ Select only some columns of interest.
+
+            Returns
+            -------
+            A :class:`ColumnTable` with the selected columns.
+        """
+        return self._subset([header for header in self._headers
+                             if header in columns])
+
+    def _arrays(self, infer_types=False):
+        """ Returns the headers, in the order of `as_list`, and their
+            columns, which are not copied unless their type is inferred.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required to export a table')
+
+        headers = self._ordered_headers()
+        columns = [self._columns[header] for header in headers]
+
+        if infer_types:
+            columns = [infer_column(column) for column in columns]
+
+        return headers, columns
+
+    def _ordered_columns(self):
+        headers = self._ordered_headers()
+
+        return headers, [_tolist(self._columns[header])
+                         for header in headers]
+
+    def as_list(self):
+        headers, columns = self._ordered_columns()
+
+        if not columns:
+            return [headers] + [[] for _ in xrange(self._length)]
+
+        return [headers] + map(list, izip(*columns))
+
+    def items(self):
+        headers, columns = self._ordered_columns()
+
+        if not columns:
+            return [() for _ in xrange(self._length)]
+
+        return zip(*columns)
@@ -1,5 +1,4 @@
 import re
-import glob
 import urllib
 
 from lxml import etree
@@ -102,16 +101,11 @@ class SchemaManager(object):
 
     def _init(self):
         if self._trees == {}:
-            cache_template = '%s/*.xsd.headers' % self._intf._cachedir
+            cache = self._intf._http.cache
 
-            for entry in glob.iglob(cache_template):
-                hfp = open(entry, 'rb')
-                content = hfp.read()
-                hfp.close()
-
-                url = re.findall('(?<=content-location:\s%s)'
-                                 '.*?(?=\r{0,1}\n)' % self._intf._server, 
-                                 content)[0]
+            for key in cache.keys('%s/*.xsd' % self._intf._server,
+                                  namespace='schemas'):
+                url = key[len(self._intf._server):]
 
                 self._trees[url.split('/')[-1]] = \
                     etree.fromstring(self._intf._exec(url))
@@ -198,9 +192,10 @@ class PreArchive(object):
        triple - A list containing the project, timestamp and session id, in that order. 
     """
     def status(self, triple):
-        return JsonTable(
-            self._intf._get_json('/data/prearchive/projects')
-            ).where(
+        sessions = self._intf._get_table('/data/prearchive/projects')
+        sessions.index('folderName')
+
+        return sessions.where(
             project=triple[0], timestamp=triple[1], folderName=triple[2]
             ).get('status')
     
@@ -314,8 +309,9 @@ class PreArchive(object):
        triple - A list containing the project, timestamp and session id, in that order.
     """    
     def get_uri(self, triple):
-        return JsonTable(
-            self._intf._get_json('/data/prearchive/projects')
-            ).where(
+        sessions = self._intf._get_table('/data/prearchive/projects')
+        sessions.index('folderName')
+
+        return sessions.where(
             project=triple[0], timestamp=triple[1], folderName=triple[2]
             ).get('url')
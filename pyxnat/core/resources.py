@@ -28,7 +28,7 @@ from .attributes import EAttrs
 from .search import build_search_document, rpn_contraints, query_from_xml
 from .errors import is_xnat_error, parse_put_error_message
 from .errors import DataError, ProgrammingError, catch_error
-from .cache import md5name
+from .cache import md5name, makedirs, STRUCT
 from .provenance import Provenance
 # from .pipelines import Pipelines
 from . import schema
@@ -193,12 +193,19 @@ class EObject(object):
                          for item in filters.items()
                          )
 
-        for res in self._intf._get_json(get_id):
-            if self._urn in [res.get(id_head), res.get(lbl_head)]:
-                if len(cols) == 1:
-                    return res.get(cols[0])
-                else:
-                    return get_selection(res, cols)[0]
+        # the element is looked up by ID or label in the indexes of the
+        # listing, shared by the elements of the same collection
+        table = self._intf._get_table(get_id)
+        positions = table.index(id_head).get(self._urn, []) + \
+            table.index(lbl_head).get(self._urn, [])
+
+        if positions:
+            res = table.data[min(positions)]
+
+            if len(cols) == 1:
+                return res.get(cols[0])
+            else:
+                return get_selection(res, cols)[0]
 
     def exists(self, consistent=False):
         """ Test whether an element resource exists.
@@ -564,7 +571,7 @@ class CObject(object):
 
             request_shape = uri_shape(
                 '%s/0' % uri.split(self._intf._get_entry_point(), 1)[1])
-            reqcache = os.path.join(self._intf._cachedir,
+            reqcache = os.path.join(self._intf._cachedir, STRUCT,
                                    '%s.struct' % md5name(request_shape)
                                    ).replace('_*', '')
 
@@ -575,10 +582,10 @@ class CObject(object):
                 self._intf.inspect._tick == 0 and\
                 self._intf.inspect._auto
 
-            if (not os.path.exists(reqcache) and gather) \
-                    or (gather and tick):
-
-                columns += ['xsiType']
+            # the type is always requested so that a listing has a single
+            # URI, and cache entry, whether it is learnt from or not
+            if gather and 'xsiType' not in columns:
+                columns = columns + ['xsiType']
 
                 # struct = {}
             # if self._intf._struct.has_key(reqcache):
@@ -613,11 +620,20 @@ class CObject(object):
                     for item in self._filters.items()
                     )
 
-            jtable = self._intf._get_json(uri + query_string)
+            learn = (not os.path.exists(reqcache) and gather) \
+                or (gather and tick)
+
+            if getattr(self._intf, '_stream', False):
+                rows = self._intf._iter_json(uri + query_string)
 
-            if (not os.path.exists(reqcache) and gather) \
-                    or (gather and tick):
+                if learn:
+                    rows = self._learning(uri.split('/')[-1], rows, reqcache)
 
+                return self._guarded(rows)
+
+            jtable = self._intf._get_json(uri + query_string)
+
+            if learn:
                 _type = uri.split('/')[-1]
                 self._learn_from_table(_type, jtable, reqcache)
 
@@ -627,10 +643,32 @@ class CObject(object):
                 raise e
             return []
 
+    def _guarded(self, rows):
+        """ Yields the rows of a streamed listing. An error before the
+            first row gives no rows, as _call does on an error. An error
+            after it is raised, the listing would be incomplete otherwise.
+        """
+        started = False
+
+        try:
+            for row in rows:
+                started = True
+                yield row
+        except Exception as e:
+            if DEBUG or started:
+                raise e
+
     def _learn_from_table(self, _type, jtable, reqcache):
+        for element in self._learning(_type, jtable, reqcache):
+            pass
+
+    def _learning(self, _type, rows, reqcache):
+        """ Yields the rows of a listing, and learns the types of its
+            elements once they have all been read.
+        """
         request_knowledge = {}
 
-        for element in jtable:
+        for element in rows:
             xsitype = element.get('xsiType')
             uri = element.get('URI').split(self._intf._get_entry_point(), 1)[1]
             uri = uri.replace(uri.split('/')[-2], _type)
@@ -638,6 +676,8 @@ class CObject(object):
 
             request_knowledge[shape] = xsitype
 
+            yield element
+
         if os.path.exists(reqcache):
             previous = json.load(open(reqcache, 'rb'))
             previous.update(request_knowledge)
@@ -645,6 +685,7 @@ class CObject(object):
 
         self._intf._struct.update(request_knowledge)
 
+        makedirs(os.path.dirname(reqcache))
         json.dump(request_knowledge, open(reqcache, 'w'))
 
     def __iter__(self):
@@ -720,20 +761,22 @@ class CObject(object):
                     raise StopIteration
 
         elif self._ctype == 'cobjecteobjects':
-            for eobj in self._cbase:
+            def nested(eobj):
+                Klass = globals().get(self._nested.rstrip('s').title(),
+                                      self._intf.__class__)
+                return Klass(cbase=join_uri(eobj._uri, self._nested),
+                             interface=self._intf,
+                             pattern=self._pattern,
+                             id_header=self._id_header,
+                             columns=self._columns)
+
+            for eobj, children in self._fanout(self._cbase, nested):
                 try:
                     if self._nested is None:
                         self._run_callback(self, eobj)
                         yield eobj
                     else:
-                        Klass = globals().get(self._nested.rstrip('s').title(),
-                                              self._intf.__class__)
-                        for subeobj in Klass(
-                            cbase=join_uri(eobj._uri, self._nested),
-                            interface=self._intf,
-                            pattern=self._pattern,
-                            id_header=self._id_header,
-                            columns=self._columns):
+                        for subeobj in children:
 
                             try:
                                 self._run_callback(self, subeobj)
@@ -746,20 +789,22 @@ class CObject(object):
                     raise StopIteration
 
         elif self._ctype == 'cobjectcobject':
-            for eobj in self._cbase:
+            def nested(eobj):
+                Klass = globals().get(self._nested.title(),
+                                      self._intf.__class__)
+                return Klass(cbase=join_uri(eobj._uri, self._nested),
+                             interface=self._intf,
+                             pattern=self._pattern,
+                             id_header=self._id_header,
+                             columns=self._columns)
+
+            for eobj, children in self._fanout(self._cbase, nested):
                 try:
                     if self._nested is None:
                         self._run_callback(self, eobj)
                         yield eobj
                     else:
-                        Klass = globals().get(self._nested.title(),
-                                              self._intf.__class__)
-                        for subeobj in Klass(
-                            cbase=join_uri(eobj._uri, self._nested),
-                            interface=self._intf,
-                            pattern=self._pattern,
-                            id_header=self._id_header,
-                            columns=self._columns):
+                        for subeobj in children:
 
                             try:
                                 self._run_callback(self, eobj)
@@ -772,22 +817,25 @@ class CObject(object):
                     raise StopIteration
 
         elif self._ctype == 'cobjectcobjects':
+            def nested(cobj):
+                def collection(eobj):
+                    Klass = globals().get(cobj._nested.title(),
+                                          self._intf.__class__)
+                    return Klass(cbase=join_uri(eobj._uri, cobj._nested),
+                                 interface=cobj._intf,
+                                 pattern=cobj._pattern,
+                                 id_header=cobj._id_header,
+                                 columns=cobj._columns)
+                return collection
+
             for cobj in self._cbase:
                 try:
-                    for eobj in cobj:
+                    for eobj, children in self._fanout(cobj, nested(cobj)):
                         if self._nested is None:
                             self._run_callback(self, eobj)
                             yield eobj
                         else:
-                            Klass = globals().get(cobj._nested.title(),
-                                                  self._intf.__class__)
-
-                            for subeobj in Klass(
-                                cbase=join_uri(eobj._uri, cobj._nested),
-                                interface=cobj._intf,
-                                pattern=cobj._pattern,
-                                id_header=cobj._id_header,
-                                columns=cobj._columns):
+                            for subeobj in children:
 
                                 try:
                                     self._run_callback(self, eobj)
@@ -803,6 +851,28 @@ class CObject(object):
             for empty in []:
                 yield empty
 
+    def _fanout(self, eobjs, nested):
+        """ Pairs each element with its nested collection `nested(eobj)`.
+
+            With `Interface.set_prefetch`, the nested collections of the
+            next elements are listed ahead in the interface worker pool.
+            The pairs are still yielded in order and the elements are
+            still read lazily.
+        """
+        if self._nested is None:
+            for eobj in eobjs:
+                yield eobj, None
+        elif not getattr(self._intf, '_prefetch', 0):
+            for eobj in eobjs:
+                yield eobj, nested(eobj)
+        else:
+            def fetch(eobj):
+                return eobj, list(nested(eobj))
+
+            for pair in self._intf._get_workers().imap(
+                    fetch, eobjs, self._intf._prefetch):
+                yield pair
+
     def _run_callback(self, cobj, eobj):
         if self._intf._callback is not None:
             self._intf._callback(cobj, eobj)
@@ -1119,9 +1189,10 @@ class Project(EObject):
             string : owner | member | collaborator
 
         """
-        return JsonTable(self._intf._get_json(join_uri(self._uri, 'users'))
-                         ).where(login=login
-                                 )['displayname'].lower().rstrip('s')
+        users = self._intf._get_table(join_uri(self._uri, 'users'))
+        users.index('login')
+
+        return users.where(login=login)['displayname'].lower().rstrip('s')
 
     def add_user(self, login, role='member'):
         """ Adds a user to the project. The user must already exist on 
@@ -1570,10 +1641,8 @@ class Resource(EObject):
         """
         zip_location = os.path.join(dest_dir, uri_last(self._uri) + '.zip')
 
-        if dest_dir is not None:
-            self._intf._http.cache.preset(zip_location)
-
-        self._intf._exec(join_uri(self._uri, 'files') + '?format=zip')
+        self._intf._get_file(join_uri(self._uri, 'files') + '?format=zip',
+                             zip_location)
 
         fzip = zipfile.ZipFile(zip_location, 'r')
         fzip.extractall(path=dest_dir)
@@ -1626,12 +1695,14 @@ class Resource(EObject):
 
         return zip_location if os.path.exists(zip_location) else members
 
-    def put(self, sources, **datatypes):
+    def put(self, sources, progress=None, **datatypes):
         """ Insert a list of files in a single resource element.
 
             This method takes all the files an creates a zip with them
             which will be the element to be uploaded and then extracted on
             the server.
+
+            See `File.put` for the `progress` parameter.
         """
         zip_location = tempfile.mkstemp(suffix='.zip')[1]
 
@@ -1644,26 +1715,29 @@ class Resource(EObject):
 
         fzip.close()
 
-        self.put_zip(zip_location, **datatypes)
+        self.put_zip(zip_location, progress, **datatypes)
         os.remove(zip_location)
 
-    def put_zip(self, zip_location, **datatypes):
+    def put_zip(self, zip_location, progress=None, **datatypes):
         """ Uploads a zip or tgz file an then extracts it on the server.
 
             After the compressed file is extracted the individual 
             files are accessible separately, or as a whole using get_zip.
+
+            The archive is streamed to the server, see `File.put` for the
+            `progress` parameter.
         """
         if not self.exists():
             self.create(**datatypes)
 
         self.file(os.path.split(zip_location)[1] + '?extract=true'
-                  ).put(zip_location)
+                  ).put(zip_location, progress=progress)
 
-    def put_dir(self, src_dir, **datatypes):
+    def put_dir(self, src_dir, progress=None, **datatypes):
         """ Finds recursively all the files in a folder and uploads
             them using `insert`.
         """
-        self.put(find_files(src_dir), **datatypes)
+        self.put(find_files(src_dir), progress, **datatypes)
 
     batch_insert = put
     zip_insert = put_zip
@@ -1707,6 +1781,7 @@ class File(EObject):
         EObject.__init__(self, uri, interface)
         self._urn = file_path(uri)
         self._absuri = None
+        self._digest = None
 
     def __repr__(self):
         return '<%s Object> %s' % (self.__class__.__name__,
@@ -1758,26 +1833,24 @@ class File(EObject):
         """
 
         if not self._absuri:
-            self._absuri = self._getcell('URI')
+            cells = self._getcells(['URI', 'digest'])
+
+            if cells is not None:
+                self._absuri = cells.get('URI')
+                self._digest = cells.get('digest') or None
 
         if self._absuri is None:
             raise DataError('Cannot get file: does not exists')
 
-        if dest is not None:
-            self._intf._http.cache.preset(dest)
-        elif not force_default:
-            _location = \
-                self._intf._http.cache.get_diskpath(
+        if dest is None and not force_default:
+            dest = self._intf._http.cache.get_diskpath(
                 '%s%s' % (self._intf._server, self._absuri)
                 )
 
-            self._intf._http.cache.preset(_location)
-
-        self._intf._exec(self._uri, 'GET')
-
-        return self._intf._http.cache.get_diskpath(
-            '%s%s' % (self._intf._server, self._absuri)
-            )
+        # the file is cached under its URI on the server, whichever path
+        # selected it, and its content is not downloaded again if it is
+        # already in the cache for another URI
+        return self._intf._get_file(self._absuri, dest, self._digest)
 
     def get_copy(self, dest=None):
         """ Downloads the file to the cache directory but creates a copy at
@@ -1809,9 +1882,13 @@ class File(EObject):
 
         return dest
 
-    def put(self, src, format='U', content='U', tags='U', overwrite=False, **datatypes):
+    def put(self, src, format='U', content='U', tags='U', overwrite=False,
+            progress=None, **datatypes):
         """ Uploads a file to XNAT.
 
+            The file is streamed to the server, it is never loaded in
+            memory.
+
             Parameters
             ----------
             src: string
@@ -1829,17 +1906,23 @@ class File(EObject):
             overwrite: boolean
                 Optional parameter to specify if the file should be overwritten.
                 Defaults to False
+            progress: callable | None
+                Optional callable, called as progress(sent, total) with
+                the number of bytes sent so far and the total number of
+                bytes to send, while the file is uploaded.
         """
 
         format = urllib.quote(format)
         content = urllib.quote(content)
         tags = urllib.quote(tags)
 
+        src_path = None
+
         try:
             if os.path.exists(src):
                 path = src
                 name = os.path.basename(path).split('?')[0]
-                src = codecs.open(src).read()
+                src_path = src
             else:
                 path = self._uri.split('/')[-1]
                 name = path
@@ -1850,9 +1933,14 @@ class File(EObject):
         content_type = mimetypes.guess_type(path)[0] or \
             'application/octet-stream'
 
-        body, content_type = httputil.file_message(src, content_type,
-                                                   path, name
-                                                   )
+        if src_path is not None:
+            body = httputil.MultipartFile(content_type, path, name,
+                                          src=src_path, progress=progress)
+        else:
+            body = httputil.MultipartFile(content_type, path, name,
+                                          content=src, progress=progress)
+
+        content_type = body.content_type
 
         guri = uri_grandparent(self._uri)
 
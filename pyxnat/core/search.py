@@ -1,21 +1,19 @@
 import os
 import re
 import glob
-import csv
+import time
 import difflib
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
 
 from lxml import etree
 import json
 
-from .jsonutil import JsonTable, get_column, get_where, get_selection
+from .jsonutil import ColumnTable, csv_to_columns
+from .jsonutil import get_column, get_where, get_selection
 from .errors import is_xnat_error, catch_error
 from .errors import ProgrammingError, NotSupportedError
 from .errors import DataError, DatabaseError
-from .uriutil import check_entry
+from .uriutil import check_entry, join_uri, uri_path
+from .stats import MEMCACHE
 
 search_nsmap = {'xdat':'http://nrg.wustl.edu/security',
                 'xsi':'http://www.w3.org/2001/XMLSchema-instance'}
@@ -288,6 +286,25 @@ def rpn_contraints(rpn_exp):
 
     return left if left != [] else right
 
+def search_scope(criteria_set):
+    """ Returns the paths, relative to the REST entry point, of the
+        resources the results of a search depend on: the project it is
+        restricted to, if any, and the subjects and experiments of all
+        the projects since they may be shared. Otherwise the whole
+        database.
+    """
+    methods = [criteria for criteria in criteria_set
+               if isinstance(criteria, basestring)]
+    projects = [criteria[2] for criteria in criteria_set
+                if isinstance(criteria, tuple) and len(criteria) == 3
+                and criteria[0].split('/')[-1].upper() == 'PROJECT'
+                and criteria[1] == '=']
+
+    if methods == ['AND'] and projects:
+        return ['/projects/%s' % projects[0], '/subjects', '/experiments']
+
+    return ['']
+
 # ---------------------------------------------------------------
 
 class SearchManager(object):
@@ -428,15 +445,9 @@ class SearchManager(object):
             '%s/search/saved/%s/results?format=csv' % (self._intf._entry,
                                                        search_id), 'GET')
 
-        results = csv.reader(StringIO(content), delimiter=',', quotechar='"')
-
-        headers = results.next()
+        headers, columns = csv_to_columns(content)
 
-        return JsonTable([dict(zip(headers, res))
-                          for res in results
-                          ],
-                         headers
-                         )
+        return ColumnTable.from_columns(headers, columns, headers)
 
     def delete(self, name):
         """ Removes the search from the server.
@@ -566,14 +577,9 @@ class SearchManager(object):
         content = self._intf._exec(
             "%s/search?format=csv" % self._intf._entry, 'POST', bundle)
 
-        results = csv.reader(StringIO(content), delimiter=',', quotechar='"')
-        headers = results.next()
+        headers, columns = csv_to_columns(content)
 
-        return JsonTable([dict(zip(headers, res))
-                          for res in results
-                          ],
-                         headers
-                         )
+        return ColumnTable.from_columns(headers, columns, headers)
 
     def get_template(self, name, as_xml=False):
         """ Get a saved template, either as an xml document, or as a pyxnat
@@ -673,10 +679,10 @@ class Search(object):
 
             Returns
             -------
-            results: JsonTable object
+            results: ColumnTable object
                 An table-like object containing the results. It is
-                basically a list of dictionaries that has additional
-                helper methods.
+                a JsonTable, with the same helper methods, that stores
+                the results by column.
         """
         self._intf._get_entry_point()
 
@@ -698,15 +704,28 @@ class Search(object):
                                    'parameters must be correctly set.')
 
         bundle = build_search_document(self._row, self._columns, constraints)
+        uri = "%s/search?format=csv" % self._intf._entry
 
-        content = self._intf._exec(
-            "%s/search?format=csv" % self._intf._entry, 'POST', bundle)
+        # the results are kept until a resource they depend on is modified
+        start = time.time()
+        content = self._intf._memcache.get(('search', bundle))
+
+        if content is not None:
+            self._intf._record('POST', join_uri(self._intf._server, uri),
+                               start, None, content, source=MEMCACHE)
+        else:
+            content = self._intf._exec(uri, 'POST', bundle)
+
+            if is_xnat_error(content):
+                catch_error(content)
 
-        if is_xnat_error(content):
-            catch_error(content)
+            self._intf._memcache.set(
+                ('search', bundle), content,
+                paths=[uri_path(join_uri(self._intf._server,
+                                         self._intf._entry + path))
+                       for path in search_scope(constraints)])
 
-        results = csv.reader(StringIO(content), delimiter=',', quotechar='"')
-        headers = results.next()
+        headers, columns = csv_to_columns(content)
 
         headers_of_interest = []
 
@@ -724,8 +743,8 @@ class Search(object):
         if len(self._columns) != len(headers_of_interest):
             raise DataError('unvalid response headers')
 
-        return JsonTable([dict(zip(headers, res)) for res in results],
-                         headers_of_interest).select(headers_of_interest)
+        return ColumnTable.from_columns(headers, columns, headers_of_interest
+                                        ).select(headers_of_interest)
 
     def all(self):
         return self.where([(self._row + '/ID', 'LIKE', '%'), 'AND'])
@@ -0,0 +1,160 @@
+from __future__ import with_statement
+
+import threading
+from collections import deque, namedtuple
+
+from .uriutil import uri_pattern
+
+
+# sources of a response
+MEMCACHE = 'memcache'
+DISK = 'disk'
+NETWORK = 'network'
+
+
+class RequestRecord(namedtuple('RequestRecord',
+                               ['method', 'uri', 'pattern', 'status',
+                                'latency', 'bytes_in', 'bytes_out',
+                                'wire_bytes', 'source', 'timestamp'])):
+    """ Metrics of a single request.
+
+        Attributes
+        ----------
+        method: string
+            HTTP method.
+        uri: string
+            Full URL of the request.
+        pattern: string
+            The URI without server, element IDs and query values, see
+            `uriutil.uri_pattern`.
+        status: int | None
+            HTTP status, None if the request failed before a response.
+        latency: float
+            Time spent in seconds, including reading the body.
+        bytes_in: int
+            Size of the response body, once decompressed.
+        bytes_out: int
+            Size of the request body.
+        wire_bytes: int
+            Size of the response body as received from the network, 0
+            when it came from the cache.
+        source: memcache | disk | network
+            Where the response came from. A response revalidated with the
+            server, i.e. status 304, comes from the disk.
+        timestamp: float
+            When the request started.
+    """
+    __slots__ = ()
+
+
+class RequestStats(object):
+    """ Records metrics for the requests sent by an :class:`Interface`.
+
+        Records are kept in memory, up to `maxlen` of them, and passed to
+        the hooks as they are made.
+
+        Examples
+        --------
+            >>> slow = []
+            >>> interface.stats.add_hook(
+                    lambda record: record.latency > 1 and slow.append(record))
+            >>> interface.select.projects().get()
+            >>> interface.stats.summary()
+            {('GET', '/data/projects?columns&format'):
+                {'count': 1, 'latency': 0.21, 'bytes_in': 1024, ...}}
+    """
+    def __init__(self, maxlen=10000):
+        """
+            Parameters
+            ----------
+            maxlen: int | None
+                Maximum number of records kept, the oldest are dropped
+                first. None keeps them all.
+        """
+        self.enabled = True
+
+        self._records = deque(maxlen=maxlen)
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def record(self, method, uri, status, latency, bytes_in=0,
+               bytes_out=0, wire_bytes=0, source=NETWORK, timestamp=None):
+        """ Adds a record and passes it to the hooks.
+        """
+        if not self.enabled:
+            return
+
+        record = RequestRecord(method, uri, uri_pattern(uri), status,
+                               latency, bytes_in, bytes_out, wire_bytes,
+                               source, timestamp)
+
+        with self._lock:
+            self._records.append(record)
+            hooks = list(self._hooks)
+
+        for hook in hooks:
+            hook(record)
+
+        return record
+
+    def add_hook(self, hook):
+        """ Calls `hook(record)` with the :class:`RequestRecord` of every
+            subsequent request, from the thread that sent it.
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """ Stops calling a hook.
+        """
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def records(self):
+        """ Returns the records, oldest first.
+        """
+        with self._lock:
+            return list(self._records)
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def __len__(self):
+        return len(self._records)
+
+    def clear(self):
+        """ Forgets all the records.
+        """
+        with self._lock:
+            self._records.clear()
+
+    def summary(self, key=('method', 'pattern')):
+        """ Aggregates the records.
+
+            Parameters
+            ----------
+            key: tuple
+                The record fields to group by.
+
+            Returns
+            -------
+            A dict whose keys are the grouped fields values, and values
+            are dicts with the number of requests, the total latency,
+            bytes in, out and on the wire, and the count per source.
+        """
+        groups = {}
+
+        for record in self.records():
+            group = groups.setdefault(
+                tuple(getattr(record, field) for field in key),
+                {'count': 0, 'latency': 0.0, 'bytes_in': 0, 'bytes_out': 0,
+                 'wire_bytes': 0, MEMCACHE: 0, DISK: 0, NETWORK: 0})
+
+            group['count'] += 1
+            group['latency'] += record.latency
+            group['bytes_in'] += record.bytes_in
+            group['bytes_out'] += record.bytes_out
+            group['wire_bytes'] += record.wire_bytes
+            group[record.source] += 1
+
+        return groups
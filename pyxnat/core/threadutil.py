@@ -0,0 +1,212 @@
+from __future__ import with_statement
+
+import threading
+from collections import deque
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class Timeout(Exception):
+    """ Raised when the result of a :class:`Future` is not available
+        in time.
+    """
+
+
+class Future(object):
+    """ Result of a function call running in a :class:`WorkerPool`.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """ Whether the call returned or raised an exception.
+        """
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """ Waits for the call to complete and returns its result, or
+            raises the exception it raised.
+
+            Parameters
+            ----------
+            timeout: float | None
+                Maximum number of seconds to wait, :class:`Timeout` is
+                raised when it expires. If None wait forever.
+        """
+        if not self._event.wait(timeout):
+            raise Timeout('The call did not complete in %s seconds'
+                          % timeout)
+
+        if self._exception is not None:
+            raise self._exception
+
+        return self._result
+
+    def exception(self, timeout=None):
+        """ Waits for the call to complete and returns the exception it
+            raised, or None.
+        """
+        if not self._event.wait(timeout):
+            raise Timeout('The call did not complete in %s seconds'
+                          % timeout)
+
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """ Calls `callback(future)` when the call completes, right away
+            if it already did.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def _complete(self, result=None, exception=None):
+        with self._lock:
+            self._result = result
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback(self)
+
+    def __repr__(self):
+        state = 'done' if self.done() else 'pending'
+        return '<Future %s> %s' % (state, id(self))
+
+
+def wait(futures, timeout=None):
+    """ Waits for all the futures to complete and returns their results
+        in the same order.
+    """
+    return [future.result(timeout) for future in futures]
+
+
+def as_completed(futures):
+    """ Yields the futures as they complete.
+    """
+    futures = list(futures)
+    completed = queue.Queue()
+
+    for future in futures:
+        future.add_done_callback(completed.put)
+
+    for _ in range(len(futures)):
+        yield completed.get()
+
+
+class WorkerPool(object):
+    """ Fixed number of daemon threads running functions from a queue.
+
+        Threads are only started when work is submitted, so that an
+        unused pool costs nothing.
+    """
+    def __init__(self, size=16):
+        """
+            Parameters
+            ----------
+            size: int
+                Maximum number of functions running at the same time.
+        """
+        self.size = size
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                break
+
+            future, func, args, kwargs = item
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                future._complete(exception=e)
+            else:
+                future._complete(result)
+
+    def submit(self, func, *args, **kwargs):
+        """ Schedules `func(*args, **kwargs)` and returns a
+            :class:`Future`.
+        """
+        future = Future()
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Cannot submit to a closed pool')
+
+            self._queue.put((future, func, args, kwargs))
+
+            if len(self._threads) < self.size:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+        return future
+
+    def imap(self, func, iterable, window=None):
+        """ Yields `func(item)` for every item, in order, computing them
+            concurrently.
+
+            Parameters
+            ----------
+            func: callable
+                The function to apply.
+            iterable: iterable
+                The items, consumed lazily.
+            window: int | None
+                Maximum number of results computed ahead of the one being
+                yielded. Defaults to twice the pool size.
+        """
+        window = window or 2 * self.size
+        pending = deque()
+
+        for item in iterable:
+            pending.append(self.submit(func, item))
+
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def map(self, func, iterable, window=None):
+        """ Same as `imap` but returns a list.
+        """
+        return list(self.imap(func, iterable, window))
+
+    def shutdown(self, wait=True):
+        """ Stops the threads once the submitted functions are done.
+        """
+        with self._lock:
+            self._closed = True
+            threads, self._threads = self._threads, []
+
+            for _ in threads:
+                self._queue.put(None)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
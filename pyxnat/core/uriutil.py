@@ -1,7 +1,7 @@
 import os
 import re
 
-from .schema import rest_translation
+from .schema import rest_translation, resources_tree, extra_resources_tree
 # from .schema import resources_types
 
 def translate_uri(uri):
@@ -91,6 +91,122 @@ def uri_shape(uri):
     
     return make_uri(shapes)
 
+_id_collections = ['projects', 'subjects', 'experiments', 'assessors',
+                   'reconstructions', 'scans', 'resources', 'users']
+
+def uri_pattern(uri):
+    """ Returns the shape of a request URI, without the server, the
+        element IDs and the query string values, so that similar requests
+        can be grouped together.
+
+        e.g. http://host/data/projects/P1/subjects?format=csv&columns=ID
+        gives /data/projects/*/subjects?columns&format
+    """
+    uri = re.sub('^[a-zA-Z]+://[^/]*', '', uri)
+    path, _, query = uri.partition('?')
+    segs = path.split('/')
+
+    for i in range(1, len(segs)):
+        if segs[i - 1] == 'files':
+            segs = segs[:i] + ['*']
+            break
+
+        if segs[i - 1] in _id_collections:
+            segs[i] = '*'
+
+    pattern = '/'.join(segs)
+
+    if query:
+        pattern += '?' + '&'.join(sorted(set(
+            param.split('=', 1)[0] for param in query.split('&') if param)))
+
+    return pattern
+
+def uri_path(uri):
+    """ Returns the path of a request URI, without the server and the
+        query string.
+    """
+    return re.sub('^[a-zA-Z]+://[^/]*', '', uri).partition('?')[0]
+
+# collections whose elements are also reached from the root of the REST
+# API e.g. /data/experiments/E1 for /data/projects/P1/subjects/S1/...
+_shared_collections = ['subjects', 'experiments']
+
+# the elements below a project also listed at the project level, e.g.
+# by Project.experiments(), its resources are its own
+_project_collections = _shared_collections + extra_resources_tree['projects']
+
+def uri_scope(uri):
+    """ Returns a regular expression matching the paths of the resources
+        a write to `uri` makes stale: the written element and everything
+        below it, its parent collection, its ancestors up to the top level
+        element and the root of the REST API. Subjects and experiments are
+        matched whatever the path they are reached from, along with the
+        root collections listing them. The listings of the project of
+        the written element, e.g. /data/projects/P1/experiments, are
+        matched for its collection and the collections below it.
+
+        e.g. a PUT on http://host/data/projects/P1/subjects/S1 leaves
+        /data/projects and /data/projects/P2/subjects alone.
+    """
+    path = uri_path(uri).rstrip('/')
+    segs = path.split('/')
+
+    for i, seg in enumerate(segs):
+        if seg in ['data', 'REST']:
+            break
+    else:
+        return '^%s(/.*)?$' % re.escape(path)
+
+    base = '/'.join(segs[:i + 1])
+    rel = segs[i + 1:]
+
+    def chain(head, rel, depths):
+        return ['%s%s(/.*)?' % (head, re.escape(''.join('/' + seg
+                                                        for seg in rel)))] \
+            + [head + re.escape(''.join('/' + seg for seg in rel[:depth]))
+               for depth in depths]
+
+    depths = set([0, len(rel) - 1] + range(2, len(rel)))
+    scopes = chain(re.escape(base), rel,
+                   [depth for depth in depths if depth >= 0])
+
+    for j in range(0, len(rel) - 1, 2):
+        if rel[j] in _shared_collections:
+            head = re.escape(base) + '(/.+)?' + \
+                re.escape('/%s/%s' % (rel[j], rel[j + 1]))
+            scopes += chain(head, rel[j + 2:], range(len(rel) - j - 2))
+            scopes += [re.escape('%s/%s' % (base, collection))
+                       for collection in _shared_collections]
+
+            # the parent collection of an element written through the root
+            # collection is not known, e.g. /data/projects/P1/subjects
+            if j == 0 and len(rel) == 2:
+                scopes.append(re.escape(base) + '(/.+)?' +
+                              re.escape('/' + rel[j]))
+
+    # the elements below a project are also listed at the project level,
+    # see _project_collections
+    below_project = rel[:1] == ['projects'] and len(rel) > 2
+    collection = rel[(len(rel) - 1) // 2 * 2] if rel else None
+
+    if collection in resources_tree and \
+            (below_project or collection != 'projects'):
+        project = re.escape(rel[1]) if below_project else '[^/]+'
+        collections = [collection]
+
+        for parent in collections:
+            collections += [child for child in resources_tree[parent] +
+                            extra_resources_tree.get(parent, [])
+                            if child not in collections]
+
+        scopes += ['%s/projects/%s%s' % (re.escape(base), project,
+                                         re.escape('/' + collection))
+                   for collection in collections
+                   if collection in _project_collections]
+
+    return '^(%s)$' % '|'.join(sorted(set(scopes)))
+
 def make_uri(_dict):
     uri = ''
 
@@ -41,37 +41,36 @@ class Users(object):
         return JsonTable(self._intf._get_json('%s/users' % self._intf._entry)
                          ).get('login', always_list=True)
 
-    def firstname(self, login):
-        """ Returns the firstname of the user.
+    def _user(self, login):
+        """ Returns the entry of a user, looked up in the users listing
+            through an index of the logins.
         """
         self._intf._get_entry_point()
 
-        return JsonTable(self._intf._get_json('%s/users' % self._intf._entry)
-                         ).where(login=login)['firstname']
+        users = self._intf._get_table('%s/users' % self._intf._entry)
+        users.index('login')
+
+        return users.where(login=login)
+
+    def firstname(self, login):
+        """ Returns the firstname of the user.
+        """
+        return self._user(login)['firstname']
 
     def lastname(self, login):
         """ Returns the lastname of the user.
         """
-        self._intf._get_entry_point()
-
-        return JsonTable(self._intf._get_json('%s/users' % self._intf._entry)
-                         ).where(login=login)['lastname']
+        return self._user(login)['lastname']
 
     def id(self, login):
         """ Returns the id of the user.
         """
-        self._intf._get_entry_point()
-
-        return JsonTable(self._intf._get_json('%s/users' % self._intf._entry)
-                         ).where(login=login)['xdat_user_id']
+        return self._user(login)['xdat_user_id']
 
     def email(self, login):
         """ Returns the email of the user.
         """
-        self._intf._get_entry_point()
-
-        return JsonTable(self._intf._get_json('%s/users' % self._intf._entry)
-                         ).where(login=login)['email']
+        return self._user(login)['email']
 
 
     def resources(self):
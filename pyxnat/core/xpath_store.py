@@ -1,7 +1,6 @@
 import re
 from datetime import datetime
 from os import path
-from glob import iglob
 
 from lxml import etree
 
@@ -38,11 +37,20 @@ class XpathStore(object):
 
         return self._tree.xpath(xpath, namespaces=self._nsmap)
 
+    def _locations(self):
+        """ Returns the paths of the subject documents in the cache.
+        """
+        cache = self._intf._http.cache
+
+        return [cache.get_diskpath(key)
+                for key in cache.keys('*/subjects/*format=xml*',
+                                      namespace='xml')]
+
     def _load(self):
         roots = []
         nsmap = {}
 
-        for location in iglob('%s/*.xml' % self._intf._cachedir):
+        for location in self._locations():
             f = open(location, 'rb')
             content = f.read()
             f.close()
@@ -70,7 +78,7 @@ class XpathStore(object):
         """
         last_modified = self._last_modified()
         
-        for location in iglob('%s/*.xml' % self._intf._cachedir):
+        for location in self._locations():
 
             subject_id = get_subject_id(location)
 
@@ -0,0 +1,145 @@
+import os
+import time
+import tempfile
+import threading
+from httplib import IncompleteRead
+
+from .. import Interface
+from ..core.asynchronous import wrap, AsyncEObject, AsyncCObject, \
+    AsyncAttrs, AsyncInterface
+from ..core.resources import Project
+from ..core.threadutil import Future, WorkerPool
+from ..core.jsonutil import JsonTable
+from .server import XnatStandIn
+
+server = XnatStandIn(projects=2, subjects=3, experiments=1, scans=1,
+                     files=1, seed=2)
+
+
+def setup_module():
+    server.start()
+
+def teardown_module():
+    server.stop()
+
+def _async_interface():
+    return AsyncInterface(Interface(server.url, 'admin', 'admin',
+                                    cachedir=tempfile.mkdtemp()))
+
+
+class _Interface(object):
+    _struct = {}
+    _poolsize = 4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = [0, 0]
+
+    def _get_entry_point(self):
+        return '/REST'
+
+    def _get_json(self, uri):
+        with self.lock:
+            self.running[0] += 1
+            self.running[1] = max(self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running[0] -= 1
+
+        return [{'ID': 'P%s' % i, 'URI': '/REST/projects/P%s' % i}
+                for i in range(4)]
+
+    def _get_table(self, uri):
+        return JsonTable(self._get_json(uri))
+
+
+def test_navigation_is_synchronous():
+    pool = WorkerPool(4)
+    project = wrap(Project('/REST/projects/P1', _Interface()), pool)
+
+    assert isinstance(project, AsyncEObject)
+    assert isinstance(project.subjects(), AsyncCObject)
+    assert isinstance(project.subject('S1'), AsyncEObject)
+    assert isinstance(project.attrs, AsyncAttrs)
+    assert project.subject('S1').unwrap()._uri == \
+        '/REST/projects/P1/subjects/S1'
+
+    pool.shutdown()
+
+def test_requests_run_concurrently():
+    pool = WorkerPool(4)
+    intf = _Interface()
+    projects = [wrap(Project('/REST/projects/P%s' % i, intf), pool)
+                for i in range(4)]
+
+    futures = [project.exists() for project in projects]
+
+    assert all(isinstance(future, Future) for future in futures)
+    assert [future.result() for future in futures] == [True] * 4
+    assert intf.running[1] > 1
+
+    pool.shutdown()
+
+def test_file_transfers():
+    with _async_interface() as aintf:
+        resource = aintf.select.project('P0').subject('P0_S0'
+                                                      ).resource('async')
+        assert resource.create().result() is not None
+
+        src = os.path.join(tempfile.mkdtemp(), 'hello.txt')
+        open(src, 'wb').write('hello xnat\n' * 100)
+
+        try:
+            put = resource.file('hello.txt').put(src)
+            assert isinstance(put, Future)
+            put.result()
+
+            get = resource.file('hello.txt').get()
+            assert isinstance(get, Future)
+            assert open(get.result()).read() == 'hello xnat\n' * 100
+        finally:
+            resource.delete().result()
+
+def test_attrs_mget():
+    with _async_interface() as aintf:
+        subject = aintf.select.project('P1').subject('P1_S1')
+        values = subject.attrs.mget(['xnat:subjectData/label',
+                                     'xnat:subjectData/ID'])
+
+        assert isinstance(values, Future)
+        assert values.result()[0] == 'P1_S1'
+
+def test_map_errors():
+    with _async_interface() as aintf:
+        subjects = aintf.select.project('P0').subjects()
+
+        def label(subject):
+            if subject.label() == 'P0_S1':
+                raise ValueError(subject.label())
+            return subject.label()
+
+        labels = subjects.map(label, window=1)
+
+        # the results before the failed call are yielded first
+        assert next(labels) == 'P0_S0'
+
+        try:
+            next(labels)
+        except ValueError, e:
+            assert str(e) == 'P0_S1'
+        else:
+            assert False, 'the error of a call must be raised'
+
+        # as are the errors of the requests made by the calls, once the
+        # listing is in memory
+        assert len(list(subjects)) == 3
+        server.truncate = 10
+        try:
+            list(subjects.map(lambda subject: subject.attrs.get(
+                'xnat:subjectData/gender')))
+        except IncompleteRead:
+            pass
+        else:
+            assert False, 'the error of a request must be raised'
+        finally:
+            server.truncate = None
@@ -54,6 +54,18 @@ def test_attr_mset():
     assert set(subject.attrs.mget(field_data.keys())) == \
         set(field_data.values())
 
+def test_bulk_attrs():
+    with central.bulk_attrs() as bulk:
+        bulk.set(experiment, 'xnat:mrSessionData/age', '30')
+        bulk.set(subject, 'xnat:subjectData/investigator/firstname', 'bon')
+        bulk.set(experiment, 'xnat:mrSessionData/age', '31')
+
+    assert len(bulk.results) == 2
+    assert bulk.errors() == {}
+    assert experiment.attrs.get('xnat:mrSessionData/age') == '31.0'
+    assert subject.attrs.get(
+        'xnat:subjectData/investigator/firstname') == 'bon'
+
 def test_cleanup():
     subject.delete()
     assert not subject.exists()
@@ -0,0 +1,90 @@
+import warnings
+import threading
+from urlparse import urlparse, parse_qsl
+
+from ..core.attributes import BulkAttrs
+from ..core.resources import Experiment
+from ..core.threadutil import WorkerPool
+
+
+class _Interface(object):
+    _poolsize = 4
+
+    def __init__(self):
+        self.puts = []
+        self.lock = threading.Lock()
+        self.workers = WorkerPool(4)
+
+    def _get_workers(self):
+        return self.workers
+
+    def _exec(self, uri, method='GET', body=None, headers=None):
+        if '/E2?' in uri:
+            raise Exception('refused')
+
+        with self.lock:
+            self.puts.append(uri)
+
+        return ''
+
+
+def _experiment(intf, ID):
+    experiment = Experiment('/REST/projects/P/experiments/%s' % ID, intf)
+    experiment.attrs._datatype = 'xnat:mrSessionData'
+    return experiment
+
+def test_writes_are_merged_per_element():
+    intf = _Interface()
+
+    with BulkAttrs(intf) as bulk:
+        for ID in ['E0', 'E1', 'E0']:
+            bulk.set(_experiment(intf, ID), 'xnat:mrSessionData/age', ID)
+        bulk.mset(_experiment(intf, 'E0'), {'xnat:mrSessionData/note': 'a b'})
+
+        assert len(bulk) == 2
+
+    assert len(intf.puts) == 2
+
+    put = [uri for uri in intf.puts if '/E0?' in uri][0]
+
+    assert dict(parse_qsl(urlparse(put).query)) == {
+        'xsiType': 'xnat:mrSessionData',
+        'xnat:mrSessionData/age': 'E0',
+        'xnat:mrSessionData/note': 'a b',
+        }
+
+def test_failures_are_reported():
+    intf = _Interface()
+
+    with BulkAttrs(intf, max_inflight=2) as bulk:
+        for ID in ['E1', 'E2', 'E3']:
+            bulk.set(_experiment(intf, ID), 'xnat:mrSessionData/age', '1')
+
+    assert list(bulk.results.keys()) == [
+        '/REST/projects/P/experiments/%s' % ID for ID in ['E1', 'E2', 'E3']]
+    assert list(bulk.errors().keys()) == ['/REST/projects/P/experiments/E2']
+    assert len(intf.puts) == 2
+
+def test_nothing_is_sent_on_error():
+    intf = _Interface()
+
+    try:
+        with BulkAttrs(intf) as bulk:
+            bulk.set(_experiment(intf, 'E1'), 'xnat:mrSessionData/age', '1')
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert intf.puts == []
+
+def test_max_inflight_is_bounded_by_the_pool():
+    intf = _Interface()
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+
+        assert BulkAttrs(intf, max_inflight=4)._max_inflight == 4
+        assert caught == []
+
+        assert BulkAttrs(intf, max_inflight=32)._max_inflight == 4
+        assert [w.category for w in caught] == [RuntimeWarning]
@@ -0,0 +1,460 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+from ..core.cache import HTCache, MemCache, md5name, memstr_to_bytes, \
+    namespace
+
+
+class _CacheManager(object):
+    _warn = False
+
+    def disk_ready(self, path=None):
+        return True, 0.0
+
+
+class _Interface(object):
+    _mode = 'online'
+    cache = _CacheManager()
+
+
+_header = ('status: 200\r\n'
+           'content-type: text/csv\r\n'
+           'etag: "abc"\r\n'
+           'last-modified: Mon, 05 Oct 2026 10:00:00 GMT\r\n'
+           '\r\n')
+
+
+def test_validators_from_stored_headers():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+
+    assert cache.validators(uri) == {}
+
+    cache.set(uri, _header + 'ID\nP1\n')
+
+    assert cache.get_headers(uri)['etag'] == '"abc"'
+    assert cache.validators(uri) == {
+        'if-none-match': '"abc"',
+        'if-modified-since': 'Mon, 05 Oct 2026 10:00:00 GMT',
+        }
+
+def test_refresh_keeps_content():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+
+    cache.set(uri, _header + 'ID\nP1\n')
+    cache.refresh(uri, _header.replace('"abc"', '"def"'))
+
+    assert cache.validators(uri)['if-none-match'] == '"def"'
+    assert cache.get(uri).split('\r\n\r\n', 1)[1] == 'ID\nP1\n'
+
+def test_no_validators_without_content():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+
+    cache.set(uri, _header + 'ID\nP1\n')
+    cache.delete(uri)
+
+    assert cache.get_headers(uri) is None
+    assert cache.validators(uri) == {}
+
+def test_memstr_to_bytes():
+    assert memstr_to_bytes('50K') == 50 * 1024
+    assert memstr_to_bytes('1.5M') == 1.5 * 1024 ** 2
+    assert memstr_to_bytes('2g') == 2 * 1024 ** 3
+
+def test_lru_eviction():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uris = ['http://localhost/data/projects/P%s?format=csv' % i
+            for i in range(4)]
+    content = 'x' * 1000
+
+    # an entry at a user location is never evicted
+    dest = os.path.join(tempfile.mkdtemp(), 'P3.csv')
+    cache.preset(dest)
+    cache.set(uris[3], _header + content)
+
+    for uri in uris[:3]:
+        cache.set(uri, _header + content)
+
+    # reading an entry makes it the most recently used
+    cache.get(uris[0])
+
+    cache.limit = 3 * len(content)
+    cache.set('http://localhost/data/projects?format=csv', _header + content)
+
+    assert cache.get(uris[0]) is not None
+    assert cache.get(uris[1]) is None
+    assert cache.get(uris[2]) is None
+    assert cache.get(uris[3]) is not None
+    assert os.path.exists(dest)
+
+def test_size_accounting():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+
+    cache.set(uri, _header + 'x' * 100)
+    cache.set(uri, _header + 'x' * 10)
+    assert cache.usage() == 10
+
+    cache.preset(os.path.join(tempfile.mkdtemp(), 'projects.csv'))
+    cache.set(uri, _header + 'x' * 20)
+    assert (cache.usage(), cache.usage(custom=True)) == (0, 20)
+
+    cache.delete(uri)
+    assert (cache.usage(), cache.usage(custom=True)) == (0, 0)
+
+def test_migrate_sidecar_files():
+    cachedir = tempfile.mkdtemp()
+    dest = os.path.join(tempfile.mkdtemp(), 'subjects.csv')
+    uris = ['http://localhost/data/projects?format=csv',
+            'http://localhost/data/subjects?format=csv']
+
+    for uri, content in zip(uris, ['ID\nP1\n', 'ID\nS1\n']):
+        open(os.path.join(cachedir, md5name(uri) + '.headers'), 'wb'
+             ).write(_header)
+        open(os.path.join(cachedir, md5name(uri)), 'wb').write(content)
+
+    os.rename(os.path.join(cachedir, md5name(uris[1])), dest)
+    open(os.path.join(cachedir, md5name(uris[1]) + '.alt'), 'wb'
+         ).write(dest)
+
+    cache = HTCache(cachedir, _Interface())
+
+    assert cache.get(uris[0]) == _header + 'ID\nP1\n'
+    assert cache.get_diskpath(uris[1]) == dest
+    assert cache.validators(uris[1])['if-none-match'] == '"abc"'
+    assert not [name for name in os.listdir(cachedir)
+                if name.endswith(('.headers', '.alt'))]
+
+def test_sidecar_keys_from_content_location():
+    cachedir = tempfile.mkdtemp()
+    uri = 'http://localhost/data/projects/P1/files/a.nii'
+    header = _header.replace('\r\n\r\n',
+                             '\r\ncontent-location: %s\r\n\r\n' % uri)
+
+    open(os.path.join(cachedir, md5name(uri) + '.headers'), 'wb'
+         ).write(header)
+    open(os.path.join(cachedir, md5name(uri)), 'wb').write('nifti')
+
+    cache = HTCache(cachedir, _Interface())
+    cache.migrate()
+
+    assert cache.keys(namespace='files') == [uri]
+    assert cache.get_diskpath(uri).startswith(os.path.join(cachedir,
+                                                           'files'))
+    assert cache.get(uri) == header + 'nifti'
+
+def test_failed_store_keeps_previous_entry():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+
+    def chunks():
+        yield 'ID\n'
+        raise IOError('connection reset')
+
+    cache.set(uri, _header + 'ID\nP1\n')
+
+    try:
+        cache.store(uri, _header, chunks())
+    except IOError:
+        pass
+
+    assert cache.get(uri) == _header + 'ID\nP1\n'
+    assert not [name for _, _, names in os.walk(cache.cache)
+                for name in names if name.endswith('.tmp')]
+
+def test_lock_is_reentrant_and_exclusive():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+    events = []
+
+    def other():
+        with cache.lock(uri):
+            events.append('other')
+
+    with cache.lock(uri):
+        with cache.lock(uri):
+            thread = threading.Thread(target=other)
+            thread.start()
+            time.sleep(0.1)
+            events.append('main')
+
+    thread.join()
+
+    assert events == ['main', 'other']
+
+def test_entries_of_a_stripe_are_transferred_concurrently():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    stripes = {}
+
+    # two entries sharing a lock file
+    for i in range(10000):
+        uri = 'http://localhost/data/files/%s' % i
+        stripe = hashlib.md5(cache.safe(uri)).hexdigest()[:3]
+
+        if stripe in stripes:
+            uris = [stripes[stripe], uri]
+            break
+
+        stripes[stripe] = uri
+
+    transferring = threading.Event()
+    done = threading.Event()
+
+    def transfer():
+        with cache.lock(uris[0]):
+            writer = cache.writer(uris[0], _header)
+            writer.write('x' * 10)
+            transferring.set()
+            done.wait(5)
+            writer.commit()
+
+    def other():
+        with cache.lock(uris[1]):
+            cache.set(uris[1], _header + 'y' * 10)
+        done.set()
+
+    thread = threading.Thread(target=transfer)
+    thread.start()
+    transferring.wait(5)
+
+    start = time.time()
+    other()
+    thread.join()
+
+    assert time.time() - start < 1
+    assert cache.get(uris[0]) == _header + 'x' * 10
+    assert cache.get(uris[1]) == _header + 'y' * 10
+
+def test_namespaces():
+    server = 'http://localhost/data/projects/P1'
+
+    assert namespace('http://localhost/schemas/xnat/xnat.xsd') == 'schemas'
+    assert namespace(server + '/resources/R/files/a.nii') == 'files'
+    assert namespace(server + '/resources/R/files?format=zip') == 'files'
+    assert namespace(server + '/resources/R/files?format=csv') == 'data'
+    assert namespace(server + '?format=xml') == 'xml'
+
+def test_sharded_layout():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+    name = md5name(uri)
+
+    cache.set(uri, _header + 'ID\nP1\n')
+
+    assert cache.get_diskpath(uri) == os.path.join(
+        cache.cache, 'data', name[:2], name[2:4], name)
+    assert cache.keys(namespace='data') == [uri]
+    assert cache.keys(namespace='files') == []
+
+def test_migrate_flat_layout():
+    cachedir = tempfile.mkdtemp()
+    uri = 'http://localhost/data/projects/P1/files/a.nii'
+
+    # an index of the previous version, without namespaces
+    cache = HTCache(cachedir, _Interface())
+    db = cache._db()
+    db.execute('UPDATE entries SET namespace = NULL')
+    open(os.path.join(cachedir, md5name(uri)), 'wb').write('nifti')
+    db.execute("INSERT INTO entries (name, key, headers, size, last_access) "
+               "VALUES (?, ?, ?, 5, 0)", (md5name(uri), uri, _header))
+    open(os.path.join(cachedir, 'shape.struct'), 'wb').write('{}')
+
+    assert cache.get(uri) == _header + 'nifti'
+
+    cache.migrate()
+
+    assert cache.get(uri) == _header + 'nifti'
+    assert cache.get_diskpath(uri).startswith(os.path.join(cachedir,
+                                                           'files'))
+    assert os.path.exists(os.path.join(cachedir, 'struct', 'shape.struct'))
+    assert [name for name in os.listdir(cachedir)
+            if os.path.isfile(os.path.join(cachedir, name))
+            and not name.startswith('index.sqlite')] == []
+
+def test_migrate_past_failed_entries():
+    cachedir = tempfile.mkdtemp()
+    cache = HTCache(cachedir, _Interface())
+    db = cache._db()
+    uri = 'http://localhost/data/projects/P1/files/a.nii'
+
+    # a full page of entries that cannot be moved, sorted before the last
+    for i in range(1000):
+        name = '0%031d' % i
+        os.mkdir(os.path.join(cachedir, name))
+        db.execute("INSERT INTO entries (name, key, headers, size, "
+                   "last_access) VALUES (?, ?, ?, 0, 0)",
+                   (name, uri + str(i), _header))
+
+    open(os.path.join(cachedir, md5name(uri)), 'wb').write('nifti')
+    db.execute("INSERT INTO entries (name, key, headers, size, last_access) "
+               "VALUES (?, ?, ?, 5, 0)", (md5name(uri), uri, _header))
+
+    cache.migrate()
+
+    assert cache.get_diskpath(uri).startswith(os.path.join(cachedir,
+                                                           'files'))
+    assert cache.get(uri) == _header + 'nifti'
+
+def test_identical_files_are_stored_once():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uris = ['http://localhost/data/experiments/E%s/resources/R/files/a.nii'
+            % i for i in range(2)]
+
+    for uri in uris:
+        cache.set(uri, _header + 'x' * 100)
+
+    paths = [cache.get_diskpath(uri) for uri in uris]
+
+    assert os.path.samefile(*paths)
+    assert cache.usage() == 100
+
+    cache.delete(uris[0])
+
+    assert cache.get(uris[1]) == _header + 'x' * 100
+    assert cache.usage() == 100
+
+    cache.set(uris[1], _header + 'y' * 10)
+
+    assert cache.usage() == 10
+    assert [name for _, _, names in os.walk(os.path.join(cache.cache,
+                                                         'blobs'))
+            for name in names] == [md5name('y' * 10)]
+
+def test_link_digest():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uris = ['http://localhost/data/experiments/E%s/resources/R/files/a.nii'
+            % i for i in range(2)]
+    dest = os.path.join(tempfile.mkdtemp(), 'a.nii')
+
+    cache.set(uris[0], _header + 'nifti')
+
+    assert cache.link_digest(uris[1], md5name('other')) is None
+    assert cache.link_digest(uris[1], md5name('nifti')) == \
+        cache.get_diskpath(uris[1])
+    assert cache.get(uris[1]) == _header + 'nifti'
+    assert cache.usage() == 5
+
+    # a copy at a user location is not shared
+    assert cache.link_digest(uris[1], md5name('nifti'), dest) == dest
+    assert not os.path.samefile(dest, cache.get_diskpath(uris[0]))
+    assert (cache.usage(), cache.usage(custom=True)) == (5, 5)
+
+def test_memcache_lru_by_size():
+    memcache = MemCache(maxsize=30)
+
+    memcache.set('a', 'x' * 10)
+    memcache.set('b', 'x' * 10)
+    memcache.set('c', ['row'], size=10)
+    memcache.get('a')
+    memcache.set('d', 'x' * 10)
+
+    assert [memcache.get(key) is not None for key in 'abcd'] == \
+        [True, False, True, True]
+    assert memcache.size == 30
+
+    memcache.set('a', 'x')
+    memcache.set('e', 'x' * 31)
+
+    assert memcache.size == 21
+    assert memcache.get('e') is None
+
+def test_memcache_ttl():
+    memcache = MemCache(ttl=0.05)
+
+    memcache.set('a', 'x')
+    assert memcache.get('a') == 'x'
+
+    time.sleep(0.1)
+    assert memcache.get('a') is None
+    assert (len(memcache), memcache.size) == (0, 0)
+
+def test_parsed_rows():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uri = 'http://localhost/data/projects?format=csv'
+    rows = [{'ID': 'P1', 'count': '3'}, {'ID': 'P2', 'count': '4'}]
+
+    assert cache.get_rows(uri) is None
+
+    cache.set(uri, _header + 'ID,count\nP1,3\nP2,4\n')
+    cache.set_rows(uri, rows)
+
+    assert cache.get_rows(uri) == rows
+
+    # the parsed form is ignored once the content changes
+    cache.set(uri, _header + 'ID,count\nP1,3\n')
+    assert cache.get_rows(uri) is None
+
+    # nor are the rows of another content
+    cache.set_rows(uri, rows[:1], 'ID,count\nP2,4\n')
+    assert cache.get_rows(uri) is None
+
+    cache.set_rows(uri, rows[:1], 'ID,count\nP1,3\n')
+    assert cache.get_rows(uri, 'ID,count\nP1,3\n') == rows[:1]
+    assert cache.get_rows(uri, 'ID,count\nP2,4\n') is None
+
+    # the parsed form counts in the cache size
+    columns = [os.path.join(path, name)
+               for path, _, names in os.walk(cache.cache)
+               for name in names if name.endswith('.columns')]
+    assert cache.usage() == len('ID,count\nP1,3\n') + \
+        os.path.getsize(columns[0])
+
+    cache.set_rows(uri, rows[:1], 'ID,count\nP1,3\n')
+    assert cache.usage() == len('ID,count\nP1,3\n') + \
+        os.path.getsize(columns[0])
+
+    cache.set(uri, _header + 'ID,count\nP1,3\n')
+    assert cache.usage() == len('ID,count\nP1,3\n')
+    assert not os.path.exists(columns[0])
+
+    cache.delete(uri)
+    assert not [name for _, _, names in os.walk(cache.cache)
+                for name in names if name.endswith('.columns')]
+
+def test_parsed_rows_are_evicted():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    uris = ['http://localhost/data/projects?format=csv',
+            'http://localhost/data/subjects?format=csv']
+    content = 'ID,count\n' + ''.join('P%s,%s\n' % (i, i) for i in range(100))
+    rows = [{'ID': 'P%s' % i, 'count': str(i)} for i in range(100)]
+
+    cache.set(uris[0], _header + content)
+    cache.set_rows(uris[0], rows, content)
+
+    # room for the content of the second entry, not its rows
+    cache.limit = cache.usage() + len(content)
+    cache.set(uris[1], _header + content)
+    assert cache.get(uris[0]) is not None
+
+    cache.set_rows(uris[1], rows, content)
+
+    assert cache.usage() <= cache.limit
+    assert cache.get(uris[0]) is None
+    assert cache.get_rows(uris[1], content) == rows
+
+def test_memcache_policies():
+    memcache = MemCache(ttl=0.05)
+    memcache.set_policy('.*\\.xsd$', 60)
+    memcache.set_policy('.*/prearchive.*', 0)
+
+    memcache.set('xsd', 'schema', paths=['/schemas/xnat/xnat.xsd'])
+    memcache.set('listing', 'rows', paths=['/data/projects/P1/subjects'])
+    memcache.set('prearchive', 'rows', paths=['/data/prearchive/projects'])
+
+    assert memcache.get('prearchive') is None
+    time.sleep(0.1)
+    assert (memcache.get('xsd'), memcache.get('listing')) == ('schema', None)
+
+    # the last policy set takes precedence
+    memcache.set_policy('.*', 0)
+    memcache.set('xsd', 'schema', paths=['/schemas/xnat/xnat.xsd'])
+    assert memcache.get('xsd') is None
+
+    memcache.set_policy('.*', None)
+    memcache.set('xsd', 'schema', paths=['/schemas/xnat/xnat.xsd'])
+    assert memcache.get('xsd') == 'schema'
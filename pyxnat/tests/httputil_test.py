@@ -0,0 +1,311 @@
+import os
+import time
+import zlib
+import gzip
+import tempfile
+import threading
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+
+import httplib2
+
+from ..core.httputil import ConnectionPool, CHUNK_SIZE, cache_headers, \
+    host_key, redirect_headers
+from ..core.httputil import MultipartFile, file_message
+from ..core.cache import HTCache
+
+_payload = os.urandom(3 * CHUNK_SIZE + 17)
+_listing = '\n'.join('E%s,subject_%s,/data/experiments/E%s' % (i, i, i)
+                     for i in range(20000))
+
+
+def _gzip(content):
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(content)
+    f.close()
+    return buf.getvalue()
+
+_encoded = {'/gzip': ('gzip', _gzip(_listing)),
+            '/deflate': ('deflate', zlib.compress(_listing)),
+            '/rawdeflate': ('deflate', zlib.compress(_listing)[2:-4]),
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    active = [0, 0]
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/payload')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path == '/payload':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(_payload)))
+            self.end_headers()
+            self.wfile.write(_payload)
+            return
+
+        if self.path in _encoded:
+            encoding, body = _encoded[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        with self.lock:
+            self.active[0] += 1
+            self.active[1] = max(self.active)
+
+        time.sleep(0.05)
+
+        with self.lock:
+            self.active[0] -= 1
+
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        length = int(self.headers['Content-Length'])
+        _Handler.uploaded = self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+server = _Server(('127.0.0.1', 0), _Handler)
+thread = threading.Thread(target=server.serve_forever)
+thread.daemon = True
+thread.start()
+
+base_url = 'http://127.0.0.1:%s' % server.server_address[1]
+
+
+class _CacheManager(object):
+    _warn = False
+
+    def disk_ready(self, path=None):
+        return True, 0.0
+
+
+class _Interface(object):
+    _mode = 'online'
+    cache = _CacheManager()
+
+
+def test_pool_bounds_concurrent_requests():
+    _Handler.active[:] = [0, 0]
+    pool = ConnectionPool(None, httplib2.Http, maxsize=4)
+    results = {}
+
+    def fetch(i):
+        response, content = pool.request('%s/data/%s' % (base_url, i))
+        results[i] = content
+
+    threads = [threading.Thread(target=fetch, args=(i, ))
+               for i in range(16)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    assert _Handler.active[1] <= 4
+    assert sorted(results.keys()) == list(range(16))
+    assert all(results[i].endswith('/data/%s' % i) for i in results)
+
+def test_pool_nested_requests_do_not_block():
+    pool = ConnectionPool(None, httplib2.Http, maxsize=1)
+    ticket = pool.acquire(base_url)
+
+    try:
+        response, content = pool.request('%s/nested' % base_url)
+    finally:
+        pool.release(ticket)
+
+    assert response.status == 200
+
+def test_pool_release_from_another_thread():
+    pool = ConnectionPool(None, httplib2.Http, maxsize=1)
+    response = pool.urlopen('%s/payload' % base_url)
+
+    closer = threading.Thread(target=response.close)
+    closer.start()
+    closer.join()
+
+    # the slot is free and the opening thread is bound again
+    assert pool._held()[host_key(base_url)] == 0
+
+    fetcher = threading.Thread(target=pool.request,
+                               args=('%s/again' % base_url, ))
+    fetcher.daemon = True
+    fetcher.start()
+    fetcher.join(5)
+    assert not fetcher.is_alive()
+
+def test_pool_failed_client_frees_its_slot():
+    failures = [IOError('no client')]
+
+    def factory():
+        if failures:
+            raise failures.pop()
+        return httplib2.Http()
+
+    pool = ConnectionPool(None, factory, maxsize=1)
+
+    try:
+        pool.request('%s/data/0' % base_url)
+    except IOError:
+        pass
+
+    fetcher = threading.Thread(target=pool.request,
+                               args=('%s/data/1' % base_url, ))
+    fetcher.daemon = True
+    fetcher.start()
+    fetcher.join(5)
+    assert not fetcher.is_alive()
+
+def test_redirect_headers():
+    headers = {'authorization': 'Basic xyz', 'cookie': 'JSESSIONID=1',
+               'accept-encoding': 'gzip'}
+
+    assert redirect_headers('http://xnat/data/a', 'http://XNAT:80/data/b',
+                            headers) == headers
+    assert redirect_headers('http://xnat/data/a', 'https://xnat/data/b',
+                            headers) == {'accept-encoding': 'gzip'}
+    assert redirect_headers('https://xnat/data/a', 'https://s3/a',
+                            headers) == {'accept-encoding': 'gzip'}
+
+    try:
+        redirect_headers('https://xnat/data/a', 'http://xnat/data/b',
+                         headers)
+    except httplib2.HttpLib2Error:
+        pass
+    else:
+        assert False, 'a redirection to http must be refused'
+
+def test_cache_preset_is_per_thread():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    seen = {}
+
+    def preset(name):
+        cache.preset(os.path.join(cache.cache, name))
+        time.sleep(0.05)
+        seen[name] = cache._cachepath
+
+    threads = [threading.Thread(target=preset, args=('f%s' % i, ))
+               for i in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    assert cache._cachepath is None
+    assert all(seen[name].endswith(name) for name in seen)
+
+def test_urlopen_streams_body_in_chunks():
+    pool = ConnectionPool(None, httplib2.Http, maxsize=1)
+    response = pool.urlopen('%s/redirect' % base_url)
+
+    assert response.status == 200
+    assert response.uri.endswith('/payload')
+
+    chunks = list(response.iter_content())
+
+    assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE
+    assert ''.join(chunks) == _payload
+
+    # the connection went back to the pool and can be reused
+    assert pool.request('%s/again' % base_url)[0].status == 200
+
+def test_cache_store_writes_chunks_to_location():
+    cache = HTCache(tempfile.mkdtemp(), _Interface())
+    pool = ConnectionPool(cache, httplib2.Http, maxsize=1)
+    uri = '%s/payload' % base_url
+    dest = os.path.join(tempfile.mkdtemp(), 'payload.bin')
+
+    response = pool.urlopen(uri)
+    location = cache.store(uri, cache_headers(response.headers, uri),
+                           response.iter_content(), dest)
+
+    assert location == dest
+    assert cache.get_diskpath(uri) == dest
+    assert open(dest, 'rb').read() == _payload
+    assert cache.get(uri).split('\r\n\r\n', 1)[1] == _payload
+
+def test_multipart_file_matches_file_message():
+    src = tempfile.mktemp()
+    open(src, 'wb').write(_payload)
+
+    body, content_type = file_message(_payload, 'application/zip',
+                                      'a.zip', 'a.zip')
+    streamed = MultipartFile('application/zip', 'a.zip', 'a.zip', src=src)
+
+    assert len(streamed) == len(body)
+    assert ''.join(streamed) == body
+    assert streamed.content_type.split('boundary=')[0] == \
+        content_type.split('boundary=')[0]
+
+    in_memory = MultipartFile('application/zip', 'a.zip', 'a.zip',
+                              content=_payload)
+
+    assert ''.join(in_memory) == body
+
+def test_urlopen_streams_multipart_upload():
+    src = tempfile.mktemp()
+    open(src, 'wb').write(_payload)
+    seen = []
+
+    body = MultipartFile('application/octet-stream', src, 'payload.bin',
+                         src=src, progress=lambda *args: seen.append(args))
+    pool = ConnectionPool(None, httplib2.Http, maxsize=1)
+    response = pool.urlopen('%s/upload' % base_url, 'PUT', body,
+                            {'content-type': body.content_type})
+    response.read()
+
+    assert response.status == 200
+    assert _Handler.uploaded == ''.join(body)
+    assert seen[-1] == (len(body), len(body))
+
+def test_urlopen_decompresses_incrementally():
+    for path in _encoded:
+        pool = ConnectionPool(None, httplib2.Http, maxsize=1)
+        response = pool.urlopen(base_url + path,
+                                headers={'accept-encoding': 'gzip, deflate'})
+
+        assert 'content-encoding' not in response.headers
+        assert response.headers['-content-encoding'] == _encoded[path][0]
+
+        chunks = list(response.iter_content(4096))
+
+        assert max(len(chunk) for chunk in chunks) <= 4096
+        assert ''.join(chunks) == _listing
+        assert response.wire_bytes == len(_encoded[path][1])
+        assert response.decoded_bytes == len(_listing)
+        assert pool.wire_bytes == response.wire_bytes
+        assert pool.decoded_bytes == len(_listing)
@@ -1,6 +1,9 @@
 import os
+import copy
 import tempfile
 
+from nose.plugins.skip import SkipTest
+
 from .. import jsonutil
 
 _csv_example = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
@@ -47,3 +50,252 @@ def test_join():
 
 
 
+
+def test_columns_roundtrip():
+    dest = tempfile.mkstemp()[1]
+    headers = sorted(_list_of_dirs[0].keys())
+
+    jsonutil.dump_columns(headers, _list_of_dirs, dest, {'version': 1})
+    names, columns, meta = jsonutil.load_columns(dest)
+
+    assert (names, meta) == (headers, {'version': 1})
+    assert jsonutil.columns_to_json(names, columns) == _list_of_dirs
+
+def test_columns_types():
+    dest = tempfile.mkstemp()[1]
+    rows = [{'ID': 'E%s' % i, 'age': str(20 + i), 'weight': repr(60.5 + i),
+             'project': 'P%s' % (i % 2), 'note': ['007', '1e3'][i % 2]}
+            for i in range(20)]
+    headers = ['ID', 'age', 'weight', 'project', 'note']
+
+    jsonutil.dump_columns(headers, rows, dest)
+    columns = dict(zip(headers, jsonutil.load_columns(dest)[1]))
+
+    assert columns['age'].typecode == 'i'
+    assert columns['weight'].typecode == 'd'
+    assert columns['note'] == [row['note'] for row in rows]
+    assert jsonutil.columns_to_json(
+        headers, jsonutil.load_columns(dest)[1]) == rows
+
+def _check_column_table():
+    ctable = jsonutil.ColumnTable(_list_of_dirs)
+    header = 'psytool_audit_parentdata_audit9'
+
+    assert ctable.headers() == jtable.headers()
+    assert ctable.data == jtable.data
+    assert ctable.get('subject_label', '*0*') == \
+        jtable.get('subject_label', '*0*')
+    assert ctable.where('5154').data == jtable.where('5154').data
+    assert ctable.where(**{header: '0'}).data == \
+        jtable.where(**{header: '0'}).data
+    assert ctable.where_not('5154').data == jtable.where_not('5154').data
+    assert ctable.select(['projects', 'subjectid']).data == \
+        jtable.select(['projects', 'subjectid']).data
+    assert ctable[-1].data == jtable[-1].data
+    assert ctable[2:5].data == jtable[2:5].data
+    assert ctable.items() == jtable.items()
+
+    ordered = jsonutil.ColumnTable(_list_of_dirs, ['subjectid', header])
+    assert ordered.dumps_csv() == \
+        jsonutil.JsonTable(_list_of_dirs, ['subjectid', header]).dumps_csv()
+
+def test_column_table():
+    _check_column_table()
+
+def test_column_table_without_numpy():
+    numpy = jsonutil.numpy
+    jsonutil.numpy = None
+    try:
+        _check_column_table()
+    finally:
+        jsonutil.numpy = numpy
+
+def test_csv_to_columns():
+    headers, columns = jsonutil.csv_to_columns('ID,label,ID\nE1,a,E2\n')
+    table = jsonutil.ColumnTable.from_columns(headers, columns)
+
+    assert table.data == jsonutil.csv_to_json('ID,label,ID\nE1,a,E2\n')
+    assert len(jsonutil.ColumnTable.from_columns(
+        *jsonutil.csv_to_columns('ID,label\n'))) == 0
+
+    # blank lines and ragged rows
+    headers, columns = jsonutil.csv_to_columns('ID,label\nE1,a\nE2,b\n\n')
+    assert columns == [('E1', 'E2'), ('a', 'b')]
+
+    headers, columns = jsonutil.csv_to_columns('ID,label\nE1\nE2,b,c\n')
+    assert columns == [('E1', 'E2'), ('', 'b')]
+
+def test_iter_csv_to_json():
+    content = open(_csv_example, 'rb').read()
+    content += '"multi\nline",' + ',' * (len(jtable.headers()) - 2) + '\n'
+
+    for size in [1, 7, 4096]:
+        chunks = [content[i:i + size] for i in range(0, len(content), size)]
+        assert list(jsonutil.iter_csv_to_json(chunks)) == \
+            jsonutil.csv_to_json(content)
+
+    # the rows come as soon as they are received
+    received = []
+
+    def chunks():
+        for chunk in ['ID,label\nE1,a\nE2', ',b\n']:
+            received.append(chunk)
+            yield chunk
+
+    rows = jsonutil.iter_csv_to_json(chunks())
+    assert (next(rows), len(received)) == ({'ID': 'E1', 'label': 'a'}, 1)
+    assert list(rows) == [{'ID': 'E2', 'label': 'b'}]
+    assert list(jsonutil.iter_csv_to_json([])) == []
+
+def test_index():
+    for table in [jsonutil.JsonTable(_list_of_dirs),
+                  jsonutil.ColumnTable(_list_of_dirs)]:
+        labels = table.get('subject_label')
+        table.index('subject_label')
+
+        assert table.index('subject_label') is table.index('subject_label')
+        assert sorted(i for positions in
+                      table.index('subject_label').values()
+                      for i in positions) == range(len(table))
+
+        for label in labels[:50] + ['missing']:
+            assert table.where(subject_label=label).data == \
+                jsonutil.get_where(_list_of_dirs, subject_label=label)
+
+        label = labels[0]
+        assert table.where('5154', subject_label=label).data == \
+            jsonutil.get_where(_list_of_dirs, '5154', subject_label=label)
+        assert table.where(subject_label=label)._indexes == {}
+
+def test_join_how():
+    subjects = jsonutil.JsonTable([
+        {'project': 'P1', 'subject': 'S1', 'age': '30'},
+        {'project': 'P1', 'subject': 'S2', 'age': '40'},
+        {'project': 'P2', 'subject': 'S1', 'age': '50'},
+        ])
+    experiments = jsonutil.JsonTable([
+        {'project': 'P1', 'subject': 'S1', 'ID': 'E1', 'age': '31'},
+        {'project': 'P1', 'subject': 'S1', 'ID': 'E2', 'age': '32'},
+        {'project': 'P3', 'subject': 'S9', 'ID': 'E3', 'age': '33'},
+        ])
+    scores = jsonutil.JsonTable([
+        {'project': 'P1', 'subject': 'S1', 'score': '7'},
+        ])
+    keys = ['project', 'subject']
+    before = copy.deepcopy([subjects.data, experiments.data, scores.data])
+
+    def rows(table):
+        return sorted(sorted(row.items()) for row in table)
+
+    inner = subjects.join(keys, experiments, suffixes=['', '_1'])
+    assert rows(inner) == rows([
+        {'project': 'P1', 'subject': 'S1', 'age': '30', 'ID': 'E1',
+         'age_1': '31'},
+        {'project': 'P1', 'subject': 'S1', 'age': '30', 'ID': 'E2',
+         'age_1': '32'},
+        ])
+
+    # without suffixes the columns are merged, the last table wins
+    assert rows(subjects.join(keys, experiments)) == rows([
+        {'project': 'P1', 'subject': 'S1', 'age': '31', 'ID': 'E1'},
+        {'project': 'P1', 'subject': 'S1', 'age': '32', 'ID': 'E2'},
+        ])
+
+    left = subjects.join(keys, experiments, how='left',
+                         suffixes=['', '_1'])
+    assert len(left) == 4
+    assert left.where(subject='S2').data == [
+        {'project': 'P1', 'subject': 'S2', 'age': '40', 'ID': None,
+         'age_1': None}]
+    assert subjects.join(keys, experiments, how='left').where(
+        subject='S2').data == [
+        {'project': 'P1', 'subject': 'S2', 'age': '40', 'ID': None}]
+
+    outer = subjects.join(keys, experiments, scores, how='outer',
+                          suffixes=['_subject', '_experiment', ''])
+    assert len(outer) == 5
+    assert set(outer.headers()) == set(keys + ['age_subject', 'ID',
+                                               'age_experiment', 'score'])
+    assert outer.where(ID='E3').data == [
+        {'project': 'P3', 'subject': 'S9', 'age_subject': None,
+         'ID': 'E3', 'age_experiment': '33', 'score': None}]
+
+    # a row is not repeated for every other table
+    assert len(subjects.join(keys, experiments, scores)) == 2
+
+    assert [subjects.data, experiments.data, scores.data] == before
+
+def test_join_missing_keys():
+    subjects = jsonutil.JsonTable([
+        {'subject': 'S1', 'age': '30'},
+        {'subject': None, 'age': '40'},
+        ])
+    experiments = jsonutil.JsonTable([
+        {'subject': None, 'ID': 'E1'},
+        {'subject': 'S1', 'ID': 'E2'},
+        ])
+
+    assert subjects.join('subject', experiments).data == [
+        {'subject': 'S1', 'age': '30', 'ID': 'E2'}]
+    assert subjects.join('subject', experiments, how='left').data == [
+        {'subject': 'S1', 'age': '30', 'ID': 'E2'},
+        {'subject': None, 'age': '40', 'ID': None}]
+    assert len(subjects.join('subject', experiments, how='outer')) == 3
+
+_typed = [
+    {'ID': 'E1', 'age': '30', 'weight': '70.5', 'date': '2020-01-31',
+     'code': '007'},
+    {'ID': 'E2', 'age': '', 'weight': '-1e3', 'date': '',
+     'code': '012'},
+    ]
+
+def test_to_numpy():
+    numpy = jsonutil.numpy
+
+    if numpy is None:
+        raise SkipTest('numpy is not installed')
+
+    for table in [jsonutil.JsonTable(_typed, ['ID']),
+                  jsonutil.ColumnTable(_typed, ['ID'])]:
+        records = table.to_numpy()
+
+        assert list(records.dtype.names) == table.as_list()[0]
+        assert set(records.dtype[name] for name in records.dtype.names) \
+            == set([numpy.dtype(object)])
+        assert records['age'].tolist() == ['30', '']
+
+        records = table.to_numpy(infer_types=True)
+
+        assert records['ID'].tolist() == ['E1', 'E2']
+        assert records['code'].tolist() == ['007', '012']
+        assert records['age'].dtype == 'float64'
+        assert records['age'][0] == 30 and numpy.isnan(records['age'][1])
+        assert records['weight'].tolist() == [70.5, -1000.0]
+        assert records['date'][0] == numpy.datetime64('2020-01-31')
+        assert numpy.isnat(records['date'][1])
+
+    assert jsonutil.infer_column(['1', '2']).dtype == 'int64'
+    assert jsonutil.infer_column(['1', 'x']).tolist() == ['1', 'x']
+    assert jsonutil.infer_column(['2020-01-31 12:00', None])[0] == \
+        numpy.datetime64('2020-01-31T12:00')
+
+def test_to_pandas_and_arrow():
+    try:
+        import pandas
+        import pyarrow
+    except ImportError:
+        raise SkipTest('pandas and pyarrow are not installed')
+
+    for table in [jsonutil.JsonTable(_typed), jsonutil.ColumnTable(_typed)]:
+        frame = table.to_pandas(infer_types=True)
+
+        assert list(frame.columns) == table.as_list()[0]
+        assert frame['age'].isnull().tolist() == [False, True]
+        assert frame['code'].tolist() == ['007', '012']
+
+        arrow = table.to_arrow(infer_types=True)
+
+        assert arrow.schema.names == table.as_list()[0]
+        assert arrow.column('age').null_count == 1
+        assert arrow.column('code').type == pyarrow.string()
+        assert table.to_arrow().column('age').to_pylist() == [u'30', u'']
@@ -0,0 +1,76 @@
+import time
+import tempfile
+import threading
+
+from .. import Interface
+from ..core.resources import Projects
+from ..core.threadutil import WorkerPool
+
+
+class _Inspector(object):
+    _tick = 30
+    _auto = False
+
+
+class _Interface(object):
+    _struct = {}
+    _callback = None
+    _prefetch = 0
+
+    set_prefetch = Interface.set_prefetch.im_func
+
+    def __init__(self):
+        self._cachedir = tempfile.mkdtemp()
+        self._workers = WorkerPool(8)
+        self.inspect = _Inspector()
+        self.lock = threading.Lock()
+        self.running = [0, 0]
+
+    def _get_entry_point(self):
+        return '/REST'
+
+    def _get_workers(self):
+        return self._workers
+
+    def _get_json(self, uri):
+        with self.lock:
+            self.running[0] += 1
+            self.running[1] = max(self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running[0] -= 1
+
+        uri = uri.split('?')[0]
+
+        if uri.endswith('/projects'):
+            return [{'ID': 'P%s' % i} for i in range(6)]
+
+        return [{'ID': '%s_S%s' % (uri.split('/')[-2], i)}
+                for i in range(3)]
+
+
+def _subjects(prefetch):
+    intf = _Interface()
+    intf.set_prefetch(prefetch)
+    subjects = Projects('/REST/projects', intf).subjects()
+
+    return [subject._uri for subject in subjects], intf.running[1]
+
+def test_prefetch_keeps_order():
+    serial, serial_concurrency = _subjects(0)
+    prefetched, concurrency = _subjects(4)
+
+    assert len(serial) == 18
+    assert serial[:3] == ['/REST/projects/P0/subjects/P0_S0',
+                          '/REST/projects/P0/subjects/P0_S1',
+                          '/REST/projects/P0/subjects/P0_S2']
+    assert prefetched == serial
+    assert serial_concurrency == 1
+    assert 1 < concurrency <= 4
+
+def test_prefetch_is_lazy():
+    intf = _Interface()
+    intf.set_prefetch(2)
+    subjects = iter(Projects('/REST/projects', intf).subjects())
+
+    assert next(subjects)._uri == '/REST/projects/P0/subjects/P0_S0'
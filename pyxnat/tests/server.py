@@ -0,0 +1,886 @@
+""" In-process stand-in for the parts of the XNAT REST API used by
+pyxnat, to test and benchmark it without a live server.
+
+The server holds a tree of projects, subjects, experiments, scans,
+resources and files, generated from a seed, and serves:
+    - /data/JSESSION and /data/version
+    - collection listings in csv or json, with the columns and filters
+      query parameters
+    - element documents, format=xml
+    - file downloads and resource zip downloads
+    - element creation and attribute updates with PUT, file uploads
+      (multipart or raw), DELETE
+    - /data/search with a search document in the body
+
+Responses carry an ETag, conditional requests get a 304 and text
+responses are compressed when the client accepts gzip.
+
+Examples
+--------
+    >>> with XnatStandIn(projects=2, subjects=10, seed=1) as server:
+    >>>     interface = Interface(server.url, 'admin', 'admin',
+                                  cachedir=tempfile.mkdtemp())
+    >>>     interface.select.projects().get()
+    ['P0', 'P1']
+"""
+from __future__ import with_statement
+
+import os
+import csv
+import gzip
+import json
+import time
+import random
+import socket
+import fnmatch
+import hashlib
+import zipfile
+import binascii
+import threading
+import traceback
+from collections import OrderedDict
+from email.utils import formatdate
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import BytesIO as StringIO
+try:
+    from urlparse import urlparse, parse_qsl
+    from urllib import unquote
+except ImportError:
+    from urllib.parse import urlparse, parse_qsl, unquote
+
+from lxml import etree
+
+
+_xdat = '{http://nrg.wustl.edu/security}'
+
+# columns of the REST listings, in the order XNAT returns them
+_columns = {
+    'projects': ['ID', 'secondary_ID', 'name', 'description',
+                 'pi_firstname', 'pi_lastname', 'URI'],
+    'subjects': ['ID', 'project', 'label', 'insert_date', 'insert_user',
+                 'URI'],
+    'experiments': ['ID', 'project', 'label', 'date', 'xsiType',
+                    'insert_date', 'URI'],
+    'assessors': ['ID', 'project', 'label', 'date', 'xsiType',
+                  'insert_date', 'URI'],
+    'reconstructions': ['ID', 'type', 'baseScanType', 'xsiType', 'URI'],
+    'scans': ['ID', 'type', 'quality', 'xsiType', 'note',
+              'series_description', 'URI'],
+    'resources': ['xnat_abstractresource_id', 'label', 'element_name',
+                  'category', 'cat_id', 'cat_desc', 'format', 'content',
+                  'tags', 'file_count', 'file_size'],
+    'files': ['Name', 'Size', 'URI', 'collection', 'file_tags',
+              'file_format', 'file_content', 'cat_ID', 'digest'],
+    }
+
+_datatypes = {'projects': 'xnat:projectData',
+              'subjects': 'xnat:subjectData',
+              'experiments': 'xnat:mrSessionData',
+              'assessors': 'xnat:mrAssessorData',
+              'reconstructions': 'xnat:reconstructedImageData',
+              'scans': 'xnat:mrScanData',
+              'resources': 'xnat:resourceCatalog',
+              }
+
+# collections whose elements can also be reached from the root
+_global = ['subjects', 'experiments']
+
+# collections also listed for a whole project e.g. /data/projects/P1/scans
+_project_wide = ['experiments', 'scans']
+
+# query parameters that are not listing filters or attributes
+_options = ['format', 'columns', 'xsiType', 'content', 'tags', 'overwrite',
+            'extract', 'inbody', 'allowDataDeletion', 'event_reason',
+            'removeFiles', 'triggerPipelines', 'fixScanTypes',
+            'pullDataFromHeaders', 'req_format', 'use_label']
+
+# search fields that map to REST columns
+_search_aliases = {'ID': 'ID', 'SUBJECT_ID': 'ID', 'EXPT_ID': 'ID',
+                   'SESSION_ID': 'ID', 'PROJECT': 'project',
+                   'LABEL': 'label', 'SUBJECT_LABEL': 'label',
+                   'DATE': 'date', 'INSERT_DATE': 'insert_date',
+                   }
+
+
+class Element(object):
+    """ A node of the stand-in database.
+    """
+    def __init__(self, collection, ID, parent, fields=None, content=None):
+        self.collection = collection
+        self.ID = ID
+        self.parent = parent
+        self.fields = fields if fields is not None else {}
+        self.children = OrderedDict()
+        self.content = content
+        self.modified = time.time()
+
+    @property
+    def path(self):
+        if self.parent is None:
+            return '/data'
+
+        return '%s/%s/%s' % (self.parent.path, self.collection, self.ID)
+
+    @property
+    def uri(self):
+        """ The URI listed by XNAT, through the root collection of the
+            closest subject or experiment.
+        """
+        if self.parent is None:
+            return '/data'
+
+        if self.collection in _global:
+            return '/data/%s/%s' % (self.collection, self.ID)
+
+        return '%s/%s/%s' % (self.parent.uri, self.collection, self.ID)
+
+    def get(self, column):
+        if column in self.fields:
+            return self.fields[column]
+
+        lower = column.lower()
+
+        for key, value in self.fields.items():
+            if key.lower() == lower:
+                return value
+
+        return ''
+
+    def walk(self):
+        """ Yields the element and all its descendants.
+        """
+        yield self
+
+        for collection in self.children.values():
+            for child in list(collection.values()):
+                for element in child.walk():
+                    yield element
+
+
+class XnatStandIn(object):
+    """ Local HTTP server mimicking an XNAT server, see the module
+        documentation.
+
+        Attributes
+        ----------
+        url: string
+            Base URL of the running server.
+        root: :class:`Element`
+            Root of the database, its children are the projects.
+        requests: list
+            The (method, path) of every request received.
+        request_headers: list
+            The headers of every request received, in the same order.
+        redirects: dict
+            Locations to which the requests of some paths are
+            redirected, with a 302.
+        cache_control: string
+            If not None, the Cache-Control header of the responses to GET
+            requests, e.g. no-store.
+        truncate: int
+            If not None, the bodies of the responses are cut after this
+            many bytes and the connection is closed, as by a network
+            failure.
+    """
+    def __init__(self, projects=2, subjects=4, experiments=2, scans=2,
+                 files=2, file_size=1024, seed=0, latency=0.0,
+                 compress=True):
+        """
+            Parameters
+            ----------
+            projects, subjects, experiments, scans, files: int
+                Number of elements generated at each level, per parent.
+                Every scan has a DICOM resource holding `files` files.
+            file_size: int
+                Size in bytes of the generated files.
+            seed: int
+                Seed of the generated attributes and file contents.
+            latency: float
+                Time in seconds the server waits before answering every
+                request, to emulate a remote server.
+            compress: boolean
+                Whether to gzip text responses for clients accepting it.
+        """
+        self.latency = latency
+        self.compress = compress
+        self.requests = []
+        self.request_headers = []
+        self.redirects = {}
+        self.cache_control = None
+        self.truncate = None
+
+        self.url = None
+        self.root = Element(None, None, None)
+
+        self._lock = threading.RLock()
+        self._counters = {}
+        self._httpd = None
+        self._thread = None
+
+        self.populate(projects, subjects, experiments, scans, files,
+                      file_size, seed)
+
+    # database
+
+    def _next_id(self, collection):
+        count = self._counters.get(collection, 0) + 1
+        self._counters[collection] = count
+
+        if collection == 'subjects':
+            return 'XNAT_S%05d' % count
+        elif collection in ['experiments', 'assessors', 'reconstructions']:
+            return 'XNAT_E%05d' % count
+
+        return str(count)
+
+    def add(self, parent, collection, label, fields=None, content=None):
+        """ Adds an element to the database.
+
+            Parameters
+            ----------
+            parent: :class:`Element`
+                The parent element.
+            collection: string
+                The REST collection name e.g. subjects.
+            label: string
+                Label of the element, also its ID for projects, scans and
+                files. Other elements get a generated ID unless `fields`
+                has one.
+            fields: dict
+                Additional attributes.
+            content: string
+                Content of a file.
+        """
+        fields = dict(fields or {})
+
+        with self._lock:
+            if collection in ['projects', 'scans', 'files']:
+                ID = label
+            else:
+                ID = fields.pop('ID', None) or self._next_id(collection)
+
+            element = Element(collection, ID, parent, content=content)
+            parent.children.setdefault(collection, OrderedDict())[ID] = \
+                element
+
+            datatype = fields.pop('xsiType', _datatypes.get(collection))
+
+            if collection == 'resources':
+                element.fields.update({'xnat_abstractresource_id': ID,
+                                       'label': label,
+                                       'element_name': datatype,
+                                       'category': 'resources',
+                                       'cat_id': ID,
+                                       'format': fields.pop('format', ''),
+                                       'content': fields.pop('content', ''),
+                                       'tags': '',
+                                       })
+            elif collection == 'files':
+                element.fields.update({'Name': os.path.basename(label),
+                                       'collection': parent.get('label'),
+                                       'cat_ID': parent.ID,
+                                       })
+            else:
+                element.fields.update({'ID': ID,
+                                       'label': label,
+                                       'xsiType': datatype,
+                                       'insert_date': '2020-01-01 00:00:00',
+                                       'insert_user': 'admin',
+                                       })
+
+                project = parent
+                while project.collection not in [None, 'projects']:
+                    project = project.parent
+
+                if project.collection == 'projects':
+                    element.fields['project'] = project.ID
+
+            element.fields['URI'] = element.uri
+            element.fields.update(fields)
+
+            if content is not None:
+                self._set_content(element, content)
+
+        return element
+
+    def _set_content(self, element, content):
+        element.content = content
+        element.modified = time.time()
+        element.fields['Size'] = str(len(content))
+        element.fields['digest'] = hashlib.md5(content).hexdigest()
+
+        resource = element.parent
+        files = resource.children.get('files', {}).values()
+        resource.fields['file_count'] = str(len(files))
+        resource.fields['file_size'] = str(sum(len(f.content or '')
+                                               for f in files))
+
+    def remove(self, element):
+        """ Removes an element and its descendants.
+        """
+        with self._lock:
+            del element.parent.children[element.collection][element.ID]
+
+    def find(self, parent, collection, ident):
+        """ Returns the child element of `parent` with the given ID or
+            label, or None.
+        """
+        children = parent.children.get(collection, {})
+
+        if ident in children:
+            return children[ident]
+
+        for child in children.values():
+            if child.get('label') == ident:
+                return child
+
+        if parent is self.root and collection in _global:
+            for child in self.collection(self.root, collection):
+                if ident in [child.ID, child.get('label')]:
+                    return child
+
+        return None
+
+    def collection(self, parent, collection):
+        """ Returns the elements of a collection, the root collections
+            of subjects and experiments list all of them and those of a
+            project the experiments and scans of its subjects.
+        """
+        if parent is self.root and collection in _global:
+            return [element for element in self.root.walk()
+                    if element.collection == collection]
+
+        if parent.collection == 'projects' and collection in _project_wide:
+            return [element for element in parent.walk()
+                    if element.collection == collection]
+
+        return list(parent.children.get(collection, {}).values())
+
+    def element(self, path):
+        """ Returns the element at a REST path, or None.
+        """
+        target = self._resolve(path)
+
+        if target is None or target[2] is None:
+            return None
+
+        return self.find(*target)
+
+    def populate(self, projects, subjects, experiments, scans, files,
+                 file_size, seed):
+        """ Generates the database.
+        """
+        rand = random.Random(seed)
+
+        def content():
+            if file_size == 0:
+                return ''
+
+            return binascii.unhexlify('%0*x' % (2 * file_size,
+                                                rand.getrandbits(8 * file_size)))
+
+        for p in range(projects):
+            project = self.add(self.root, 'projects', 'P%s' % p,
+                               {'name': 'Project %s' % p,
+                                'secondary_ID': 'project_%s' % p,
+                                'pi_lastname': rand.choice(['Doe', 'Roe']),
+                                })
+
+            for s in range(subjects):
+                subject = self.add(project, 'subjects', '%s_S%s' % (
+                    project.ID, s), {'xnat:subjectData/gender': rand.choice(
+                        ['male', 'female'])})
+
+                for e in range(experiments):
+                    experiment = self.add(
+                        subject, 'experiments', '%s_E%s' % (subject.get(
+                            'label'), e),
+                        {'date': '2020-%02d-%02d' % (rand.randint(1, 12),
+                                                     rand.randint(1, 28)),
+                         'xnat:mrSessionData/age': str(rand.randint(20, 80)),
+                         })
+
+                    for c in range(scans):
+                        scan = self.add(experiment, 'scans', str(c + 1),
+                                        {'type': rand.choice(
+                                            ['T1', 'T2', 'DTI', 'BOLD']),
+                                         'quality': 'usable'})
+
+                        if files:
+                            resource = self.add(scan, 'resources', 'DICOM',
+                                                {'format': 'DICOM'})
+
+                            for f in range(files):
+                                self.add(resource, 'files', '%s.dcm' % f,
+                                         content=content())
+
+    # requests
+
+    def _resolve(self, path):
+        """ Splits a REST path into (parent element, collection, ID), the
+            ID being None for a collection. Returns None for unknown
+            paths.
+        """
+        segments = [unquote(seg) for seg in path.strip('/').split('/')]
+
+        if segments[0] not in ['data', 'REST']:
+            return None
+
+        segments = segments[1:]
+        parent = self.root
+
+        while segments:
+            collection = segments[0]
+
+            if collection not in _columns:
+                return None
+
+            if len(segments) == 1:
+                return parent, collection, None
+
+            if collection == 'files':
+                return parent, collection, '/'.join(segments[1:])
+
+            child = self.find(parent, collection, segments[1])
+
+            if len(segments) == 2:
+                return parent, collection, segments[1]
+
+            if child is None:
+                return None
+
+            parent, segments = child, segments[2:]
+
+        return None
+
+    def handle(self, method, path, query, headers, body):
+        """ Answers a request.
+
+            Returns
+            -------
+            A (status, headers, body) tuple.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests.append((method, path))
+            self.request_headers.append(headers)
+
+        if path in self.redirects:
+            return 302, {'Location': self.redirects[path]}, ''
+
+        params = OrderedDict(parse_qsl(query, keep_blank_values=True))
+        segments = path.strip('/').split('/')
+
+        if segments[1:] == ['JSESSION']:
+            if method == 'DELETE':
+                return 200, {}, ''
+
+            session = binascii.hexlify(os.urandom(16)).upper()
+            return 200, {'Set-Cookie': 'JSESSIONID=%s; Path=/' % session,
+                         'Content-Type': 'text/plain'}, session
+
+        if segments[1:] == ['version']:
+            return 200, {'Content-Type': 'text/plain'}, '1.6.5'
+
+        if segments[1:] == ['search'] and method == 'POST':
+            return self._search(body, params)
+
+        with self._lock:
+            target = self._resolve(path)
+
+            if target is None:
+                return self._not_found(path)
+
+            parent, collection, ident = target
+            element = None if ident is None \
+                else self.find(parent, collection, ident)
+
+            if method in ['GET', 'HEAD']:
+                if ident is None:
+                    return self._list(parent, collection, params)
+                elif element is None:
+                    return self._not_found(path)
+                elif collection == 'files':
+                    return 200, {'Content-Type': 'application/octet-stream',
+                                 'Last-Modified': formatdate(
+                                     element.modified, usegmt=True)
+                                 }, element.content
+                else:
+                    return self._document(element)
+
+            if method == 'PUT':
+                if collection == 'files':
+                    return self._upload(parent, ident, params, headers,
+                                        body)
+                if ident is None:
+                    return self._not_found(path)
+
+                return self._put(parent, collection, ident, element, params)
+
+            if method == 'DELETE':
+                if element is None:
+                    return self._not_found(path)
+
+                self.remove(element)
+                return 200, {}, ''
+
+        return 405, {'Content-Type': 'text/plain'}, 'Method not allowed'
+
+    def _not_found(self, path):
+        body = ('<html><head><title>Status page</title></head><body>'
+                '<h3>The requested resource %s was not found</h3>'
+                '</body></html>' % path)
+
+        return 404, {'Content-Type': 'text/html'}, body
+
+    def _rows(self, elements, base, columns):
+        columns = base + [column for column in columns
+                          if column and column not in base]
+
+        return columns, [[element.get(column) for column in columns]
+                         for element in elements]
+
+    def _table(self, columns, rows, params):
+        if params.get('format') == 'json':
+            body = json.dumps({'ResultSet': {
+                'Result': [dict(zip(columns, row)) for row in rows],
+                'totalRecords': str(len(rows))}})
+
+            return 200, {'Content-Type': 'application/json'}, body
+
+        out = StringIO()
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+        return 200, {'Content-Type': 'text/csv'}, out.getvalue()
+
+    def _list(self, parent, collection, params):
+        elements = self.collection(parent, collection)
+
+        if params.get('format') == 'zip':
+            return self._zip([element for container in elements
+                              for element in container.walk()
+                              if element.collection == 'files'])
+
+        for key, value in params.items():
+            if key in _options and key != 'xsiType':
+                continue
+
+            patterns = value.split(',')
+            elements = [element for element in elements
+                        if any(fnmatch.fnmatch(element.get(key), pattern)
+                               for pattern in patterns)]
+
+        columns = params.get('columns', '').split(',')
+        columns, rows = self._rows(elements, _columns[collection], columns)
+
+        return self._table(columns, rows, params)
+
+    def _zip(self, files):
+        out = StringIO()
+        archive = zipfile.ZipFile(out, 'w')
+
+        for element in files:
+            archive.writestr(element.path.split('/data/', 1)[1],
+                             element.content)
+
+        archive.close()
+
+        return 200, {'Content-Type': 'application/zip'}, out.getvalue()
+
+    def _document(self, element):
+        datatype = element.get('xsiType') or _datatypes.get(
+            element.collection, 'xnat:element')
+        prefix, name = datatype.split(':')
+        tag = name[0].upper() + name[1:].replace('Data', '')
+
+        root = etree.Element('{http://nrg.wustl.edu/xnat}%s' % tag,
+                             nsmap={'xnat': 'http://nrg.wustl.edu/xnat'})
+
+        for key in ['ID', 'label', 'project']:
+            if element.get(key):
+                root.set(key, element.get(key))
+
+        for key, value in sorted(element.fields.items()):
+            if key.startswith(datatype + '/'):
+                node = root
+                for part in key.split('/')[1:]:
+                    node = etree.SubElement(
+                        node, '{http://nrg.wustl.edu/xnat}%s' % part)
+                node.text = value
+
+        body = etree.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+        return 200, {'Content-Type': 'text/xml'}, body
+
+    def _attributes(self, params):
+        return dict((key, value) for key, value in params.items()
+                    if key not in _options)
+
+    def _put(self, parent, collection, ident, element, params):
+        fields = self._attributes(params)
+        datatype = params.get('xsiType')
+
+        if element is None:
+            if datatype is not None:
+                fields['xsiType'] = datatype
+                fields['ID'] = fields.pop('%s/ID' % datatype,
+                                          fields.get('ID'))
+
+            element = self.add(parent, collection, ident, fields)
+        else:
+            element.fields.update(fields)
+            element.modified = time.time()
+
+        return 200, {'Content-Type': 'text/plain'}, element.ID
+
+    def _upload(self, resource, ident, params, headers, body):
+        content_type = headers.get('content-type', '')
+
+        if 'multipart/form-data' in content_type:
+            boundary = content_type.split('boundary=', 1)[1].strip('"')
+            part = body.split('--' + boundary)[1]
+            body = part.split('\r\n\r\n', 1)[1][:-len('\r\n')]
+
+        files = {ident: body}
+
+        if params.get('extract') == 'true' and ident.endswith('.zip'):
+            archive = zipfile.ZipFile(StringIO(body))
+            files = dict((name, archive.read(name))
+                         for name in archive.namelist()
+                         if not name.endswith('/'))
+
+        for name, content in files.items():
+            element = self.find(resource, 'files', name)
+
+            if element is None:
+                element = self.add(resource, 'files', name, content=content)
+            else:
+                self._set_content(element, content)
+
+            element.fields.update({
+                'file_format': params.get('format', ''),
+                'file_content': params.get('content', ''),
+                'file_tags': params.get('tags', '')})
+
+        return 200, {'Content-Type': 'text/plain'}, ''
+
+    def _search(self, body, params):
+        root = etree.fromstring(body)
+
+        datatype = root.find(_xdat + 'root_element_name').text
+        fields = [(node.find(_xdat + 'element_name').text,
+                   node.find(_xdat + 'field_ID').text)
+                  for node in root.findall(_xdat + 'search_field')]
+
+        where = root.find(_xdat + 'search_where')
+        elements = [element for element in self.root.walk()
+                    if element.get('xsiType') == datatype
+                    and self._match(element, where)]
+
+        def value(element, name, field):
+            if '%s/%s' % (name, field) in element.fields:
+                return element.fields['%s/%s' % (name, field)]
+
+            return element.get(_search_aliases.get(field.upper(), field))
+
+        columns = [field.lower() for name, field in fields]
+        rows = [[value(element, name, field) for name, field in fields]
+                for element in elements]
+
+        return self._table(columns, rows, params)
+
+    def _match(self, element, node):
+        if node is None:
+            return True
+
+        results = []
+
+        for child in node:
+            if child.tag == _xdat + 'criteria':
+                name, field = child.find(_xdat + 'schema_field'
+                                         ).text.split('/', 1)
+                op = child.find(_xdat + 'comparison_type').text.strip()
+                expected = child.find(_xdat + 'value').text or ''
+
+                value = element.fields.get('%s/%s' % (name, field))
+                if value is None:
+                    value = element.get(
+                        _search_aliases.get(field.upper(), field))
+
+                if op == 'LIKE':
+                    results.append(fnmatch.fnmatch(
+                        value.lower(), expected.replace('%', '*').lower()))
+                elif op in ['=', '!=']:
+                    results.append((value == expected) == (op == '='))
+                else:
+                    try:
+                        results.append(eval('%r %s %r' % (
+                            float(value), op, float(expected))))
+                    except ValueError:
+                        results.append(False)
+            elif child.tag == _xdat + 'child_set':
+                results.append(self._match(element, child))
+
+        if node.get('method', 'AND').upper() == 'OR':
+            return any(results)
+
+        return all(results)
+
+    # server
+
+    def start(self):
+        """ Starts serving in a background thread.
+        """
+        self._httpd = _Server(('127.0.0.1', 0), _Handler)
+        self._httpd.standin = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.url = 'http://127.0.0.1:%s' % self._httpd.server_address[1]
+
+        return self
+
+    def stop(self):
+        """ Stops the server.
+        """
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.close_connections()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # send each response in one write, unbuffered headers sent line by
+    # line stall keep-alive clients on delayed acknowledgements
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _serve(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        headers = dict((key.lower(), value)
+                       for key, value in self.headers.items())
+
+        try:
+            status, response_headers, content = self.server.standin.handle(
+                self.command, url.path, url.query, headers, body)
+        except Exception:
+            status, response_headers, content = \
+                500, {'Content-Type': 'text/plain'}, traceback.format_exc()
+
+        if self.command == 'GET' and \
+                self.server.standin.cache_control is not None:
+            response_headers['Cache-Control'] = \
+                self.server.standin.cache_control
+
+        if status == 200 and self.command in ['GET', 'HEAD']:
+            etag = '"%s"' % hashlib.md5(content).hexdigest()
+            response_headers['ETag'] = etag
+
+            if headers.get('if-none-match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            compressible = response_headers.get(
+                'Content-Type', '').startswith(('text/', 'application/json'))
+
+            if self.server.standin.compress and compressible and \
+                    len(content) > 512 and \
+                    'gzip' in headers.get('accept-encoding', ''):
+                out = StringIO()
+                archive = gzip.GzipFile(fileobj=out, mode='wb')
+                archive.write(content)
+                archive.close()
+                content = out.getvalue()
+                response_headers['Content-Encoding'] = 'gzip'
+
+        self.send_response(status)
+
+        for key, value in response_headers.items():
+            self.send_header(key, value)
+
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            truncate = self.server.standin.truncate
+
+            if truncate is not None:
+                content = content[:truncate]
+                self.close_connection = 1
+
+            self.wfile.write(content)
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args):
+        HTTPServer.__init__(self, *args)
+        self.connections = set()
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections.add(request)
+
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        with self._lock:
+            self.connections.discard(request)
+
+        HTTPServer.shutdown_request(self, request)
+
+    def close_connections(self, timeout=5):
+        """ Closes the keep-alive connections and waits for their
+            threads to exit.
+        """
+        with self._lock:
+            connections = list(self.connections)
+
+        for request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        deadline = time.time() + timeout
+
+        while self.connections and time.time() < deadline:
+            time.sleep(0.01)
+
+    def handle_error(self, request, client_address):
+        # errors of the stand-in are sent back as 500 responses, what is
+        # left are clients dropping their keep-alive connections
+        pass
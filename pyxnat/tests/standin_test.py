@@ -0,0 +1,387 @@
+import os
+import time
+import tempfile
+from httplib import IncompleteRead
+
+from .. import Interface
+from ..core.threadutil import WorkerPool
+from .server import XnatStandIn
+
+server = XnatStandIn(projects=2, subjects=3, experiments=2, scans=2,
+                     files=2, seed=1)
+
+
+def setup_module():
+    server.start()
+
+def teardown_module():
+    server.stop()
+
+def _interface(**kwargs):
+    return Interface(server.url, 'admin', 'admin',
+                     cachedir=tempfile.mkdtemp(), **kwargs)
+
+
+def test_listings():
+    central = _interface()
+
+    assert central.select.projects().get() == ['P0', 'P1']
+    assert len(central.select.project('P0').subjects().get()) == 3
+    assert len(list(central.select.projects().subjects()
+                    .experiments().scans())) == 24
+
+def test_prefetched_iteration():
+    serial = _interface()
+    prefetched = _interface(prefetch=4)
+
+    path = '/projects/*/subjects/*/experiments/*/scans/*'
+
+    assert [scan._uri for scan in prefetched.select(path)] == \
+        [scan._uri for scan in serial.select(path)]
+
+def test_credentials_stay_on_the_server():
+    central = _interface()
+    central.select.projects().get()
+    port = server.url.rsplit(':', 1)[1]
+
+    # the same server under another name is another host
+    server.redirects = {
+        '/data/here': '/data/projects',
+        '/data/away': 'http://localhost:%s/data/projects' % port,
+        }
+    try:
+        for path in ['/data/here', '/data/away']:
+            central._urlopen(server.url + path).read()
+    finally:
+        server.redirects = {}
+
+    here, away = [headers for (method, path), headers
+                  in zip(server.requests, server.request_headers)
+                  if path == '/data/projects'][-2:]
+
+    assert 'authorization' in here and 'cookie' in here
+    assert 'authorization' not in away and 'cookie' not in away
+
+def test_element_lifecycle():
+    central = _interface()
+    subject = central.select.project('P1').subject('standin_subject')
+
+    subject.create()
+    assert subject.exists()
+
+    subject.attrs.set('xnat:subjectData/gender', 'female')
+    assert subject.attrs.get('xnat:subjectData/gender') == 'female'
+
+    subject.delete()
+    assert not subject.exists()
+
+def test_file_roundtrip():
+    central = _interface()
+    resource = central.select.project('P0').subject('P0_S0'
+                                                    ).resource('standin')
+    resource.create()
+
+    src = os.path.join(tempfile.mkdtemp(), 'hello.txt')
+    open(src, 'wb').write('hello xnat\n' * 100)
+
+    resource.file('hello.txt').put(src)
+
+    assert resource.files().get() == ['hello.txt']
+    assert open(resource.file('hello.txt').get()).read() == \
+        'hello xnat\n' * 100
+
+    resource.delete()
+
+def test_search():
+    central = _interface()
+    table = central.select('xnat:subjectData',
+                           ['xnat:subjectData/PROJECT',
+                            'xnat:subjectData/SUBJECT_ID']
+                           ).where([('xnat:subjectData/PROJECT', '=', 'P0'),
+                                    'AND'])
+
+    assert len(table) == 3
+    assert set(table.get('project')) == set(['P0'])
+
+def test_revalidation():
+    central = _interface()
+
+    central.select.projects().get()
+    central.select.projects().get()
+
+    sources = [record.source for record in central.stats
+               if record.pattern.startswith('/data/projects')]
+
+    assert sources == ['network', 'memcache']
+
+def test_conditional_requests():
+    central = _interface()
+    path = '/data/projects/P0/subjects/P0_S0/experiments/P0_S0_E0/scans/1' \
+        '/resources/DICOM/files/1.dcm'
+
+    central.select.projects().get()
+    content = open(central._get_file(path)).read()
+
+    central._memcache.clear()
+    central.select.projects().get()
+    assert open(central._get_file(path)).read() == content
+
+    records = [record for record in central.stats
+               if record.pattern.startswith('/data/projects')][-2:]
+
+    assert [(record.status, record.source, record.wire_bytes)
+            for record in records] == [(304, 'disk', 0)] * 2
+    assert all(record.bytes_in > 0 for record in records)
+
+def test_parsed_listings_in_memory():
+    central = _interface()
+    central._memtimeout = 60
+    subject = central.select.project('P0').subject('P0_S1')
+
+    requests = len(server.requests)
+    for _ in range(10):
+        assert subject.exists()
+        assert subject.label() == 'P0_S1'
+
+    assert len(server.requests) - requests == 1
+
+    # the lookups share the cached rows and their indexes
+    uri = '/data/projects/P0/subjects'
+    assert central._get_rows(uri) is central._get_rows(uri)
+    assert central._get_table(uri) is central._get_table(uri)
+    assert central._get_table(uri).data is central._get_rows(uri)
+
+    # the rows handed out are copies
+    central._get_json('/data/projects')[0]['ID'] = 'changed'
+    assert central._get_json('/data/projects')[0]['ID'] == 'P0'
+
+def test_writes_invalidate_their_scope():
+    central = _interface()
+    central._memtimeout = 60
+    subjects = [central.select.project(project).subjects()
+                for project in ['P0', 'P1']]
+    search = central.select('xnat:subjectData',
+                            ['xnat:subjectData/SUBJECT_ID'])
+    constraints = [('xnat:subjectData/PROJECT', '=', 'P1'), 'AND']
+
+    assert [len(collection.get()) for collection in subjects] == [3, 3]
+    assert len(search.where(constraints)) == 3
+
+    subject = central.select.project('P1').subject('scoped')
+    subject.create()
+
+    requests = len(server.requests)
+    assert [len(collection.get()) for collection in subjects] == [3, 4]
+    assert len(search.where(constraints)) == 4
+
+    # only the listing of the modified project and the search are fetched
+    assert len(server.requests) - requests == 2
+
+    subject.delete()
+    assert len(subjects[1].get()) == 3
+
+def test_unstored_listings_are_parsed():
+    central = _interface()
+    uri = server.url + '/data/projects?format=csv'
+
+    assert [row['ID'] for row in central._get_json('/data/projects')] == \
+        ['P0', 'P1']
+
+    project = server.add(server.root, 'projects', 'P2')
+    server.cache_control = 'no-store'
+    try:
+        central._memcache.clear()
+        rows = central._get_json('/data/projects')
+    finally:
+        server.cache_control = None
+        server.remove(project)
+
+    # neither the rows nor the content of the previous response are used
+    assert [row['ID'] for row in rows] == ['P0', 'P1', 'P2']
+    assert central._http.cache.version(uri) is None
+    assert central._http.cache.get_rows(uri) is None
+
+def test_project_listings_are_invalidated():
+    central = _interface()
+    central._memtimeout = 60
+    project = central.select.project('P1')
+    experiments = project.experiments().get()
+
+    experiment = project.subject('P1_S0').experiment('project_wide')
+    experiment.create()
+    try:
+        assert len(project.experiments().get()) == len(experiments) + 1
+    finally:
+        experiment.delete()
+
+    assert project.experiments().get() == experiments
+
+def test_offline_listings_are_not_parsed_again():
+    cachedir = tempfile.mkdtemp()
+    online = Interface(server.url, 'admin', 'admin', cachedir=cachedir)
+    subjects = online.select.project('P0').subjects().get('obj')
+
+    offline = Interface(server.url, 'admin', 'admin', cachedir=cachedir)
+    offline.cache.set_usage('offline')
+
+    requests = len(server.requests)
+    assert [subject._uri for subject in
+            offline.select.project('P0').subjects().get('obj')] == \
+        [subject._uri for subject in subjects]
+    assert len(server.requests) == requests
+    assert [record.source for record in offline.stats
+            if record.pattern.endswith('subjects?columns&format')] == ['disk']
+
+def test_prefetch_for_offline_use():
+    cachedir = tempfile.mkdtemp()
+    online = Interface(server.url, 'admin', 'admin', cachedir=cachedir)
+
+    assert online.cache.prefetch('P1', depth=1) == \
+        {'listings': 2, 'xml': 0, 'files': 0}
+    assert online.cache.prefetch('/projects/P0', include_files=True,
+                                 include_xml=True, workers=4) == \
+        {'listings': 56, 'xml': 22, 'files': 24}
+
+    offline = Interface(server.url, 'admin', 'admin', cachedir=cachedir)
+    offline.cache.set_usage('offline')
+
+    for f in offline.select('/projects/P0/subjects/*/experiments/*/scans/*'
+                            '/resources/*/files/*'):
+        assert os.path.exists(f.get())
+
+    for experiment in offline.select('/projects/P0/subjects/*'
+                                     '/experiments/*'):
+        experiment.get()
+
+    assert [record.uri for record in offline.stats
+            if record.source == 'network'] == []
+
+def test_ttl_policies():
+    central = _interface()
+    central.cache.set_usage('online', 0.05)
+    central.cache.set_ttl('subjects', 60)
+
+    project = central.select.project('P0')
+    central.select.projects().get()
+    project.subjects().get()
+    project.resources().get()
+    time.sleep(0.1)
+
+    requests = len(server.requests)
+    project.subjects().get()
+    central.select.projects().get()
+    assert len(server.requests) == requests
+
+    project.resources().get()
+    assert len(server.requests) == requests + 1
+
+def test_streamed_listings():
+    central = _interface()
+    uri = '/data/experiments?columns=ID,URI'
+
+    assert list(central._iter_json(uri)) == central._get_json(uri)
+    assert [record.source for record in central.stats
+            if '/experiments' in record.uri] == ['network', 'memcache']
+
+    # rows that do not fit in the memory cache are not kept
+    central = _interface()
+    central._memcache.maxsize = 100
+    assert list(central._iter_json(uri)) == central._get_json(uri)
+    assert [record.source for record in central.stats
+            if '/experiments' in record.uri] == ['network', 'disk']
+
+def test_abandoned_stream():
+    central = _interface()
+    rows = central._iter_json('/data/subjects')
+
+    next(rows)
+    rows.close()
+
+    assert central._http.cache.version(
+        server.url + '/data/subjects?format=csv') is None
+    assert not [name for _, _, names in os.walk(central._cachedir)
+                for name in names if name.endswith('.tmp')]
+    assert len(central._get_json('/data/subjects')) == 6
+
+def test_broken_stream():
+    central = _interface()
+    central.select.projects().get()
+    experiments = []
+
+    server.truncate = 200
+    try:
+        for experiment in central.select.experiments():
+            experiments.append(experiment)
+    except IncompleteRead:
+        pass
+    else:
+        assert False, 'a truncated listing must raise an error'
+    finally:
+        server.truncate = None
+
+    assert 0 < len(experiments) < 12
+    assert len(central.select.experiments().get()) == 12
+
+def test_lookups_share_an_indexed_table():
+    central = _interface()
+    central._memtimeout = 60
+    subjects = central.select.project('P0').subjects().get('obj')
+
+    requests = len(server.requests)
+    genders = [subject.attrs.get('xnat:subjectData/gender')
+               for subject in subjects]
+
+    # the listing of the IDs and the listing of the attribute
+    assert len(genders) == 3
+    assert len(server.requests) == requests + 2
+
+    table = central._get_table('/data/projects/P0/subjects'
+                               '?columns=ID,xnat:subjectData/gender')
+    assert 'ID' in table._indexes
+
+def test_concurrent_fetches_collapse():
+    cachedir = tempfile.mkdtemp()
+    path = '/data/projects/P0/subjects/P0_S0/experiments/P0_S0_E0/scans/1' \
+        '/resources/DICOM/files/0.dcm'
+    interfaces = [Interface(server.url, 'admin', 'admin', cachedir=cachedir)
+                  for _ in range(4)]
+
+    server.latency = 0.2
+    try:
+        pool = WorkerPool(4)
+        locations = pool.map(lambda interface: interface._get_file(path),
+                             interfaces)
+        pool.shutdown()
+    finally:
+        server.latency = 0.0
+
+    assert len(set(locations)) == 1
+    assert [request for request in server.requests
+            if request == ('GET', path)] == [('GET', path)]
+
+def test_shared_files_are_downloaded_once():
+    central = _interface()
+    experiment = central.select.project('P1').subject('P1_S0'
+                                                      ).experiment('P1_S0_E0')
+    content = 'shared\n' * 100
+    src = os.path.join(tempfile.mkdtemp(), 'shared.txt')
+    open(src, 'wb').write(content)
+
+    resources = [experiment.resource('shared%s' % i) for i in range(2)]
+    for resource in resources:
+        resource.create()
+        resource.file('shared.txt').put(src)
+
+    # the same file through the project and the experiment paths
+    paths = [resources[0].file('shared.txt').get(),
+             central.select.experiment(experiment.id())
+             .resource('shared0').file('shared.txt').get(),
+             resources[1].file('shared.txt').get()]
+
+    assert [open(path).read() for path in paths] == [content] * 3
+    assert len([request for request in server.requests
+                if request[0] == 'GET'
+                and request[1].endswith('/files/shared.txt')]) == 1
+
+    for resource in resources:
+        resource.delete()
@@ -0,0 +1,54 @@
+from ..core.stats import RequestStats, MEMCACHE, NETWORK
+
+
+def test_records_and_hooks():
+    stats = RequestStats()
+    seen = []
+    stats.add_hook(seen.append)
+
+    record = stats.record('GET', 'http://host/data/projects/P1?format=csv',
+                          200, 0.5, bytes_in=100, wire_bytes=20)
+
+    assert seen == [record]
+    assert record.pattern == '/data/projects/*?format'
+    assert record.source == NETWORK
+    assert stats.records() == [record]
+
+    stats.remove_hook(seen.append)
+    stats.record('GET', 'http://host/data/projects', 200, 0.1)
+
+    assert len(seen) == 1
+    assert len(stats) == 2
+
+def test_summary_groups_by_pattern():
+    stats = RequestStats()
+
+    for ID, source in [('P1', NETWORK), ('P2', NETWORK), ('P1', MEMCACHE)]:
+        stats.record('GET', 'http://host/data/projects/%s/subjects' % ID,
+                     200, 0.25, bytes_in=10, source=source)
+    stats.record('PUT', 'http://host/data/projects/P1', 200, 1.0,
+                 bytes_out=5)
+
+    summary = stats.summary()
+    listing = summary[('GET', '/data/projects/*/subjects')]
+
+    assert listing['count'] == 3
+    assert listing['latency'] == 0.75
+    assert listing['bytes_in'] == 30
+    assert listing[NETWORK] == 2 and listing[MEMCACHE] == 1
+    assert summary[('PUT', '/data/projects/*')]['bytes_out'] == 5
+    assert stats.summary(key=('source', ))[(NETWORK, )]['count'] == 3
+
+def test_maxlen_and_disable():
+    stats = RequestStats(maxlen=2)
+
+    for i in range(5):
+        stats.record('GET', 'http://host/data/projects/%s' % i, 200, 0.1)
+
+    assert [r.uri[-1] for r in stats] == ['3', '4']
+
+    stats.enabled = False
+    stats.record('GET', 'http://host/data/projects', 200, 0.1)
+    stats.clear()
+
+    assert len(stats) == 0
@@ -0,0 +1,66 @@
+import time
+import threading
+
+from ..core.threadutil import WorkerPool, Timeout, wait, as_completed
+
+
+def _slow(value, delay=0.02):
+    time.sleep(delay)
+    return value
+
+def test_submit_returns_results():
+    with WorkerPool(4) as pool:
+        futures = [pool.submit(_slow, i) for i in range(10)]
+
+        assert wait(futures) == list(range(10))
+        assert all(future.done() for future in futures)
+
+def test_exceptions_are_raised_by_result():
+    with WorkerPool(2) as pool:
+        future = pool.submit(int, 'not a number')
+
+        assert isinstance(future.exception(), ValueError)
+
+        try:
+            future.result()
+        except ValueError:
+            pass
+        else:
+            assert False
+
+def test_result_timeout():
+    with WorkerPool(1) as pool:
+        future = pool.submit(_slow, 1, 0.5)
+
+        try:
+            future.result(0.01)
+        except Timeout:
+            pass
+        else:
+            assert False
+
+def test_imap_is_ordered_and_bounded():
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01 * (i % 3))
+        with lock:
+            running[0] -= 1
+        return i
+
+    with WorkerPool(8) as pool:
+        assert list(pool.imap(work, range(40), window=3)) == list(range(40))
+
+    assert running[1] <= 3
+
+def test_as_completed_yields_all_futures():
+    with WorkerPool(5) as pool:
+        futures = [pool.submit(_slow, i, 0.1 - i * 0.02) for i in range(5)]
+        completed = list(as_completed(futures))
+
+    assert sorted(f.result() for f in completed) == list(range(5))
+    assert completed[0].result() == 4
@@ -1,3 +1,4 @@
+import re
 from .. import uriutil
 
 def test_translate_uri():
@@ -30,3 +31,48 @@ def test_uri_grandparent():
 def test_uri_split():
     assert uriutil.uri_split('/projects/1/subjects/2') == ['/projects/1/subjects', '2']
 
+
+def test_uri_pattern():
+    assert uriutil.uri_pattern('http://localhost:8080/xnat/data/projects/P1/subjects?format=csv&columns=ID') == '/xnat/data/projects/*/subjects?columns&format'
+    assert uriutil.uri_pattern('/data/experiments/E1/resources/R/files/a/b.nii') == '/data/experiments/*/resources/*/files/*'
+    assert uriutil.uri_pattern('/data/projects') == '/data/projects'
+
+def test_uri_scope():
+    scope = re.compile(uriutil.uri_scope(
+        'http://localhost/data/projects/P1/subjects/S1?gender=male'))
+    stale = ['/data/projects/P1/subjects/S1',
+             '/data/projects/P1/subjects/S1/experiments',
+             '/data/projects/P1/subjects',
+             '/data/projects/P1',
+             '/data/subjects',
+             '/data/subjects/S1/experiments/E1',
+             ]
+    warm = ['/data/projects',
+            '/data/projects/P2/subjects',
+            '/data/projects/P1/subjects/S10',
+            '/data/projects/P1/resources',
+            ]
+
+    assert [bool(scope.match(path)) for path in stale + warm] == \
+        [True] * len(stale) + [False] * len(warm)
+
+    scope = re.compile(uriutil.uri_scope('/data/experiments/E1'))
+
+    assert scope.match('/data/projects/P1/subjects/S1/experiments')
+    assert scope.match('/data/projects/P1/subjects/S1/experiments/E1/scans')
+    assert not scope.match('/data/projects/P1/subjects/S1')
+
+    # the listings at the project level
+    scope = re.compile(uriutil.uri_scope(
+        'http://localhost/data/projects/P1/subjects/S1/experiments/E1'))
+
+    assert scope.match('/data/projects/P1/experiments')
+    assert scope.match('/data/projects/P1/scans')
+    assert scope.match('/data/projects/P1/assessors')
+    assert not scope.match('/data/projects/P2/experiments')
+    assert not scope.match('/data/projects/P1/subjects/S2/experiments')
+
+    scope = re.compile(uriutil.uri_scope('/data/experiments/E1'))
+
+    assert scope.match('/data/projects/P2/experiments')
+    assert not scope.match('/data/projects/P2/subjects')